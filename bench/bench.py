@@ -0,0 +1,359 @@
+"""Benchmark harness for the apps in this repo.
+
+Each app is started as a local subprocess through its serve.py launcher, driven
+by the closed-loop load generator in loadgen.py, and measured for throughput,
+latency percentiles, RSS and CPU. Results are written as JSON and can be
+compared against a stored baseline; any regression beyond the tolerance makes
+the command exit non-zero.
+
+    python bench/bench.py run -o results.json                 # everything
+    python bench/bench.py run -s 'day5-*' -c 32 -d 20         # a subset
+    python bench/bench.py run --baseline bench/baseline.json  # run and compare
+    python bench/bench.py compare results.json bench/baseline.json
+
+To compare the day5 stacks roughly as a 0.5-CPU replica runs them, keep the
+server on one core with one worker and raise the client concurrency:
+
+    python bench/bench.py run -s 'day5*-product*' -c 256 --workers 1 --server-cpus 0
+
+day2 needs Postgres. Unless BENCH_DB_HOST (and BENCH_DB_PORT, BENCH_DB_PASSWORD)
+point at one, the db service of day2/docker-compose.yml is started for the run and
+removed afterwards; without Docker the day2 scenarios fail rather than measure an
+app that isn't ready.
+"""
+import argparse
+import fnmatch
+import http.client
+import itertools
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from loadgen import get, post_form, post_file, run_load, process_tree, rss_bytes, cpu_seconds
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BLOG_POSTS = int(os.environ.get('BENCH_BLOG_POSTS', 10_000))
+BLOG_SEED = '''
+import sys
+from sqlmodel import Session
+from models import BlogPost, create_db_and_tables, engine
+engine.echo = False
+create_db_and_tables()
+content = "<p>" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8 + "</p>"
+with Session(engine) as session:
+    session.add_all(
+        BlogPost(title=f"Benchmark post {i}", content=content, is_published=i % 3 != 0)
+        for i in range(int(sys.argv[1]))
+    )
+    session.commit()
+'''
+
+
+def seed_blog(workdir, env):
+    subprocess.run([sys.executable, '-c', BLOG_SEED, str(BLOG_POSTS)], cwd=workdir, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def compose_postgres(workdir, env, timeout=60):
+    """Start day2's compose db service unless BENCH_DB_HOST names a server; returns the cleanup"""
+    if os.environ.get('BENCH_DB_HOST'):
+        return None
+    if shutil.which('docker') is None:
+        raise RuntimeError('day2 needs Postgres: set BENCH_DB_HOST, or install Docker to run '
+                           'the db service of day2/docker-compose.yml')
+    compose = ['docker', 'compose', '-f', os.path.join(workdir, 'docker-compose.yml'), '-p', f'bench-{RUN_ID}']
+    quiet = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+
+    def down():
+        subprocess.run([*compose, 'down', '-v'], **quiet)
+
+    subprocess.run([*compose, 'up', '-d', 'db'], check=True, stdout=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while subprocess.run([*compose, 'exec', '-T', 'db', 'pg_isready', '-U', 'user', '-d', 'mydb'], **quiet).returncode:
+        if time.time() > deadline:
+            down()
+            raise RuntimeError(f'Postgres from day2/docker-compose.yml not ready after {timeout}s')
+        time.sleep(0.5)
+    return down
+
+
+# How to start each app. `copy` runs the app from a scratch copy of its directory so
+# seeded databases and uploads never touch the checked-in files. `setup` runs before
+# the server starts; if it returns a callable, that runs after the server stops.
+APPS = {
+    'day1': {'dir': 'day1', 'target': 'app:app', 'ready': '/'},
+    'day10': {'dir': 'day10', 'target': 'app:app', 'ready': '/'},
+    'day2': {'dir': 'day2', 'target': 'app:app', 'ready': '/readyz', 'setup': compose_postgres,
+             'env': {'DB_HOST': os.environ.get('BENCH_DB_HOST', '127.0.0.1'),
+                     'DB_PORT': os.environ.get('BENCH_DB_PORT', '5432'),
+                     'DB_PASSWORD': os.environ.get('BENCH_DB_PASSWORD', 'password'),
+                     'DB_CONNECT_TIMEOUT': '1',
+                     # Postgres may still be restarting after its first init; retry soon
+                     'PROBE_INTERVAL': '1', 'PROBE_MAX_BACKOFF': '2'}},
+    'day5': {'dir': 'day5', 'target': 'app:app', 'ready': '/readyz'},
+    'day5-asgi': {'dir': 'day5', 'target': 'asgi:app', 'kind': 'asgi', 'ready': '/readyz'},
+    'blog': {'dir': 'blog/blog_app', 'target': 'app:app', 'kind': 'asgi', 'ready': '/readyz',
+             'copy': True, 'setup': seed_blog},
+}
+
+# Registered emails are unique, across runs too, since day1 keeps its database
+RUN_ID = uuid.uuid4().hex[:8]
+SUBMISSIONS = itertools.count()
+SAMPLE_JPEG = bytes.fromhex('ffd8ffe000104a46494600010100000100010000ffd9') + b'\0' * 20_000
+
+SCENARIOS = [
+    {'name': 'day1-form', 'app': 'day1', 'request': get('/')},
+    {'name': 'day1-submit', 'app': 'day1',
+     'request': post_form('/submit', {'username': 'bench', 'email': lambda n: f'bench-{RUN_ID}-{next(SUBMISSIONS)}@example.com',
+                                      'age': '30'})},
+    {'name': 'day2-livez', 'app': 'day2', 'request': get('/livez')},
+    {'name': 'day2-readyz', 'app': 'day2', 'request': get('/readyz')},
+    # The Flask (WSGI) and FastAPI (ASGI) stacks of day5 run the same scenarios
+    *[{'name': f'{app}-products-{n}', 'app': app, 'request': get(f'/products/?count={n}')}
+      for app in ('day5', 'day5-asgi') for n in (10, 100, 1000)],
+    *[{'name': f'{app}-product', 'app': app, 'request': get(lambda n: f'/products/bench-{n % 1000}')}
+      for app in ('day5', 'day5-asgi')],
+    *[{'name': f'{app}-categories', 'app': app, 'request': get('/categories/')}
+      for app in ('day5', 'day5-asgi')],
+    {'name': 'blog-index-10k', 'app': 'blog', 'request': get('/')},
+    {'name': 'blog-chart-data', 'app': 'blog', 'request': get('/chart-data')},
+    {'name': 'blog-upload', 'app': 'blog',
+     'request': post_file('/upload', 'file', 'bench.jpg', SAMPLE_JPEG, 'image/jpeg')},
+]
+
+# Metrics compared against the baseline: (path, direction); "higher" means bigger is better
+COMPARED = [
+    (('throughput_rps',), 'higher'),
+    (('latency_ms', 'p50'), 'lower'),
+    (('latency_ms', 'p95'), 'lower'),
+    (('latency_ms', 'p99'), 'lower'),
+    (('rss_mb',), 'lower'),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, path, proc, timeout=60):
+    """Poll path until it answers below 500; returns when the server first answered at all"""
+    deadline = time.time() + timeout
+    answered = None
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'server exited with code {proc.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', path)
+            status = conn.getresponse().status
+            answered = answered or time.perf_counter()
+            if status < 500:
+                return answered
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f'server not ready after {timeout}s')
+
+
+class Server:
+    """An app started through serve.py on a free local port"""
+
+    def __init__(self, name, workers=None, log_dir=None, cpus=None):
+        self.name = name
+        self.spec = APPS[name]
+        self.workers = workers
+        self.cpus = cpus
+        self.log_dir = log_dir or tempfile.gettempdir()
+        self.scratch = None
+        self.cleanup = None
+
+    def __enter__(self):
+        spec = self.spec
+        workdir = os.path.join(ROOT, spec['dir'])
+        if spec.get('copy'):
+            self.scratch = tempfile.mkdtemp(prefix=f'bench-{self.name}-')
+            workdir = os.path.join(self.scratch, 'app')
+            shutil.copytree(os.path.join(ROOT, spec['dir']), workdir,
+                            ignore=shutil.ignore_patterns('*.db', '__pycache__'))
+        self.port = free_port()
+        env = {**os.environ, **spec.get('env', {}), 'PORT': str(self.port), 'PYTHONUNBUFFERED': '1'}
+        env.pop('DEV_SERVER', None)
+        # Measure raw capacity; set these explicitly to benchmark shedding instead
+        env.setdefault('RATE_LIMITS', '')
+        env.setdefault('CONCURRENCY_LIMIT', '0')
+        if self.workers:
+            env['WEB_CONCURRENCY'] = str(self.workers)
+        if spec.get('setup'):
+            self.cleanup = spec['setup'](workdir, env)
+        self.log = open(os.path.join(self.log_dir, f'bench-{self.name}.log'), 'w')
+        cmd = [sys.executable, 'serve.py', spec['target'], spec.get('kind', 'wsgi')]
+        self.started = time.perf_counter()
+        # Pinning happens before exec, so serve.py sizes its workers to these CPUs
+        pin = (lambda: os.sched_setaffinity(0, self.cpus)) if self.cpus else None
+        self.proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+                                     preexec_fn=pin)
+        try:
+            answered = wait_ready(self.port, spec['ready'], self.proc)
+        except RuntimeError:
+            self.__exit__(None, None, None)
+            raise
+        # Listening (e.g. /livez answers) and ready can differ while the app warms up
+        self.listen_s = answered - self.started
+        self.startup_s = time.perf_counter() - self.started
+        return self
+
+    def __exit__(self, *exc):
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGTERM)
+            try:
+                self.proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self.log.close()
+        if self.cleanup:
+            self.cleanup()
+        if self.scratch:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+    def stats(self):
+        pids = process_tree(self.proc.pid)
+        return rss_bytes(pids), cpu_seconds(pids)
+
+
+def run_scenario(server, scenario, concurrency, duration, warmup):
+    request = scenario['request']
+    if warmup:
+        run_load('127.0.0.1', server.port, request, concurrency, warmup)
+    _, cpu_before = server.stats()
+    result = run_load('127.0.0.1', server.port, request, concurrency, duration)
+    rss, cpu_after = server.stats()
+    result['rss_mb'] = round(rss / 2 ** 20, 1)
+    result['cpu_percent'] = round((cpu_after - cpu_before) / result['elapsed_s'] * 100, 1)
+    result['concurrency'] = concurrency
+    return result
+
+
+def run(args):
+    selected = [s for s in SCENARIOS if any(fnmatch.fnmatch(s['name'], p) for p in args.scenarios)]
+    if not selected:
+        sys.exit(f'no scenarios match {args.scenarios}')
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'server_cpus': sorted(args.server_cpus) if args.server_cpus else None,
+        },
+        'startup_s': {},
+        'results': {},
+    }
+    # Group by app so each server is started once
+    for app in dict.fromkeys(s['app'] for s in selected):
+        print(f'starting {app} ...', file=sys.stderr)
+        with Server(app, workers=args.workers, cpus=args.server_cpus) as server:
+            report['startup_s'][app] = round(server.startup_s, 3)
+            for scenario in (s for s in selected if s['app'] == app):
+                result = run_scenario(server, scenario, args.concurrency, args.duration, args.warmup)
+                report['results'][scenario['name']] = result
+                print(f"  {scenario['name']:<22} {result['throughput_rps']:>9.1f} rps  "
+                      f"p50 {result['latency_ms']['p50']} ms  p99 {result['latency_ms']['p99']} ms  "
+                      f"rss {result['rss_mb']} MB  errors {result['errors']}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(text + '\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            return compare(report, json.load(f), args.tolerance)
+    return 0
+
+
+def metric(result, path):
+    for key in path:
+        result = (result or {}).get(key)
+    return result
+
+
+def compare(current, baseline, tolerance):
+    """Print a comparison table; return 1 if any metric regressed beyond tolerance"""
+    regressions = 0
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            print(f'{name:<22} (no baseline)')
+            continue
+        if result['errors'] > base.get('errors', 0):
+            print(f"{name:<22} errors {base.get('errors', 0)} -> {result['errors']}  REGRESSION")
+            regressions += 1
+        for path, direction in COMPARED:
+            new, old = metric(result, path), metric(base, path)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if direction == 'higher' else change > tolerance
+            regressions += worse
+            print(f"{name:<22} {'.'.join(path):<16} {old:>10} -> {new:<10} {change:+7.1%}"
+                  f"{'  REGRESSION' if worse else ''}")
+    print(f'{regressions} regression(s) at {tolerance:.0%} tolerance')
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='run scenarios and write a JSON report')
+    run_parser.add_argument('-s', '--scenarios', nargs='+', default=['*'], help='glob(s) of scenario names')
+    run_parser.add_argument('-c', '--concurrency', type=int, default=16)
+    run_parser.add_argument('-d', '--duration', type=float, default=10.0, help='seconds per scenario')
+    run_parser.add_argument('-w', '--warmup', type=float, default=2.0, help='warmup seconds per scenario')
+    run_parser.add_argument('--workers', type=int, help='override the autotuned worker count')
+    run_parser.add_argument('--server-cpus', type=lambda v: {int(c) for c in v.split(',')},
+                            help='comma-separated CPUs to pin the servers to')
+    run_parser.add_argument('-o', '--output', help='write the report here instead of stdout')
+    run_parser.add_argument('--baseline', help='compare against this report and fail on regressions')
+    run_parser.add_argument('--save-baseline', help='also write the report to this baseline path')
+    run_parser.add_argument('--tolerance', type=float, default=0.15)
+
+    compare_parser = sub.add_parser('compare', help='compare two reports')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--tolerance', type=float, default=0.15)
+
+    sub.add_parser('list', help='list scenario names')
+
+    args = parser.parse_args(argv)
+    if args.command == 'list':
+        for s in SCENARIOS:
+            print(f"{s['name']:<22} {s['app']}")
+        return 0
+    if args.command == 'compare':
+        with open(args.current) as f, open(args.baseline) as g:
+            return compare(json.load(f), json.load(g), args.tolerance)
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Closed-loop HTTP load generator and /proc based process stats."""
+import http.client
+import os
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote_plus
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+class Request:
+    """One request template; `path` and `body` may be callables taking the request number"""
+
+    def __init__(self, method, path, body=None, headers=None, expect=(200,)):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers or {}
+        self.expect = expect
+
+    def target(self, n):
+        return self.path(n) if callable(self.path) else self.path
+
+    def payload(self, n):
+        return self.body(n) if callable(self.body) else self.body
+
+
+def get(path, **kwargs):
+    return Request('GET', path, **kwargs)
+
+
+def post_form(path, fields, **kwargs):
+    """Field values may be callables taking the request number, e.g. for unique emails"""
+    def encode(n=None):
+        return '&'.join(f'{k}={quote_plus(v(n) if callable(v) else v)}' for k, v in fields.items()).encode()
+    body = encode if any(callable(v) for v in fields.values()) else encode()
+    headers = {'Content-Type': 'application/x-www-form-urlencoded', **kwargs.pop('headers', {})}
+    return Request('POST', path, body=body, headers=headers, **kwargs)
+
+
+def post_file(path, field, filename, content, content_type='application/octet-stream', **kwargs):
+    boundary = 'benchboundary7MA4YWxkTrZu0gW'
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    headers = {'Content-Type': f'multipart/form-data; boundary={boundary}', **kwargs.pop('headers', {})}
+    return Request('POST', path, body=body, headers=headers, **kwargs)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def send(conn, request, n):
+    conn.request(request.method, request.target(n), body=request.payload(n), headers=request.headers)
+    response = conn.getresponse()
+    response.read()
+    return response
+
+
+def run_load(host, port, request, concurrency=8, duration=10.0, timeout=30.0):
+    """Hammer one endpoint from `concurrency` keep-alive clients for `duration` seconds"""
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+    lock = threading.Lock()
+    counter = iter(range(1 << 62))
+    reconnects = Counter()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        local_latencies, local_statuses, local_errors = [], Counter(), Counter()
+        local_reconnects = 0
+        while time.perf_counter() < deadline:
+            with lock:
+                n = next(counter)
+            started = time.perf_counter()
+            try:
+                response = send(conn, request, n)
+            except (ConnectionResetError, http.client.RemoteDisconnected):
+                # The server closed an idle keep-alive connection (e.g. a recycled
+                # worker); that's not a failed request, so retry once on a new one
+                conn.close()
+                local_reconnects += 1
+                started = time.perf_counter()
+                try:
+                    response = send(conn, request, n)
+                except (OSError, http.client.HTTPException) as e:
+                    local_errors[type(e).__name__] += 1
+                    conn.close()
+                    continue
+            except (OSError, http.client.HTTPException) as e:
+                local_errors[type(e).__name__] += 1
+                conn.close()
+                continue
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses[response.status] += 1
+            if response.status not in request.expect:
+                local_errors[f'status_{response.status}'] += 1
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+            errors.update(local_errors)
+            reconnects['total'] += local_reconnects
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors.values()),
+        'reconnects': reconnects['total'],
+        'error_kinds': dict(errors),
+        'status_counts': {str(k): v for k, v in statuses.items()},
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+# Process stats (Linux /proc); a server is the launcher pid plus all its workers
+def process_tree(pid):
+    pids, queue = [], [pid]
+    while queue:
+        current = queue.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    queue.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def rss_bytes(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            pass
+    return total
+
+
+def cpu_seconds(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # Fields after the ")" of the command name; utime and stime are 14 and 15
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            pass
+    return total / CLOCK_TICKS
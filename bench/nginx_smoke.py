@@ -0,0 +1,243 @@
+"""Docker-free smoke test for the shipped nginx configs.
+
+Each config is rewritten for a local run: upstream hosts point at the app started
+through bench.Server, TLS uses a throwaway self-signed certificate, and the
+cache, log and pid paths move into a temp dir. The config is then checked with
+`nginx -t`, started, and probed:
+- HTTP/2 must be negotiated over ALPN.
+- Cached routes must go MISS -> HIT.
+- Microcached routes must also expire again after a second.
+- Bypassed requests and plain routes must not be served from cache.
+- Upload routes must accept a body larger than nginx's 1m default.
+Finally a burst against the first cached route reports the hit ratio and the
+latency of cache hits next to the same request sent straight to the app.
+
+    python bench/nginx_smoke.py                      # every config
+    python bench/nginx_smoke.py blog                 # one of them
+    python bench/nginx_smoke.py --validate-only      # nginx -t only, no apps
+
+Needs an nginx binary (--nginx, default from PATH) and openssl.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Keep the blog seed small; the smoke test is about nginx, not the app
+os.environ.setdefault('BENCH_BLOG_POSTS', '200')
+
+from bench import ROOT, Server, free_port
+
+CONFIGS = {
+    'day5': {
+        'conf': 'day5/nginx.conf', 'app': 'day5', 'upstream': 'api:8001',
+        'cached': ['/categories/', '/products/smoke-1'],
+        'uncached': ['/products/?count=10', '/health'],
+    },
+    'day10': {
+        'conf': 'day10/nginx.conf', 'app': 'day10', 'upstream': 'web:5001',
+        'micro': ['/'],
+    },
+    'blog': {
+        'conf': 'blog/nginx.conf', 'app': 'blog', 'upstream': 'blog:8000',
+        'micro': ['/', '/chart-data'],
+        'bypass': [('/', {'Cookie': 'db_primary_until=9999999999'})],
+        'uncached': ['/metrics'],
+        # The app rejects these bodies (not an image, not signed in); nginx must not answer 413 first
+        'large_body': ['/upload', '/admin/posts'],
+    },
+}
+TLS_PATHS = ('/run/secrets/ssl_cert', '/etc/nginx/certs/server.crt', '/etc/nginx/certs/server.key')
+BURST = 200
+LARGE_BODY = 2 * 1024 * 1024
+
+
+def make_cert(tmp):
+    key, crt, pem = (os.path.join(tmp, name) for name in ('key.pem', 'crt.pem', 'server.pem'))
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=localhost', '-keyout', key, '-out', crt],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(pem, 'w') as out, open(crt) as c, open(key) as k:
+        out.write(c.read() + k.read())
+    return pem
+
+
+def localize(text, upstream, app_port, listen_port, tmp, pem):
+    """Rewrite a container config so it runs unprivileged against local apps"""
+    replacements = [
+        (f'server {upstream};', f'server 127.0.0.1:{app_port};'),
+        ('listen 443 ssl;', f'listen 127.0.0.1:{listen_port} ssl;'),
+        ('/var/cache/nginx', os.path.join(tmp, 'cache')),
+        ('/var/log/nginx', os.path.join(tmp, 'logs')),
+        ('/var/run/nginx.pid', os.path.join(tmp, 'nginx.pid')),
+    ]
+    for old, new in replacements:
+        if old not in text:
+            raise ValueError(f'expected {old!r} in the config; update nginx_smoke.py with it')
+        text = text.replace(old, new)
+    for path in TLS_PATHS:
+        text = text.replace(path, pem)
+    # Compiled-in temp dirs are usually root-only
+    temp_paths = ''.join(f'\n    {kind}_temp_path {os.path.join(tmp, kind)};'
+                         for kind in ('client_body', 'proxy', 'fastcgi', 'uwsgi', 'scgi'))
+    text = text.replace('http {', 'http {' + temp_paths, 1)
+    if not os.path.exists('/etc/nginx/mime.types'):
+        text = text.replace('include /etc/nginx/mime.types;',
+                            'types { text/html html; text/css css; application/javascript js; }')
+    os.makedirs(os.path.join(tmp, 'logs'), exist_ok=True)
+    return text
+
+
+def write_config(name, spec, app_port, listen_port, tmp, pem):
+    with open(os.path.join(ROOT, spec['conf'])) as f:
+        text = localize(f.read(), spec['upstream'], app_port, listen_port, tmp, pem)
+    path = os.path.join(tmp, f'{name}.conf')
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def nginx_paths(tmp, conf):
+    return ['-p', tmp, '-c', conf, '-e', os.path.join(tmp, 'logs', 'error.log')]
+
+
+def nginx_test(nginx, conf, tmp):
+    result = subprocess.run([nginx, '-t', *nginx_paths(tmp, conf)], capture_output=True, text=True)
+    return result.returncode == 0, result.stderr.strip()
+
+
+def wait_for_port(port, proc, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'nginx exited with code {proc.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('nginx did not start listening')
+
+
+def tls_context():
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def negotiated_protocol(port):
+    context = tls_context()
+    context.set_alpn_protocols(['h2', 'http/1.1'])
+    with socket.create_connection(('127.0.0.1', port)) as raw:
+        with context.wrap_socket(raw, server_hostname='localhost') as tls:
+            return tls.selected_alpn_protocol()
+
+
+def fetch(conn, path, headers=None):
+    started = time.perf_counter()
+    conn.request('GET', path, headers=headers or {})
+    response = conn.getresponse()
+    response.read()
+    return response.status, response.getheader('X-Cache-Status'), (time.perf_counter() - started) * 1000
+
+
+class Checks:
+    def __init__(self):
+        self.failures = 0
+
+    def expect(self, label, ok, detail=''):
+        self.failures += not ok
+        print(f"  {'ok  ' if ok else 'FAIL'} {label}{'  ' + detail if detail else ''}")
+
+
+def probe(spec, port, app_port, checks):
+    conn = http.client.HTTPSConnection('127.0.0.1', port, context=tls_context(), timeout=30)
+    protocol = negotiated_protocol(port)
+    checks.expect('HTTP/2 negotiated', protocol == 'h2', f'alpn={protocol}')
+    for path in spec.get('cached', []) + spec.get('micro', []):
+        statuses = [fetch(conn, path)[1], fetch(conn, path)[1]]
+        checks.expect(f'{path} cached', statuses == ['MISS', 'HIT'], ' -> '.join(map(str, statuses)))
+    for path in spec.get('micro', []):
+        time.sleep(1.1)
+        status = fetch(conn, path)[1]
+        checks.expect(f'{path} microcache expires', status in ('EXPIRED', 'MISS'), str(status))
+    for path, headers in spec.get('bypass', []):
+        status = fetch(conn, path, headers)[1]
+        checks.expect(f'{path} bypassed for {", ".join(headers)}', status == 'BYPASS', str(status))
+    for path in spec.get('uncached', []):
+        status = fetch(conn, path)[1]
+        checks.expect(f'{path} not cached', status is None, str(status))
+
+    for path in spec.get('large_body', []):
+        conn.request('POST', path, body=b'x' * LARGE_BODY, headers={'Content-Type': 'application/octet-stream'})
+        response = conn.getresponse()
+        response.read()
+        checks.expect(f'POST {path} with {LARGE_BODY >> 20} MB body', response.status != 413, str(response.status))
+
+    path = (spec.get('cached') or spec.get('micro'))[0]
+    results = [fetch(conn, path) for _ in range(BURST)]
+    hits = [ms for _, status, ms in results if status == 'HIT']
+    direct = http.client.HTTPConnection('127.0.0.1', app_port, timeout=30)
+    upstream = [fetch(direct, path)[2] for _ in range(min(BURST, 50))]
+    print(f'  burst of {BURST} on {path}: hit ratio {len(hits) / BURST:.0%}, '
+          f'hit p50 {statistics.median(hits) if hits else float("nan"):.2f} ms, '
+          f'app p50 {statistics.median(upstream):.2f} ms')
+
+
+def run_config(name, spec, nginx, validate_only, checks):
+    print(f'{name} ({spec["conf"]})')
+    tmp = tempfile.mkdtemp(prefix=f'nginx-{name}-')
+    try:
+        pem = make_cert(tmp)
+        listen_port = free_port()
+        if validate_only:
+            conf = write_config(name, spec, 9, listen_port, tmp, pem)
+            ok, output = nginx_test(nginx, conf, tmp)
+            checks.expect('nginx -t', ok, '' if ok else output)
+            return
+        with Server(spec['app']) as server:
+            conf = write_config(name, spec, server.port, listen_port, tmp, pem)
+            ok, output = nginx_test(nginx, conf, tmp)
+            checks.expect('nginx -t', ok, '' if ok else output)
+            if not ok:
+                return
+            proc = subprocess.Popen([nginx, *nginx_paths(tmp, conf), '-g', 'daemon off;'],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            try:
+                wait_for_port(listen_port, proc)
+                probe(spec, listen_port, server.port, checks)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=10)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('configs', nargs='*', help=f"any of {', '.join(CONFIGS)} (default: all)")
+    parser.add_argument('--nginx', default=shutil.which('nginx') or 'nginx')
+    parser.add_argument('--validate-only', action='store_true', help='only run nginx -t')
+    args = parser.parse_args(argv)
+    unknown = set(args.configs) - set(CONFIGS)
+    if unknown:
+        parser.error(f"unknown config(s): {', '.join(sorted(unknown))}")
+    if not shutil.which(args.nginx):
+        sys.exit(f'nginx not found ({args.nginx}); install it or pass --nginx')
+    checks = Checks()
+    for name in args.configs or CONFIGS:
+        run_config(name, CONFIGS[name], args.nginx, args.validate_only, checks)
+    print(f'{checks.failures} failure(s)')
+    return 1 if checks.failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Startup-time profiling and regression benchmark.
+
+`importtime` runs `python -X importtime -c "import <module>"` for an app (with
+WARMUP=0, so only imports and module-level setup are counted). It prints the
+total, the top-level packages that cost the most, and the slowest individual
+modules.
+
+`run` starts each app through serve.py, as bench.py does, and measures:
+- listen_s: time until the server first answers, e.g. on /livez
+- ready_s: time until its readiness path answers below 500 (/readyz after warmup)
+- first_request_ms: latency of the first real request after that
+It also records import_s and the per-step warmup timings /readyz reports. A
+baseline comparison and an absolute --budget on ready_s make it usable as a
+regression gate.
+
+    python bench/startup.py importtime day5
+    python bench/startup.py importtime blog --top 30
+    python bench/startup.py run -o startup.json
+    python bench/startup.py run --baseline bench/startup-baseline.json --budget 5
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from bench import APPS, ROOT, Server
+
+DEFAULT_APPS = ['day5', 'day5-asgi', 'blog']
+# The request a client would send first once the app is ready
+FIRST_REQUEST = {
+    'day1': '/', 'day2': '/livez', 'day10': '/', 'blog': '/',
+    'day5': '/products/?count=10', 'day5-asgi': '/products/?count=10',
+}
+COMPARED = ['import_s', 'listen_s', 'ready_s', 'first_request_ms']
+# Differences below these are timer noise, whatever the percentage
+NOISE = {'import_s': 0.05, 'listen_s': 0.1, 'ready_s': 0.1, 'first_request_ms': 5}
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def parse_importtime(stderr):
+    """(module, depth, self_us, cumulative_us) for each line of -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def importtime(name):
+    spec = APPS[name]
+    module = spec['target'].split(':')[0]
+    env = {**os.environ, **spec.get('env', {}), 'WARMUP': '0'}
+    # Profile with bytecode cached, as in an image built with compileall
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    cmd = [sys.executable, '-X', 'importtime', '-c', f'import {module}']
+    workdir = os.path.join(ROOT, spec['dir'])
+    # The first run writes the .pyc files; profile the second
+    subprocess.run(cmd, cwd=workdir, env=env, capture_output=True)
+    result = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr[-2000:]}')
+    rows = parse_importtime(result.stderr)
+    total = next(cumulative for mod, depth, _, cumulative in rows if mod == module and depth == 0)
+    return module, total, rows
+
+
+def report_importtime(args):
+    module, total, rows = importtime(args.app)
+    packages = defaultdict(int)
+    for mod, _, self_us, _ in rows:
+        packages[mod.split('.')[0]] += self_us
+    print(f'import {module} ({args.app}): {total / 1000:.1f} ms, {len(rows)} modules')
+    print(f"\n{'package':<36} {'ms':>8} {'share':>6}")
+    for package, us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'{package:<36} {us / 1000:>8.1f} {us / total:>6.1%}')
+    print(f"\n{'module (self time)':<36} {'ms':>8} {'cumulative':>10}")
+    for mod, _, self_us, cumulative_us in sorted(rows, key=lambda row: -row[2])[:args.top]:
+        print(f'{mod:<36} {self_us / 1000:>8.1f} {cumulative_us / 1000:>10.1f}')
+    return 0
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    started = time.perf_counter()
+    conn.request('GET', path)
+    response = conn.getresponse()
+    body = response.read()
+    return response.status, body, (time.perf_counter() - started) * 1000
+
+
+def measure(name, workers):
+    with Server(name, workers=workers) as server:
+        status, body, first_ms = get(server.port, FIRST_REQUEST.get(name, '/'))
+        if status >= 500:
+            raise RuntimeError(f'{name}: first request returned {status}')
+        run = {'listen_s': server.listen_s, 'ready_s': server.startup_s, 'first_request_ms': first_ms,
+               'rss_mb': server.stats()[0] / 2 ** 20}
+        if APPS[name]['ready'] == '/readyz':
+            run['warmup_ms'] = json.loads(get(server.port, '/readyz')[1]).get('warmup_ms', {})
+    return run
+
+
+def run(args):
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'startup': {},
+    }
+    for name in args.apps:
+        print(f'{name} ...', file=sys.stderr)
+        runs = [measure(name, args.workers) for _ in range(args.repeat)]
+        result = {key: round(statistics.median(r[key] for r in runs), 3)
+                  for key in ('listen_s', 'ready_s', 'first_request_ms', 'rss_mb')}
+        result['import_s'] = round(importtime(name)[1] / 1e6, 3)
+        if 'warmup_ms' in runs[-1]:
+            result['warmup_ms'] = runs[-1]['warmup_ms']
+        report['startup'][name] = result
+        print(f"  import {result['import_s']} s  listening {result['listen_s']} s  "
+              f"ready {result['ready_s']} s  first request {result['first_request_ms']} ms", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(text + '\n')
+    failures = 0
+    if args.budget is not None:
+        for name, result in report['startup'].items():
+            if result['ready_s'] > args.budget:
+                print(f"{name:<12} ready in {result['ready_s']} s, over the {args.budget} s budget")
+                failures += 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += compare(report, json.load(f), args.tolerance)
+    return 1 if failures else 0
+
+
+def compare(current, baseline, tolerance):
+    """Print a comparison table; return the number of regressions beyond tolerance"""
+    regressions = 0
+    for name, result in current['startup'].items():
+        base = baseline.get('startup', {}).get(name)
+        if base is None:
+            print(f'{name:<12} (no baseline)')
+            continue
+        for key in COMPARED:
+            new, old = result.get(key), base.get(key)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance and new - old > NOISE[key]
+            regressions += worse
+            print(f"{name:<12} {key:<18} {old:>9} -> {new:<9} {change:+7.1%}"
+                  f"{'  REGRESSION' if worse else ''}")
+    print(f'{regressions} regression(s) at {tolerance:.0%} tolerance')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = sub.add_parser('importtime', help='profile the imports of one app')
+    import_parser.add_argument('app', choices=sorted(APPS))
+    import_parser.add_argument('--top', type=int, default=20)
+
+    run_parser = sub.add_parser('run', help='measure startup of each app and write a JSON report')
+    run_parser.add_argument('apps', nargs='*', default=DEFAULT_APPS, help=f"default: {' '.join(DEFAULT_APPS)}")
+    run_parser.add_argument('-r', '--repeat', type=int, default=3, help='starts per app; the median is reported')
+    run_parser.add_argument('--workers', type=int, help='override the autotuned worker count')
+    run_parser.add_argument('-o', '--output', help='write the report here instead of stdout')
+    run_parser.add_argument('--baseline', help='compare against this report and fail on regressions')
+    run_parser.add_argument('--save-baseline', help='also write the report to this baseline path')
+    run_parser.add_argument('--tolerance', type=float, default=0.25)
+    run_parser.add_argument('--budget', type=float, help='fail if any app takes longer than this to be ready')
+
+    args = parser.parse_args(argv)
+    if args.command == 'importtime':
+        return report_importtime(args)
+    unknown = set(args.apps) - set(APPS)
+    if unknown:
+        parser.error(f"unknown app(s): {', '.join(sorted(unknown))}")
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Keep the modules the apps share identical.
+
+Every app directory is its own Docker build context, so modules used by more
+than one app are copied into each of them rather than imported from a common
+package. This script checks that the copies haven't drifted apart. After editing
+one copy, propagate it from that app:
+
+    python bench/sync_shared.py                   # check; exits 1 if any copy differs
+    python bench/sync_shared.py --from day5       # copy day5's versions over the others
+    python bench/sync_shared.py --from blog/blog_app timing.py
+
+day5/tests runs the check as part of the test suite.
+"""
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module -> the app directories that carry a copy of it
+SHARED = {
+    'serve.py': ['day1', 'day2', 'day5', 'day10', 'blog/blog_app'],
+    'profiling.py': ['day5', 'blog/blog_app'],
+    'ratelimit.py': ['day5', 'blog/blog_app'],
+    'singleflight.py': ['day5', 'blog/blog_app'],
+    'startup.py': ['day5', 'blog/blog_app'],
+    'timing.py': ['day5', 'blog/blog_app'],
+}
+
+
+def drifted(modules=SHARED):
+    """{module: [app dirs whose copy differs from the first one]}"""
+    result = {}
+    for module, apps in modules.items():
+        first = os.path.join(ROOT, apps[0], module)
+        differing = [app for app in apps[1:]
+                     if not filecmp.cmp(first, os.path.join(ROOT, app, module), shallow=False)]
+        if differing:
+            result[module] = differing
+    return result
+
+
+def propagate(source, modules):
+    for module in modules:
+        for app in SHARED[module]:
+            if app != source:
+                shutil.copyfile(os.path.join(ROOT, source, module), os.path.join(ROOT, app, module))
+                print(f'{source}/{module} -> {app}/{module}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--from', dest='source', metavar='APP', help='copy this app\'s versions to the others')
+    parser.add_argument('modules', nargs='*', help=f"any of {', '.join(SHARED)} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = set(args.modules) - set(SHARED)
+    if unknown:
+        parser.error(f"unknown module(s): {', '.join(sorted(unknown))}")
+    modules = args.modules or list(SHARED)
+    if args.source:
+        sources = [m for m in modules if args.source in SHARED[m]]
+        if not sources:
+            parser.error(f'{args.source} has none of {", ".join(modules)}')
+        propagate(args.source, sources)
+        return 0
+    differing = drifted({m: SHARED[m] for m in modules})
+    for module, apps in differing.items():
+        print(f"{module}: {', '.join(apps)} differ from {SHARED[module][0]}")
+    if differing:
+        print('Edit one copy, then run: python bench/sync_shared.py --from <that app>')
+        return 1
+    print(f'{len(modules)} shared module(s) in sync')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,9 @@
 from fastapi_admin.app import app as admin_app
 from fastapi_admin.providers.login import UsernamePasswordProvider
 from fastapi_admin.models import AbstractAdmin
+from sqlalchemy.orm import load_only
 from sqlmodel import Session, select
-from models import BlogPost
+from models import BlogPost, ROW_COLUMNS
 from fastapi import Depends
 from fastapi.templating import Jinja2Templates
 import os
@@ -11,11 +12,13 @@ templates = Jinja2Templates(directory="templates")
 
 class Admin(AbstractAdmin):
     async def get_context(self):
+        # One query, split in Python, instead of a full-table query per status
         with Session(self.engine) as session:
-            return {
-                "published": session.exec(select(BlogPost).where(BlogPost.is_published == True)).all(),
-                "drafts": session.exec(select(BlogPost).where(BlogPost.is_published == False)).all(),
-            }
+            posts = session.exec(select(BlogPost).options(load_only(*ROW_COLUMNS))).all()
+        return {
+            "published": [post for post in posts if post.is_published],
+            "drafts": [post for post in posts if not post.is_published],
+        }
 
 async def setup_admin(app, engine):
     # Initialize admin
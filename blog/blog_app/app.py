@@ -1,28 +1,73 @@
+import os
 from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import Optional
-from fastapi import FastAPI, Request, Form, UploadFile, File, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, Request, Form, UploadFile, File, HTTPException, Depends, BackgroundTasks, Path, Header
 from fastapi.encoders import jsonable_encoder
-from sqlmodel import SQLModel, create_engine, Session, select
-from models import BlogPost, create_db_and_tables
-from fastapi.responses import HTMLResponse
+from sqlalchemy import func, update
+from sqlalchemy.orm import defer, load_only
+from sqlmodel import Session, select
+from database import engine, engines, read_engine
+import database
+from models import IMAGE_PATH_PATTERN, ROW_COLUMNS, BlogPost, PostPatch, create_db_and_tables
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.staticfiles import StaticFiles  # Add this import at the top
-import os
+import asyncio
+import drafts
+import events
+import jobs
+import patches
+import profiling
+import ratelimit
+import re
+import rendering
 import secrets
 import shutil
+import singleflight
+import sqlstats
+import startup
+import tasks
+import timing
 
-# Database configuration
-DATABASE_URL = "sqlite:///blog.db"
-engine = create_engine(DATABASE_URL, echo=True)
+# Database configuration lives in database.py (primary + optional read replica);
+# set SQL_ECHO=1 to dump statements while debugging
+for db_engine in engines:
+    timing.instrument_engine(db_engine)
+    sqlstats.instrument_engine(db_engine)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    create_db_and_tables()
+    # Launched through `python app.py` the schema already exists; started some other
+    # way (uvicorn app:app), each worker makes sure of it
+    if os.environ.get("SCHEMA_READY") != "1":
+        create_db_and_tables()
+        rendering.backfill(engine)
+    warmup.start()
+    await broadcaster.start()
+    flusher = asyncio.create_task(draft_buffer.run())
+    loop = asyncio.get_running_loop()
+    # Jobs finish in worker threads; what they change is announced from the event loop
+    tasks.on_change = lambda action, post_id: asyncio.run_coroutine_threadsafe(announce(action, post_id), loop)
+    job_workers = jobs.WorkerPool(job_queue).start()
     yield
+    flusher.cancel()
+    # Running jobs finish, and are announced, before the streams close; anything
+    # claimed after this goes back to the queue
+    await asyncio.to_thread(job_workers.stop)
+    tasks.on_change = None
+    await broadcaster.stop()
+    # Autosaves still in the buffer are written before the worker exits
+    await asyncio.to_thread(draft_buffer.flush)
 
 app = FastAPI(title="Blog Platform", lifespan=lifespan)
+# Added first so it runs inside the timing middleware and shed requests are still logged
+ratelimit.init_fastapi(app, {"/upload": "10/m", "/admin/posts": "60/m"})
+timing.init_fastapi(app)
+sqlstats.init_fastapi(app)
+database.init_fastapi(app)
 
 # Security
 security = HTTPBasic()
@@ -37,50 +82,96 @@ def get_current_admin(credentials: HTTPBasicCredentials = Depends(security)):
         )
     return credentials.username
 
-# SQLite setup
-SQLModel.metadata.create_all(engine)
+profiling.init_fastapi(app, get_current_admin)
 
 # Jinja2 templates
 templates = Jinja2Templates(directory="templates")
+timing.instrument_templates(templates)
 
 # Mount static directory - add this before other routes
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # Image upload route
 @app.post("/upload")
 async def upload_image(file: UploadFile = File(...)):
-    file_path = os.path.join("static/uploads", file.filename)
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
-    url = f"/static/uploads/{file.filename}"
+    filename = tasks.upload_name(file.filename)
+    file_path = os.path.join(tasks.UPLOAD_DIR, filename)
+    with timing.phase("upload"):
+        with open(file_path, "wb") as buffer:
+            buffer.write(await file.read())
+    url = f"/static/uploads/{filename}"
     return {"url": url}
 
-# Save blog post
+# Autosaves are buffered per draft ID and written behind (see drafts.py)
+draft_buffer = drafts.DraftBuffer(engine)
+
+@app.post("/drafts/{draft_id}")
+async def autosave_draft(
+    background_tasks: BackgroundTasks,
+    draft_id: str = Path(..., pattern=drafts.DRAFT_ID_PATTERN),
+    title: str = Form(""),
+    content: str = Form(...),
+    image_path: Optional[str] = Form(None, pattern=IMAGE_PATH_PATTERN),
+    revision: Optional[int] = Form(None),
+    admin: str = Depends(get_current_admin),
+):
+    result, full = draft_buffer.save(draft_id, title, content, image_path or None, revision)
+    if result == "stale":
+        raise HTTPException(status_code=409, detail="A newer revision of this draft was already saved")
+    if full:
+        background_tasks.add_task(draft_buffer.flush)
+    return {"status": result, "draft_id": draft_id}
+
+# Save blog post; with a draft_id it's the explicit save of an autosaved draft
 @app.post("/save")
-async def save_post(request: Request, title: str = Form(...), content: str = Form(...), image_path: str = Form(default=None)):
+async def save_post(request: Request, background_tasks: BackgroundTasks, title: str = Form(...), content: str = Form(...),
+                    image_path: str = Form(default=None, pattern=IMAGE_PATH_PATTERN), draft_id: Optional[str] = Form(None),
+                    revision: Optional[int] = Form(None), admin: str = Depends(get_current_admin)):
+    if draft_id is not None:
+        if not re.match(drafts.DRAFT_ID_PATTERN, draft_id):
+            raise HTTPException(status_code=422, detail="Invalid draft_id")
+        try:
+            post_id = await asyncio.to_thread(draft_buffer.save_now, draft_id, title, content, image_path or None, revision)
+        except drafts.StaleRevision:
+            raise HTTPException(status_code=409, detail="A newer revision of this draft was already saved")
+        return {"status": "success", "post_id": post_id}
     with Session(engine) as session:
-        post = BlogPost(title=title, content=content, image_path=image_path, is_published=False)
+        post = rendering.apply(BlogPost(title=title, content=content, image_path=image_path, is_published=False))
         session.add(post)
         session.commit()
+        background_tasks.add_task(announce, "created", post.id)
         return {"status": "success"}
 
 # Main route with HTMX
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    with Session(engine) as session:
-        statement = select(BlogPost)  # Create select statement
+    with Session(read_engine(request)) as session:
+        # The page shows the sanitized copy; the raw content is only for editing
+        statement = select(BlogPost).options(defer(BlogPost.content))
         posts = session.exec(statement).all()  # Execute the statement
     return templates.TemplateResponse("index.html", {"request": request, "posts": posts})
 
 # Chart data route (simplified example)
+def post_counts(db_engine):
+    # Counted by the database; every change to a post recomputes this for the live dashboards
+    with Session(db_engine) as session:
+        counts = dict(session.exec(select(BlogPost.is_published, func.count()).group_by(BlogPost.is_published)).all())
+    return counts.get(True, 0), counts.get(False, 0)
+
+# Every dashboard load requests the chart at once; concurrent requests share one query
+chart_flight = singleflight.SingleFlight("chart-data", timeout=5)
+
 @app.get("/chart-data", response_class=HTMLResponse)
 async def chart_data(request: Request):  # Add request parameter
-    with Session(engine) as session:
-        statement = select(BlogPost)
-        posts = session.exec(statement).all()
-        published = sum(1 for p in posts if p.is_published)
-        drafts = sum(1 for p in posts if not p.is_published)
-    
+    db_engine = read_engine(request)
+    published, drafts = await chart_flight.do_async(
+        str(db_engine.url), lambda: asyncio.to_thread(post_counts, db_engine)
+    )
+
     return templates.TemplateResponse(
         "partials/chart.html",
         {
@@ -90,11 +181,53 @@ async def chart_data(request: Request):  # Add request parameter
         }
     )
 
+# Dashboards hear about every change to posts over /events (see events.py)
+broadcaster = events.Broadcaster()
+
+def post_update(post_id):
+    with Session(engine) as session:
+        post = session.exec(
+            select(BlogPost).where(BlogPost.id == post_id)
+            .options(defer(BlogPost.content), defer(BlogPost.content_html))
+        ).first()
+        row = templates.get_template("partials/post_row.html").render(post=post) if post else None
+    return row, post_counts(engine)
+
+async def announce(action, post_id):
+    """Publish a change to a post and the counts after it; routes run this after responding"""
+    row, (published, drafts) = await asyncio.to_thread(post_update, post_id)
+    await broadcaster.publish("post", {"action": action, "id": post_id, "row": row})
+    await broadcaster.publish("stats", {"published": published, "drafts": drafts})
+
+async def event_stream(request, events):
+    db_engine = read_engine(request)
+    # Many tabs connecting at once share one count
+    published, drafts = await chart_flight.do_async(
+        str(db_engine.url), lambda: asyncio.to_thread(post_counts, db_engine)
+    )
+    return StreamingResponse(
+        broadcaster.stream(events, [("stats", {"published": published, "drafts": drafts})]),
+        media_type="text/event-stream",
+        # No caching, and no buffering in nginx, or events would arrive in batches
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/events")
+async def live_events(request: Request):
+    # Public: the counts only
+    return await event_stream(request, {"stats"})
+
+@app.get("/admin/events")
+async def admin_live_events(request: Request, admin: str = Depends(get_current_admin)):
+    # Post rows are the admin table's markup, drafts included
+    return await event_stream(request, {"stats", "post"})
+
 # Admin dashboard route
 @app.get("/admin/dashboard", response_class=HTMLResponse)
 async def admin_dashboard(request: Request, admin: str = Depends(get_current_admin)):
     with Session(engine) as session:
-        statement = select(BlogPost)  # Use select() instead of BlogPost.select()
+        # Rendered after the session closes, so only what the rows show is loaded
+        statement = select(BlogPost).options(load_only(*ROW_COLUMNS))
         posts = session.exec(statement).all()
     return templates.TemplateResponse(
         "admin/dashboard.html",
@@ -103,37 +236,76 @@ async def admin_dashboard(request: Request, admin: str = Depends(get_current_adm
 
 # Admin post management routes
 @app.post("/admin/posts/{post_id}/publish")
-async def publish_post(post_id: int, admin: str = Depends(get_current_admin)):
+async def publish_post(post_id: int, background_tasks: BackgroundTasks, admin: str = Depends(get_current_admin)):
     with Session(engine) as session:
         post = session.get(BlogPost, post_id)
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
         post.is_published = True
+        post.version += 1
         session.add(post)
         session.commit()
+        background_tasks.add_task(announce, "published", post_id)
         return {"status": "success"}
 
 @app.post("/admin/posts/{post_id}/unpublish")
-async def unpublish_post(post_id: int, admin: str = Depends(get_current_admin)):
+async def unpublish_post(post_id: int, background_tasks: BackgroundTasks, admin: str = Depends(get_current_admin)):
     with Session(engine) as session:
         post = session.get(BlogPost, post_id)
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
         post.is_published = False
+        post.version += 1
         session.add(post)
         session.commit()
+        background_tasks.add_task(announce, "unpublished", post_id)
         return {"status": "success"}
 
 @app.delete("/admin/posts/{post_id}")
-async def delete_post(post_id: int, admin: str = Depends(get_current_admin)):
+async def delete_post(post_id: int, background_tasks: BackgroundTasks, admin: str = Depends(get_current_admin)):
     with Session(engine) as session:
         post = session.get(BlogPost, post_id)
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
+        image_path = post.image_path
         session.delete(post)
         session.commit()
+        if image_path:
+            path = tasks.static_file(image_path)
+            await asyncio.to_thread(job_queue.enqueue, "delete_file", {"path": path}, key=f"delete:{path}")
+        background_tasks.add_task(announce, "deleted", post_id)
         return {"status": "success"}
 
+# Slow post-processing goes to a durable job queue (see jobs.py, tasks.py)
+job_queue = jobs.queue_from_env()
+
+async def stage_upload(image):
+    """Write an upload where its job will pick it up; returns (staged path, image URL)"""
+    file_ext = os.path.splitext(tasks.upload_name(image.filename))[1]
+    unique_filename = f"{secrets.token_hex(8)}{file_ext}"
+    staged = os.path.join(tasks.STAGING_DIR, unique_filename)
+
+    def write():
+        # The upload only exists for the length of the request, so this part can't wait
+        os.makedirs(tasks.STAGING_DIR, exist_ok=True)
+        with open(staged, "wb") as buffer:
+            shutil.copyfileobj(image.file, buffer)
+
+    with timing.phase("upload"):
+        await asyncio.to_thread(write)
+    return staged, f"/static/uploads/{unique_filename}"
+
+async def attach_image(post_id, staged, image_path, old_image_path=None):
+    # Called after the commit, so the post already points at image_path
+    args = {"post_id": post_id, "staged": staged, "image_path": image_path, "old_image_path": old_image_path}
+    try:
+        # A SQLite write or a Redis round trip; either would block the event loop
+        await asyncio.to_thread(job_queue.enqueue, "attach_image", args, key=f"attach:{image_path}")
+    except Exception:
+        # The queue is unavailable: do the job's work here instead. If that fails too the
+        # staged file stays, and the job can still be run by hand
+        await asyncio.to_thread(tasks.attach_image, **args)
+
 # Add this route for creating posts
 @app.post("/admin/posts")
 async def create_post(
@@ -146,31 +318,24 @@ async def create_post(
 ):
     try:
         with Session(engine) as session:
-            # Create uploads directory if it doesn't exist
-            os.makedirs("static/uploads", exist_ok=True)
-            
-            post = BlogPost(
+            post = rendering.apply(BlogPost(
                 title=title,
                 content=content,
                 is_published=False
-            )
+            ))
             
-            if image and image.filename:
-                # Save file with a unique name to prevent overwriting
-                file_ext = os.path.splitext(image.filename)[1]
-                unique_filename = f"{secrets.token_hex(8)}{file_ext}"
-                file_path = os.path.join("static/uploads", unique_filename)
-                
-                async def save_upload():
-                    with open(file_path, "wb") as buffer:
-                        shutil.copyfileobj(image.file, buffer)
-                
-                await save_upload()
-                post.image_path = f"/static/uploads/{unique_filename}"
+            staged = await stage_upload(image) if image and image.filename else None
+            if staged:
+                # Set now, so this write is the post's last one and its ETag stays
+                # valid; the image itself appears once the job has moved it into place
+                post.image_path = staged[1]
             
             session.add(post)
             session.commit()
             session.refresh(post)
+            if staged:
+                await attach_image(post.id, *staged)
+            background_tasks.add_task(announce, "created", post.id)
             
             return templates.TemplateResponse(
                 "partials/post_row.html",
@@ -181,17 +346,20 @@ async def create_post(
 
 # Add route for getting a post
 @app.get("/admin/posts/{post_id}")
-async def get_post(post_id: int, admin: str = Depends(get_current_admin)):
-    with Session(engine) as session:
+async def get_post(post_id: int, request: Request, response: Response, admin: str = Depends(get_current_admin)):
+    with Session(read_engine(request)) as session:
         post = session.get(BlogPost, post_id)
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
+        # Editors send this back as If-Match when they save
+        response.headers["ETag"] = patches.etag(post.version)
         return {
             "id": post.id,
             "title": post.title,
             "content": post.content,
             "is_published": post.is_published,
-            "image_path": post.image_path
+            "image_path": post.image_path,
+            "version": post.version
         }
 
 # Add route for updating posts
@@ -203,53 +371,155 @@ async def update_post(
     title: str = Form(...),
     content: str = Form(...),
     image: Optional[UploadFile] = File(None),
+    if_match: Optional[str] = Header(None),
     admin: str = Depends(get_current_admin)
 ):
+    # Like PATCH: the version check and the write are one UPDATE, so two editors
+    # saving at once can't both pass the check
+    staged = await stage_upload(image) if image and image.filename else None
+    values = {"title": title, "content": content, **rendering.prerender(content)}
+    if staged:
+        # As in create_post, the new path is part of this write, not the job's
+        values["image_path"] = staged[1]
+    statement = (
+        update(BlogPost)
+        .where(BlogPost.id == post_id)
+        .values(**values, version=BlogPost.version + 1, updated_at=datetime.utcnow())
+        .returning(BlogPost.version)
+    )
+    versions = patches.if_match_versions(if_match) if if_match else None
+    if versions is not None:
+        statement = statement.where(BlogPost.version.in_(versions))
+    committed = False
     try:
         with Session(engine) as session:
-            post = session.get(BlogPost, post_id)
-            if not post:
-                raise HTTPException(status_code=404, detail="Post not found")
-            
-            post.title = title
-            post.content = content
-            
-            if image and image.filename:
-                # Save file with a unique name
-                file_ext = os.path.splitext(image.filename)[1]
-                unique_filename = f"{secrets.token_hex(8)}{file_ext}"
-                file_path = os.path.join("static/uploads", unique_filename)
-                
-                async def save_upload():
-                    with open(file_path, "wb") as buffer:
-                        shutil.copyfileobj(image.file, buffer)
-                
-                await save_upload()
-                
-                # Delete old image if exists
-                if post.image_path:
-                    old_file = os.path.join("static", post.image_path.lstrip("/"))
-                    if os.path.exists(old_file):
-                        os.remove(old_file)
-                
-                post.image_path = f"/static/uploads/{unique_filename}"
-            
-            session.add(post)
+            old_image_path = None
+            if staged:
+                current = session.execute(
+                    select(BlogPost.image_path, BlogPost.version).where(BlogPost.id == post_id)
+                ).first()
+                if current is not None:
+                    # The job deletes this image, so it must still be the one being replaced
+                    old_image_path = current[0]
+                    statement = statement.where(BlogPost.version == current[1])
+            if session.execute(statement).first() is None:
+                current = session.execute(select(BlogPost.version).where(BlogPost.id == post_id)).scalar()
+                if current is None:
+                    raise HTTPException(status_code=404, detail="Post not found")
+                raise HTTPException(status_code=412, detail="Post was changed since it was read",
+                                    headers={"ETag": patches.etag(current)})
             session.commit()
-            session.refresh(post)
+            committed = True
+            post = session.get(BlogPost, post_id)
+            if staged:
+                # The job moves the image into place and deletes the old one
+                await attach_image(post.id, *staged, old_image_path=old_image_path)
+            background_tasks.add_task(announce, "updated", post.id)
             
-            return templates.TemplateResponse(
+            response = templates.TemplateResponse(
                 "partials/post_row.html",
                 {"request": request, "post": post}
             )
+            response.headers["ETag"] = patches.etag(post.version)
+            return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if staged and not committed:
+            # Nothing was saved, so no job will ever pick this file up. Once the post
+            # points at it, the file is kept even if attaching it failed
+            os.remove(staged[0])
+
+# Partial update: only the changed fields, content optionally as a delta (see patches.py)
+@app.patch("/admin/posts/{post_id}")
+async def patch_post(
+    post_id: int,
+    changes: PostPatch,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    if_match: Optional[str] = Header(None),
+    admin: str = Depends(get_current_admin)
+):
+    if if_match is None:
+        raise HTTPException(status_code=428, detail="Send the post's ETag as If-Match")
+    values = changes.model_dump(exclude_unset=True)
+    delta = values.pop("delta", None)
+    if "title" in values and values["title"] is None:
+        raise HTTPException(status_code=422, detail="title can't be null")
+    if values.get("image_path") and not re.match(IMAGE_PATH_PATTERN, values["image_path"]):
+        raise HTTPException(status_code=422, detail="image_path must be a file in /static/uploads/")
+    if delta is not None and "content" in values:
+        raise HTTPException(status_code=422, detail="Send either content or delta, not both")
+    spans = 0
+    if delta is not None:
+        try:
+            values["content"], spans = patches.delta_expression(BlogPost.content, delta)
+        except patches.DeltaError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    if values.get("content", "") is None:
+        raise HTTPException(status_code=422, detail="content can't be null")
+    if isinstance(values.get("content"), str):
+        values.update(rendering.prerender(values["content"]))
+    if not values:
+        raise HTTPException(status_code=422, detail="Nothing to update")
+
+    # One UPDATE that checks the version and writes only these columns; the content
+    # only comes back when a delta was applied, to render it
+    returned = [BlogPost.version] + ([BlogPost.content] if delta is not None else [])
+    statement = (
+        update(BlogPost)
+        .where(BlogPost.id == post_id)
+        .values(**values, version=BlogPost.version + 1, updated_at=datetime.utcnow())
+        .returning(*returned)
+    )
+    versions = patches.if_match_versions(if_match)
+    if versions is not None:
+        statement = statement.where(BlogPost.version.in_(versions))
+    if spans:
+        statement = statement.where(func.length(BlogPost.content) >= spans)
+    with Session(engine) as session:
+        row = session.execute(statement).first()
+        if row is None:
+            current = session.execute(
+                select(BlogPost.version, func.length(BlogPost.content)).where(BlogPost.id == post_id)
+            ).first()
+            if current is None:
+                raise HTTPException(status_code=404, detail="Post not found")
+            if versions is not None and current[0] not in versions:
+                raise HTTPException(status_code=412, detail="Post was changed since it was read",
+                                    headers={"ETag": patches.etag(current[0])})
+            raise HTTPException(status_code=422,
+                                detail=f"Delta spans {spans} characters but the content has {current[1]}")
+        version = row[0]
+        if delta is not None:
+            session.execute(update(BlogPost).where(BlogPost.id == post_id).values(**rendering.prerender(row[1])))
+        session.commit()
+    response.headers["ETag"] = patches.etag(version)
+    background_tasks.add_task(announce, "updated", post_id)
+    return {"status": "success", "version": version}
+
+def compile_templates():
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(name)
+
+def open_connections():
+    for db_engine in engines:
+        with db_engine.connect():
+            pass
+
+# /readyz flips once these have run; the index and chart no longer pay for them
+warmup = startup.init_fastapi(app, [
+    ("templates", compile_templates),
+    ("connections", open_connections),
+    ("queries", lambda: post_counts(read_engine())),
+])
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        "app:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    )
\ No newline at end of file
+    from serve import serve
+    # Create the schema once, before any worker starts, then hand over to the server
+    create_db_and_tables()
+    rendering.backfill(engine)
+    os.environ["SCHEMA_READY"] = "1"
+    serve("app:app", kind="asgi", port=8000)
@@ -0,0 +1,95 @@
+"""Database engines for the blog: a primary for writes and an optional read replica.
+
+Configuration comes from the environment:
+
+    DATABASE_URL           primary URL (default sqlite:///blog.db); when unset and
+                           DB_HOST is set, a Postgres URL is built from DB_HOST,
+                           DB_PORT, DB_NAME, DB_USER and DB_PASSWORD(_FILE)
+    REPLICA_DATABASE_URL   read replica URL (default: reads go to the primary)
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT
+                           QueuePool tuning for server databases
+    READ_YOUR_WRITES_SECONDS
+                           how long a client's reads stick to the primary after it
+                           writes, so it sees its own changes despite replica lag
+
+Two SQLite files work as stand-ins for primary and replica in local testing.
+"""
+import os
+import time
+
+from sqlalchemy.engine import make_url
+from sqlmodel import create_engine
+
+STICKY_COOKIE = "db_primary_until"
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 5))
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def url_from_env():
+    if os.environ.get("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    if not os.environ.get("DB_HOST"):
+        return "sqlite:///blog.db"
+    password = os.environ.get("DB_PASSWORD", "")
+    if os.environ.get("DB_PASSWORD_FILE"):
+        # Swarm secrets (see day10/docker-compose.yml) are mounted as files
+        with open(os.environ["DB_PASSWORD_FILE"]) as f:
+            password = f.read().strip()
+    return make_url("postgresql+psycopg2://").set(
+        username=os.environ.get("DB_USER", "postgres"),
+        password=password,
+        host=os.environ["DB_HOST"],
+        port=int(os.environ.get("DB_PORT", 5432)),
+        database=os.environ.get("DB_NAME", "blog"),
+    )
+
+
+def make_engine(url):
+    echo = os.environ.get("SQL_ECHO") == "1"
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_engine(url, echo=echo)
+    return create_engine(
+        url,
+        echo=echo,
+        pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        # Drop connections the server or a proxy closed while they sat idle
+        pool_pre_ping=True,
+        pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    )
+
+
+engine = make_engine(url_from_env())
+replica_engine = make_engine(os.environ["REPLICA_DATABASE_URL"]) if os.environ.get("REPLICA_DATABASE_URL") else engine
+engines = [engine] if replica_engine is engine else [engine, replica_engine]
+
+
+def read_engine(request=None):
+    """Engine for read-only work: the replica, unless this client wrote recently"""
+    if request is not None and replica_engine is not engine:
+        try:
+            if float(request.cookies.get(STICKY_COOKIE, 0)) > time.time():
+                return engine
+        except ValueError:
+            pass
+    return replica_engine
+
+
+def init_fastapi(app):
+    """Pin a client's reads to the primary for a while after any successful write"""
+    if replica_engine is engine:
+        return
+
+    @app.middleware("http")
+    async def read_your_writes(request, call_next):
+        response = await call_next(request)
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                STICKY_COOKIE,
+                str(time.time() + READ_YOUR_WRITES_SECONDS),
+                max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+                httponly=True,
+                samesite="lax",
+            )
+        return response
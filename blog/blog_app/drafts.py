@@ -0,0 +1,197 @@
+"""Write-behind autosave for drafts.
+
+The editor autosaves under a draft ID it generated, and each save lands in an
+in-memory buffer keyed by that ID, so a burst of saves collapses into one pending
+write. The buffer is flushed every DRAFT_FLUSH_INTERVAL seconds, or straight away
+for an explicit save. Each flush is a single transaction that upserts one
+BlogPost per draft. Content whose hash matches what is already stored is never
+written: identical saves coalesce in the buffer, and a flush compares
+against the hash stored with the draft before touching the post.
+
+Saves carry a revision: milliseconds since the epoch, which the editor sends as
+Date.now(). A save without one is stamped with the server clock in the same
+unit. Several workers may each buffer part of one draft's saves, and a flush
+never replaces a newer revision with an older one. A save older than one this
+worker has buffered or written is refused as stale (409 from the routes), and
+one that only loses against the database at flush time is counted and logged.
+
+    DRAFT_FLUSH_INTERVAL   seconds between background flushes (default 5)
+    DRAFT_MAX_PENDING      flush early once this many drafts are waiting (default 1000)
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from prometheus_client import Counter
+from sqlmodel import Session, select
+
+import rendering
+from models import BlogPost, Draft
+
+FLUSH_INTERVAL = float(os.environ.get("DRAFT_FLUSH_INTERVAL", 5))
+MAX_PENDING = int(os.environ.get("DRAFT_MAX_PENDING", 1000))
+DRAFT_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
+logger = logging.getLogger("drafts")
+
+
+class StaleRevision(Exception):
+    """A newer revision of the draft was already saved"""
+
+
+draft_saves_total = Counter("draft_saves_total", "Draft autosaves received", ["result"])
+draft_flushes_total = Counter("draft_flushes_total", "Draft buffer flushes that committed")
+draft_rows_written_total = Counter("draft_rows_written_total", "Posts inserted or updated by draft flushes")
+
+
+def content_hash(title, content, image_path):
+    digest = hashlib.sha256()
+    for part in (title, content, image_path or ""):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class PendingDraft:
+    title: str
+    content: str
+    image_path: Optional[str]
+    content_hash: str
+    revision: int
+
+
+class DraftBuffer:
+    def __init__(self, engine, interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.engine = engine
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}
+        # Latest revision this worker has flushed per draft, to refuse stale saves early
+        self.flushed = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def save(self, draft_id, title, content, image_path=None, revision=None):
+        """Buffer a save; returns (result, full) where full means a flush is due now"""
+        digest = content_hash(title, content, image_path)
+        if revision is None:
+            revision = time.time_ns() // 1_000_000
+        with self.lock:
+            current = self.pending.get(draft_id)
+            known = max(current.revision if current else 0, self.flushed.get(draft_id, 0))
+            if revision < known:
+                result = "stale"
+            elif current is not None and digest == current.content_hash:
+                result = "unchanged"
+            else:
+                self.pending[draft_id] = PendingDraft(title, content, image_path, digest, revision)
+                result = "coalesced" if current else "buffered"
+            full = len(self.pending) >= self.max_pending
+        draft_saves_total.labels(result).inc()
+        return result, full
+
+    def flush(self, draft_ids=None):
+        """Write pending drafts (all, or just these IDs); returns ({draft ID: post ID}, stale draft IDs)"""
+        with self.flush_lock:
+            with self.lock:
+                if draft_ids is None:
+                    batch, self.pending = self.pending, {}
+                else:
+                    batch = {d: self.pending.pop(d) for d in draft_ids if d in self.pending}
+            if not batch:
+                return {}, set()
+            try:
+                return self.write(batch)
+            except Exception:
+                # Keep them for the next flush unless a newer save arrived meanwhile
+                with self.lock:
+                    for draft_id, pending in batch.items():
+                        self.pending.setdefault(draft_id, pending)
+                raise
+
+    def write(self, batch):
+        post_ids, stale, written = {}, set(), 0
+        with Session(self.engine) as session:
+            drafts = {d.draft_id: d for d in session.exec(select(Draft).where(Draft.draft_id.in_(list(batch))))}
+            stored = {draft_id: draft.revision for draft_id, draft in drafts.items()}
+            posts = {}
+            if drafts:
+                linked = [d.post_id for d in drafts.values()]
+                posts = {p.id: p for p in session.exec(select(BlogPost).where(BlogPost.id.in_(linked)))}
+            for draft_id, pending in batch.items():
+                draft = drafts.get(draft_id)
+                post = posts.get(draft.post_id) if draft else None
+                if post is not None and pending.revision < draft.revision:
+                    # Another worker already stored a newer revision
+                    stale.add(draft_id)
+                    post_ids[draft_id] = post.id
+                    continue
+                if post is not None and (pending.revision == draft.revision
+                                         or pending.content_hash == draft.content_hash):
+                    # Already stored: a read, but no write
+                    post_ids[draft_id] = post.id
+                    continue
+                now = datetime.utcnow()
+                if post is None:
+                    # New draft, or its post was deleted since
+                    post = rendering.apply(BlogPost(title=pending.title, content=pending.content,
+                                                    image_path=pending.image_path, is_published=False))
+                    session.add(post)
+                    session.flush()
+                else:
+                    post.title, post.content, post.image_path = pending.title, pending.content, pending.image_path
+                    post.updated_at, post.version = now, post.version + 1
+                    rendering.apply(post)
+                    session.add(post)
+                if draft is None:
+                    draft = Draft(draft_id=draft_id, post_id=post.id)
+                draft.post_id, draft.content_hash = post.id, pending.content_hash
+                draft.revision, draft.saved_at = pending.revision, now
+                session.add(draft)
+                post_ids[draft_id] = post.id
+                written += 1
+            if written:
+                session.commit()
+                draft_flushes_total.inc()
+                draft_rows_written_total.inc(written)
+        if stale:
+            draft_saves_total.labels("stale_on_flush").inc(len(stale))
+            logger.info("dropped %d save(s) older than the stored draft: %s", len(stale), ", ".join(sorted(stale)))
+        with self.lock:
+            if len(self.flushed) > self.max_pending * 10:
+                self.flushed.clear()
+            for draft_id, pending in batch.items():
+                self.flushed[draft_id] = max(pending.revision, stored.get(draft_id, 0), self.flushed.get(draft_id, 0))
+        return post_ids, stale
+
+    def save_now(self, draft_id, title, content, image_path=None, revision=None):
+        """An explicit save: buffer it, flush this draft, and return its post ID; raises StaleRevision"""
+        result, _ = self.save(draft_id, title, content, image_path, revision)
+        if result == "stale":
+            raise StaleRevision(draft_id)
+        post_ids, stale = self.flush([draft_id])
+        if draft_id in stale:
+            raise StaleRevision(draft_id)
+        post_id = post_ids.get(draft_id)
+        if post_id is None:
+            # Nothing was pending because the content was already stored
+            with Session(self.engine) as session:
+                draft = session.get(Draft, draft_id)
+                post_id = draft.post_id if draft else None
+        return post_id
+
+    async def run(self):
+        """Flush on an interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("draft flush failed")
@@ -0,0 +1,153 @@
+"""Live updates for dashboards over Server-Sent Events.
+
+Routes that change posts publish events to the process's Broadcaster, which
+writes each one to the open streams subscribed to it. With REDIS_URL set, events go through a
+Redis pub/sub channel instead, and each worker relays what it receives to its
+own clients, so a change made on one worker reaches dashboards on all of them.
+
+    stats    {"published": n, "drafts": m}; also sent when a client connects
+    post     {"action": "created" | "updated" | "published" | "unpublished" | "deleted",
+              "id": ..., "row": "<tr>...</tr>" for the admin table}
+    resync   the client fell behind and its backlog was dropped; reload instead
+
+Anyone may follow the stats (/events, for the public index page). Post rows carry
+the admin table's markup and the titles of drafts, so only streams opened by an
+admin (/admin/events) subscribe to them; resync goes to every stream.
+
+Each event is encoded once and the same bytes are queued for every client. A
+client's queue holds SSE_QUEUE_SIZE events. If it fills up, the client is not
+keeping up: its backlog is cleared and it gets a single resync, so a slow reader
+costs bounded memory and never holds up the publisher or other clients. An idle
+client is a suspended coroutine and an empty queue. Its only traffic is a comment
+line every SSE_HEARTBEAT seconds, so proxies keep the connection open.
+
+    SSE_QUEUE_SIZE   events buffered per client (default 100)
+    SSE_HEARTBEAT    seconds between keep-alive comments (default 15)
+    REDIS_URL        fan events out across workers; memory:// uses fakeredis (one process)
+"""
+import asyncio
+import json
+import logging
+import os
+
+from prometheus_client import Counter, Gauge
+
+QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", 100))
+HEARTBEAT = float(os.environ.get("SSE_HEARTBEAT", 15))
+CHANNEL = "blog:events"
+# How long browsers wait before reconnecting a dropped stream
+RETRY_MS = 3000
+
+logger = logging.getLogger("events")
+
+sse_clients = Gauge("sse_clients", "Open event streams in this process")
+sse_events_total = Counter("sse_events_total", "Events delivered to this process's clients", ["event"])
+sse_resyncs_total = Counter("sse_resyncs_total", "Slow clients whose backlog was dropped")
+
+KEEP_ALIVE = b": keep-alive\n\n"
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+
+def encode(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+def redis_from_env():
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        import fakeredis
+        return fakeredis.FakeAsyncRedis()
+    import redis.asyncio
+    return redis.asyncio.Redis.from_url(url)
+
+
+class Broadcaster:
+    def __init__(self, queue_size=QUEUE_SIZE, heartbeat=HEARTBEAT):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        # queue -> the event names that client subscribed to
+        self.clients = {}
+        self.redis = None
+        self.relay = None
+
+    async def start(self):
+        self.redis = redis_from_env()
+        if self.redis is not None:
+            self.relay = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self.relay is not None:
+            self.relay.cancel()
+        if self.redis is not None:
+            await self.redis.aclose()
+        # Ends every open stream
+        for queue in self.clients:
+            self.replace_backlog(queue, None)
+
+    async def publish(self, event, data):
+        if self.redis is None:
+            self.deliver(event, data)
+            return
+        try:
+            await self.redis.publish(CHANNEL, json.dumps([event, data]))
+        except Exception:
+            # Dashboards on other workers miss this one; this worker's still get it
+            logger.exception("publishing %s to Redis failed", event)
+            self.deliver(event, data)
+
+    async def listen(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.deliver(*json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("event relay lost its Redis subscription, retrying")
+                await asyncio.sleep(1)
+
+    def deliver(self, event, data):
+        message = encode(event, data)
+        delivered = 0
+        for queue, events in self.clients.items():
+            if event not in events:
+                continue
+            delivered += 1
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                sse_resyncs_total.inc()
+                self.replace_backlog(queue, RESYNC)
+        sse_events_total.labels(event).inc(delivered)
+
+    @staticmethod
+    def replace_backlog(queue, message):
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    async def stream(self, events, initial=()):
+        """The body of an event stream: the initial (event, data) pairs, then what's published to events"""
+        queue = asyncio.Queue(self.queue_size)
+        self.clients[queue] = frozenset(events)
+        sse_clients.inc()
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            for event, data in initial:
+                yield encode(event, data)
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    message = KEEP_ALIVE
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.clients.pop(queue, None)
+            sse_clients.dec()
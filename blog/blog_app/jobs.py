@@ -0,0 +1,457 @@
+"""Durable background jobs.
+
+Unlike FastAPI's BackgroundTasks, which live in the worker's memory, jobs are
+stored before the route returns. A pool of worker threads claims them with a
+lease. When a worker dies mid-job, its lease runs out and another worker picks
+the job up again; on a clean shutdown, unfinished jobs are handed back straight away.
+
+    queue = jobs.queue_from_env()
+    queue.enqueue("delete_file", {"path": "static/uploads/old.png"}, key="delete:old.png")
+
+    @jobs.task("delete_file")
+    def delete_file(path): ...
+
+- A failed job is retried with exponential backoff and jitter, up to its
+  max_attempts; after that it stays in the store as failed. So does a job whose
+  worker died during its last attempt, rather than being handed to another one.
+- An idempotency key makes enqueueing the same work twice a no-op while the
+  first job is kept.
+- Handlers must tolerate running twice, because a job whose worker died after
+  finishing the work but before recording it runs again.
+
+    JOBS_URL             sqlite:///jobs.db (default), redis://... shared by every
+                         replica, or memory:// (fakeredis, one process)
+    JOB_WORKERS          worker threads per web process (default 2); 0 leaves the
+                         work to `python jobs.py worker` processes
+    JOB_POLL_INTERVAL    seconds an idle worker waits before looking again (default 1)
+    JOB_LEASE_SECONDS    how long a claimed job stays claimed (default 300)
+    JOB_MAX_ATTEMPTS     default attempts per job (default 5)
+    JOB_BACKOFF_BASE / JOB_BACKOFF_MAX
+                         retry delay 2**n * base seconds, capped (default 2 / 300)
+    JOB_RETENTION        seconds finished jobs and their keys are kept (default 7 days)
+
+    python jobs.py worker [--workers 4]   # run jobs outside the web processes
+    python jobs.py stats                  # jobs per status
+    python jobs.py purge                  # drop finished jobs older than JOB_RETENTION
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from prometheus_client import Counter, Gauge, Histogram
+
+JOBS_URL = os.environ.get("JOBS_URL", "sqlite:///jobs.db")
+WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 300))
+MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+BACKOFF_BASE = float(os.environ.get("JOB_BACKOFF_BASE", 2))
+BACKOFF_MAX = float(os.environ.get("JOB_BACKOFF_MAX", 300))
+RETENTION = int(os.environ.get("JOB_RETENTION", 7 * 24 * 3600))
+LEASE_EXPIRED = "lease expired during the last attempt"
+
+logger = logging.getLogger("jobs")
+
+jobs_enqueued_total = Counter("jobs_enqueued_total", "Jobs enqueued", ["task", "result"])
+jobs_finished_total = Counter("jobs_finished_total", "Job attempts by outcome", ["task", "result"])
+job_duration_seconds = Histogram("job_duration_seconds", "Time spent running a job", ["task"])
+jobs_running = Gauge("jobs_running", "Jobs this process is running")
+
+TASKS = {}
+
+
+def task(name):
+    """Register a handler; it's called with the job's payload as keyword arguments"""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+@dataclass
+class Job:
+    id: str
+    task: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+
+
+def gave_up(job_id, name):
+    """Record a job whose worker died during its last attempt"""
+    logger.error("job %s (%s) failed: %s", job_id, name, LEASE_EXPIRED)
+    jobs_finished_total.labels(name, "failed").inc()
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    # Jitter, so jobs that failed together don't all retry together
+    return delay * random.uniform(0.5, 1)
+
+
+class SQLiteQueue:
+    """Jobs in a local SQLite file; every web and worker process on the host shares it"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            task TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_at REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_at);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.enqueued = threading.Event()
+        self.connection().executescript(self.SCHEMA)
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            # Autocommit mode; transaction() issues BEGIN IMMEDIATE itself
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self):
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def enqueue(self, name, payload, key=None, max_attempts=MAX_ATTEMPTS, delay=0):
+        """Store a job and return its ID; with a key already queued, the existing job's ID"""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self.transaction() as db:
+            inserted = db.execute(
+                "INSERT OR IGNORE INTO jobs (id, task, payload, idempotency_key, status, max_attempts, run_at, created_at)"
+                " VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, name, json.dumps(payload), key, max_attempts, now + delay, now),
+            ).rowcount
+            if not inserted:
+                job_id = db.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()[0]
+        jobs_enqueued_total.labels(name, "new" if inserted else "duplicate").inc()
+        self.enqueued.set()
+        return job_id
+
+    def claim(self, lease=LEASE_SECONDS):
+        """The next due job, leased to the caller; jobs whose lease ran out count as due"""
+        now = time.time()
+        with self.transaction() as db:
+            # A worker died during the last attempt; claiming it again would only
+            # take down the next worker too
+            exhausted = db.execute(
+                "SELECT id, task FROM jobs WHERE status = 'running' AND locked_until < ? AND attempts >= max_attempts",
+                (now,),
+            ).fetchall()
+            db.executemany(
+                "UPDATE jobs SET status = 'failed', locked_until = NULL, last_error = ?, finished_at = ? WHERE id = ?",
+                [(LEASE_EXPIRED, now, job_id) for job_id, _ in exhausted],
+            )
+            row = db.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND run_at <= ?)"
+                " OR (status = 'running' AND locked_until < ?) ORDER BY run_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                    (now + lease, row["id"]),
+                )
+        for job_id, name in exhausted:
+            gave_up(job_id, name)
+        if row is None:
+            return None
+        return Job(row["id"], row["task"], json.loads(row["payload"]), row["attempts"] + 1, row["max_attempts"])
+
+    def complete(self, job):
+        with self.transaction() as db:
+            db.execute("UPDATE jobs SET status = 'done', locked_until = NULL, finished_at = ? WHERE id = ?",
+                       (time.time(), job.id))
+
+    def fail(self, job, error, retry_at=None):
+        """Retry at retry_at, or give up when it's None"""
+        with self.transaction() as db:
+            if retry_at is None:
+                db.execute("UPDATE jobs SET status = 'failed', locked_until = NULL, last_error = ?, finished_at = ?"
+                           " WHERE id = ?", (error, time.time(), job.id))
+            else:
+                db.execute("UPDATE jobs SET status = 'queued', locked_until = NULL, last_error = ?, run_at = ?"
+                           " WHERE id = ?", (error, retry_at, job.id))
+
+    def release(self, job):
+        """Hand a claimed job back without counting the attempt"""
+        with self.transaction() as db:
+            db.execute("UPDATE jobs SET status = 'queued', locked_until = NULL, attempts = attempts - 1"
+                       " WHERE id = ? AND status = 'running'", (job.id,))
+
+    def stats(self):
+        rows = self.connection().execute("SELECT status, count(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def purge(self, older_than=RETENTION):
+        with self.transaction() as db:
+            return db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                              (time.time() - older_than,)).rowcount
+
+
+class RedisQueue:
+    """Jobs in Redis, shared by every replica.
+
+    jobs:<id> is a hash per job. jobs:ready and jobs:leases are sorted sets of job IDs
+    scored by when they're due and when their lease runs out. Claims move an ID
+    from one to the other in a WATCH/MULTI transaction, so two workers never claim
+    the same job.
+    """
+
+    READY, LEASES, FAILED = "jobs:ready", "jobs:leases", "jobs:failed"
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.enqueued = threading.Event()
+
+    def enqueue(self, name, payload, key=None, max_attempts=MAX_ATTEMPTS, delay=0):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        if key is not None and not self.redis.set(f"jobs:key:{key}", job_id, nx=True, ex=RETENTION):
+            existing = self.redis.get(f"jobs:key:{key}").decode()
+            if self.redis.exists(f"jobs:{existing}"):
+                jobs_enqueued_total.labels(name, "duplicate").inc()
+                return existing
+            # The enqueue that took the key never stored its job
+            self.redis.set(f"jobs:key:{key}", job_id, ex=RETENTION)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(f"jobs:{job_id}", mapping={
+                "task": name, "payload": json.dumps(payload), "status": "queued",
+                "attempts": 0, "max_attempts": max_attempts, "created_at": now,
+            })
+            pipe.zadd(self.READY, {job_id: now + delay})
+            pipe.execute()
+        jobs_enqueued_total.labels(name, "new").inc()
+        self.enqueued.set()
+        return job_id
+
+    def requeue_expired(self, now):
+        for job_id in self.redis.zrangebyscore(self.LEASES, "-inf", now):
+            name, attempts, max_attempts = self.redis.hmget(f"jobs:{job_id.decode()}", "task", "attempts",
+                                                            "max_attempts")
+            exhausted = attempts is not None and int(attempts) >= int(max_attempts)
+            with self.redis.pipeline() as pipe:
+                pipe.zrem(self.LEASES, job_id)
+                if exhausted:
+                    pipe.hset(f"jobs:{job_id.decode()}", mapping={"status": "failed", "last_error": LEASE_EXPIRED,
+                                                                  "finished_at": now})
+                    pipe.zadd(self.FAILED, {job_id: now})
+                else:
+                    pipe.zadd(self.READY, {job_id: now})
+                    pipe.hset(f"jobs:{job_id.decode()}", "status", "queued")
+                removed = pipe.execute()[0]
+            # Only the worker whose ZREM took the lease records the failure
+            if exhausted and removed:
+                gave_up(job_id.decode(), name.decode())
+
+    def claim(self, lease=LEASE_SECONDS):
+        now = time.time()
+        self.requeue_expired(now)
+        claimed = []
+
+        def take(pipe):
+            due = pipe.zrangebyscore(self.READY, "-inf", now, start=0, num=1)
+            claimed[:] = due
+            if not due:
+                return
+            pipe.multi()
+            pipe.zrem(self.READY, due[0])
+            pipe.zadd(self.LEASES, {due[0]: now + lease})
+            pipe.hset(f"jobs:{due[0].decode()}", "status", "running")
+            pipe.hincrby(f"jobs:{due[0].decode()}", "attempts", 1)
+
+        # Retried when another worker changed the ready set in between
+        self.redis.transaction(take, self.READY)
+        if not claimed:
+            return None
+        job_id = claimed[0].decode()
+        fields = {k.decode(): v.decode() for k, v in self.redis.hgetall(f"jobs:{job_id}").items()}
+        return Job(job_id, fields["task"], json.loads(fields["payload"]), int(fields["attempts"]),
+                   int(fields["max_attempts"]))
+
+    def complete(self, job):
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(self.LEASES, job.id)
+            pipe.hset(f"jobs:{job.id}", mapping={"status": "done", "finished_at": time.time()})
+            pipe.expire(f"jobs:{job.id}", RETENTION)
+            pipe.execute()
+
+    def fail(self, job, error, retry_at=None):
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(self.LEASES, job.id)
+            if retry_at is None:
+                pipe.hset(f"jobs:{job.id}", mapping={"status": "failed", "last_error": error,
+                                                     "finished_at": time.time()})
+                pipe.zadd(self.FAILED, {job.id: time.time()})
+            else:
+                pipe.hset(f"jobs:{job.id}", mapping={"status": "queued", "last_error": error})
+                pipe.zadd(self.READY, {job.id: retry_at})
+            pipe.execute()
+
+    def release(self, job):
+        with self.redis.pipeline() as pipe:
+            pipe.zrem(self.LEASES, job.id)
+            pipe.zadd(self.READY, {job.id: time.time()})
+            pipe.hset(f"jobs:{job.id}", "status", "queued")
+            pipe.hincrby(f"jobs:{job.id}", "attempts", -1)
+            pipe.execute()
+
+    def stats(self):
+        return {"queued": self.redis.zcard(self.READY), "running": self.redis.zcard(self.LEASES),
+                "failed": self.redis.zcard(self.FAILED)}
+
+    def purge(self, older_than=RETENTION):
+        # Finished jobs expire by themselves; only the failed index needs trimming
+        cutoff = time.time() - older_than
+        for job_id in self.redis.zrangebyscore(self.FAILED, "-inf", cutoff):
+            self.redis.expire(f"jobs:{job_id.decode()}", 1)
+        return self.redis.zremrangebyscore(self.FAILED, "-inf", cutoff)
+
+
+def queue_from_env(url=JOBS_URL):
+    if url.startswith("sqlite:///"):
+        return SQLiteQueue(url[len("sqlite:///"):])
+    if url.startswith("memory://"):
+        import fakeredis
+        return RedisQueue(fakeredis.FakeRedis())
+    import redis
+    return RedisQueue(redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=2))
+
+
+class WorkerPool:
+    """Threads that claim and run jobs until stop()"""
+
+    def __init__(self, queue, size=WORKERS, poll_interval=POLL_INTERVAL, lease=LEASE_SECONDS):
+        self.queue = queue
+        self.size = size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(target=self.run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self, timeout=10):
+        """Let running jobs finish, then return; jobs claimed after this are handed back"""
+        self.stopping.set()
+        self.queue.enqueued.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                job = self.queue.claim(self.lease)
+            except Exception:
+                logger.exception("claiming a job failed")
+                job = None
+            if job is None:
+                # Woken early when this process enqueues something
+                self.queue.enqueued.wait(self.poll_interval)
+                self.queue.enqueued.clear()
+                continue
+            if self.stopping.is_set():
+                self.queue.release(job)
+                break
+            self.execute(job)
+
+    def execute(self, job):
+        handler = TASKS.get(job.task)
+        started = time.perf_counter()
+        jobs_running.inc()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for task {job.task!r}")
+            handler(**job.payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job.attempts < job.max_attempts:
+                delay = backoff(job.attempts)
+                logger.warning("job %s (%s) attempt %d failed, retrying in %.1fs: %s",
+                               job.id, job.task, job.attempts, delay, error)
+                self.queue.fail(job, error, time.time() + delay)
+                jobs_finished_total.labels(job.task, "retried").inc()
+            else:
+                logger.error("job %s (%s) failed after %d attempts: %s", job.id, job.task, job.attempts, error)
+                self.queue.fail(job, error)
+                jobs_finished_total.labels(job.task, "failed").inc()
+        else:
+            self.queue.complete(job)
+            jobs_finished_total.labels(job.task, "done").inc()
+        finally:
+            jobs_running.dec()
+            job_duration_seconds.labels(job.task).observe(time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run or inspect background jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker_parser = sub.add_parser("worker", help="claim and run jobs until interrupted")
+    worker_parser.add_argument("--workers", type=int, default=max(WORKERS, 1))
+    worker_parser.add_argument("--tasks", default="tasks", help="module that registers the handlers")
+    sub.add_parser("stats", help="jobs per status")
+    sub.add_parser("purge", help="drop finished jobs older than JOB_RETENTION")
+    args = parser.parse_args(argv)
+
+    queue = queue_from_env()
+    if args.command == "stats":
+        print(json.dumps(queue.stats()))
+    elif args.command == "purge":
+        print(f"{queue.purge()} job(s) purged")
+    else:
+        logging.basicConfig(level=logging.INFO)
+        importlib.import_module(args.tasks)
+        pool = WorkerPool(queue, args.workers).start()
+        # docker stop sends SIGTERM: finish the running jobs, hand back the rest
+        signal.signal(signal.SIGTERM, lambda *_: pool.stopping.set())
+        try:
+            while not pool.stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
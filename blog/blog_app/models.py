@@ -1,10 +1,15 @@
-from sqlmodel import SQLModel, Field, create_engine
+from sqlalchemy import BigInteger, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlmodel import SQLModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-# Define the database URL - SQLite database named 'blog.db'
-DATABASE_URL = "sqlite:///blog.db"
-engine = create_engine(DATABASE_URL, echo=True)
+# Engines are configured from the environment in database.py
+from database import engine, engines
+
+# A post's image_path: a file directly in static/uploads, named as tasks.upload_name()
+# names them. Empty is allowed, as the editor sends it for a post without an image
+IMAGE_PATH_PATTERN = r"^(/static/uploads/[A-Za-z0-9_-][A-Za-z0-9._-]*)?$"
 
 class BlogPost(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -14,6 +19,56 @@ class BlogPost(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     image_path: Optional[str] = None
     is_published: bool = Field(default=False)
+    # Bumped by every write; it's the post's ETag (see patches.py)
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+    # Derived from content on every write (see rendering.py); pages read these as they are
+    content_html: Optional[str] = None
+    excerpt: Optional[str] = None
+    word_count: Optional[int] = None
+    reading_minutes: Optional[int] = None
+    render_version: Optional[int] = None
+
+# Everything a row of the admin posts table shows (partials/post_row.html). Pages that
+# render after their session has closed load exactly these: any other attribute
+# would need the session to load it
+ROW_COLUMNS = (BlogPost.id, BlogPost.title, BlogPost.excerpt, BlogPost.image_path,
+               BlogPost.created_at, BlogPost.is_published)
+
+class PostPatch(SQLModel):
+    """Body of PATCH /admin/posts/{id}: only the fields being changed"""
+    title: Optional[str] = None
+    content: Optional[str] = None
+    # Quill-style ops against the stored content, instead of the whole content
+    delta: Optional[List[dict]] = None
+    image_path: Optional[str] = None
+
+class Draft(SQLModel, table=True):
+    """Links a client-generated draft ID to the post its autosaves upsert"""
+    draft_id: str = Field(primary_key=True, max_length=64)
+    post_id: int = Field(index=True)
+    content_hash: str
+    # The editor's save counter (or arrival time in ns); older revisions never overwrite newer ones
+    revision: int = Field(default=0, sa_type=BigInteger)
+    saved_at: datetime = Field(default_factory=datetime.utcnow)
+
+def add_missing_columns(db_engine):
+    # create_all only creates missing tables; columns added to a model since go in here
+    inspector = inspect(db_engine)
+    with db_engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=db_engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+    SQLModel.metadata.create_all(engine)
+    add_missing_columns(engine)
+    # A real replica gets its schema through replication; SQLite stand-ins need it created
+    for replica in engines[1:]:
+        if replica.dialect.name == "sqlite":
+            SQLModel.metadata.create_all(replica)
+            add_missing_columns(replica)
@@ -0,0 +1,207 @@
+"""Write-time processing of post content.
+
+Posts are stored as the HTML the editors produced. Every write also stores what
+the pages need, derived from it once:
+
+    content_html      the content sanitized against an allowlist of tags and attributes
+    excerpt           plain-text start of the post, for the dashboards
+    word_count, reading_minutes
+    render_version    RENDER_VERSION at the time; bump it when the rules change
+
+The index and dashboards render those columns as they are, with no HTML processing
+on reads. Rows written before these columns existed, or under an older
+RENDER_VERSION, are processed in batches by the backfill:
+
+    python rendering.py                  # all stale rows, 500 per transaction
+    python rendering.py --batch-size 100
+
+`python app.py` runs the backfill once before the workers start.
+"""
+import argparse
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from sqlalchemy import bindparam, or_, update
+from sqlmodel import Session, select
+
+from models import BlogPost
+
+RENDER_VERSION = 1
+EXCERPT_LENGTH = 160
+WORDS_PER_MINUTE = 200
+
+ALLOWED_TAGS = {
+    "a", "b", "blockquote", "br", "code", "div", "em", "figcaption", "figure",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "li", "ol", "p", "pre",
+    "s", "span", "strike", "strong", "sub", "sup", "table", "tbody", "td", "th",
+    "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRIBUTES = {
+    "*": {"class", "title"},
+    "a": {"href", "target"},
+    "img": {"alt", "height", "src", "width"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan"},
+}
+URL_ATTRIBUTES = {"href", "src"}
+VOID_TAGS = {"br", "hr", "img"}
+# Dropped together with everything inside them
+DROPPED_TAGS = {"script", "style", "iframe", "object", "embed", "template", "noscript", "textarea", "select"}
+# Text on either side of these reads as separate words
+BLOCK_TAGS = {"blockquote", "br", "div", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6",
+              "hr", "li", "p", "pre", "td", "th", "tr"}
+
+SAFE_URL = re.compile(r"^(https?:|mailto:|/|#|\./|[^:/?#]*(?:[/?#]|$))", re.IGNORECASE)
+# Quill embeds pasted images as data URLs
+DATA_IMAGE = re.compile(r"^data:image/(png|jpeg|gif|webp);base64,", re.IGNORECASE)
+
+
+def safe_url(tag, value):
+    value = value.strip()
+    if tag == "img" and DATA_IMAGE.match(value):
+        return True
+    # Browsers ignore control characters and whitespace inside a scheme ("java\tscript:")
+    return bool(SAFE_URL.match(re.sub(r"[\x00-\x20]", "", value)))
+
+
+class Sanitizer(HTMLParser):
+    """Rebuilds HTML from allowed tags and attributes, collecting the plain text as it goes"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html = []
+        self.text = []
+        self.open = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+        if tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRIBUTES["*"] | ALLOWED_ATTRIBUTES.get(tag, set())
+        kept = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not safe_url(tag, value):
+                continue
+            kept.append(f' {name}="{escape(value)}"')
+        if tag == "a" and any(name == "target" for name, _ in attrs):
+            # A link that opens a new tab must not get a handle on this one
+            kept.append(' rel="noopener noreferrer"')
+        self.html.append(f"<{tag}{''.join(kept)}>")
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and tag not in DROPPED_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(" ")
+        if tag not in self.open:
+            return
+        # Close whatever was left open inside it, so the output stays well nested
+        while self.open:
+            current = self.open.pop()
+            self.html.append(f"</{current}>")
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.html.append(escape(data, quote=False))
+        self.text.append(data)
+
+    def result(self):
+        self.close()
+        html = "".join(self.html) + "".join(f"</{tag}>" for tag in reversed(self.open))
+        return html, " ".join("".join(self.text).split())
+
+
+def excerpt(text, length=EXCERPT_LENGTH):
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(" ", 1)[0] or text[:length]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+def prerender(content):
+    """The derived columns for this content"""
+    sanitizer = Sanitizer()
+    sanitizer.feed(content or "")
+    html, text = sanitizer.result()
+    words = len(text.split())
+    return {
+        "content_html": html,
+        "excerpt": excerpt(text),
+        "word_count": words,
+        "reading_minutes": max(1, math.ceil(words / WORDS_PER_MINUTE)) if words else 0,
+        "render_version": RENDER_VERSION,
+    }
+
+
+def apply(post):
+    for name, value in prerender(post.content).items():
+        setattr(post, name, value)
+    return post
+
+
+def backfill(db_engine, batch_size=500):
+    """Process stale rows in id order, a batch per transaction; returns how many were processed"""
+    stale = or_(BlogPost.render_version.is_(None), BlogPost.render_version < RENDER_VERSION)
+    # Only if the post wasn't edited in the meantime; an edit renders it anyway
+    statement = (
+        update(BlogPost.__table__)
+        .where(BlogPost.id == bindparam("row_id"), BlogPost.version == bindparam("row_version"))
+        .values({name: bindparam(f"new_{name}") for name in prerender("")})
+    )
+    last_id, processed = 0, 0
+    while True:
+        with Session(db_engine) as session:
+            rows = session.exec(
+                select(BlogPost.id, BlogPost.version, BlogPost.content)
+                .where(stale, BlogPost.id > last_id)
+                .order_by(BlogPost.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return processed
+            params = [{"row_id": row_id, "row_version": version,
+                       **{f"new_{name}": value for name, value in prerender(content).items()}}
+                      for row_id, version, content in rows]
+            session.execute(statement, params)
+            session.commit()
+        last_id = rows[-1][0]
+        processed += len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render stored post content into the derived columns")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    from database import engine
+    from models import create_db_and_tables
+    create_db_and_tables()
+    print(f"{backfill(engine, args.batch_size)} post(s) rendered")
+
+
+if __name__ == "__main__":
+    main()
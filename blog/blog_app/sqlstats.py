@@ -0,0 +1,135 @@
+"""SQL query instrumentation built on SQLAlchemy engine events.
+
+Every statement is counted and timed into Prometheus metrics. Per request we
+track the query count, total DB time and the slowest statements, log statements
+slower than SLOW_QUERY_MS, and warn when one statement repeats N_PLUS_ONE_THRESHOLD
+or more times in a request (the usual N+1 pattern).
+
+In tests, fail a route that runs too many queries:
+
+    with sqlstats.assert_max_queries(1):
+        client.get("/")
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+KEEP_SLOWEST = 5
+
+logger = logging.getLogger("sqlstats")
+
+db_queries_total = Counter("db_queries_total", "SQL statements executed", ["operation"])
+db_query_seconds = Histogram("db_query_seconds", "SQL statement execution time", ["operation"])
+db_slow_queries_total = Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS")
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "SQL statements per HTTP request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+db_seconds_per_request = Histogram("db_seconds_per_request", "SQL time per HTTP request", ["route"])
+db_n_plus_one_total = Counter("db_n_plus_one_total", "Requests that repeated one statement too often", ["route"])
+
+current_tracker = ContextVar("current_sql_tracker", default=None)
+# Trackers opened with capture_queries(); they see statements from every thread
+captures = []
+captures_lock = threading.Lock()
+
+
+class QueryTracker:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = {}
+        self.slowest = []
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+        self.slowest.append((seconds, statement))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[KEEP_SLOWEST:]
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        return {s: n for s, n in self.statements.items() if n >= threshold}
+
+
+def operation(statement):
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        # Per statement, so a failed one can't shift the timings of the ones after it
+        context._sqlstats_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context._sqlstats_started
+        op = operation(statement)
+        db_queries_total.labels(op).inc()
+        db_query_seconds.labels(op).observe(seconds)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            db_slow_queries_total.inc()
+            logger.warning("slow query (%.1f ms): %s", seconds * 1000, " ".join(statement.split()))
+        tracker = current_tracker.get()
+        if tracker is not None:
+            tracker.record(statement, seconds)
+        if captures:
+            with captures_lock:
+                for capture in captures:
+                    capture.record(statement, seconds)
+
+
+def finish_request(tracker, route):
+    db_queries_per_request.labels(route).observe(tracker.count)
+    db_seconds_per_request.labels(route).observe(tracker.seconds)
+    repeated = tracker.repeated()
+    if repeated:
+        db_n_plus_one_total.labels(route).inc()
+        for statement, count in repeated.items():
+            logger.warning("possible N+1 on %s: %d x %s", route, count, " ".join(statement.split()))
+
+
+def init_fastapi(app):
+    @app.middleware("http")
+    async def track_queries(request, call_next):
+        tracker = QueryTracker()
+        token = current_tracker.set(tracker)
+        try:
+            response = await call_next(request)
+        finally:
+            current_tracker.reset(token)
+        route = request.scope.get("route")
+        finish_request(tracker, getattr(route, "path", "unmatched"))
+        return response
+
+
+@contextmanager
+def capture_queries():
+    """Collect every statement run (from any thread) while the block is active"""
+    tracker = QueryTracker()
+    with captures_lock:
+        captures.append(tracker)
+    try:
+        yield tracker
+    finally:
+        with captures_lock:
+            captures.remove(tracker)
+
+
+@contextmanager
+def assert_max_queries(limit):
+    with capture_queries() as tracker:
+        yield tracker
+    if tracker.count > limit:
+        statements = "\n".join(f"  {n} x {' '.join(s.split())}" for s, n in tracker.statements.items())
+        raise AssertionError(f"expected at most {limit} queries, ran {tracker.count}:\n{statements}")
@@ -0,0 +1,120 @@
+# Copied into every app that uses it; after editing, run: python bench/sync_shared.py --from <this app>
+"""Warmup before readiness.
+
+Work a fresh process would otherwise do on its first requests (building data
+pools, compiling templates, opening connections, filling caches) runs as named
+warmup steps. /livez answers as soon as the process serves requests; /readyz
+answers 503 until every step has run, then 200 with the time each one took.
+
+    WARMUP   0 skips the steps, so readiness flips immediately (default 1)
+
+Flask apps warm synchronously in init_flask(). Under gunicorn --preload that
+happens once in the master before the workers fork, so every worker starts warm.
+FastAPI apps call warmup.start() from their lifespan and warm in the background
+while /livez already answers.
+
+Import-time profiles and the startup benchmark live in bench/startup.py.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from prometheus_client import Gauge
+
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+
+log = logging.getLogger("startup")
+warmup_seconds = Gauge("warmup_seconds", "Time spent in each warmup step", ["step"])
+
+
+class Warmup:
+    """Named steps run once before the process reports ready; async steps are awaited"""
+
+    def __init__(self, steps):
+        self.steps = list(steps) if WARMUP else []
+        self.timings = {}
+        self.errors = {}
+        self.done = threading.Event()
+        self.task = None
+
+    def record(self, name, started, error=None):
+        elapsed = time.perf_counter() - started
+        warmup_seconds.labels(name).set(elapsed)
+        self.timings[name] = round(elapsed * 1000, 1)
+        if error is not None:
+            # A failed step only means a colder first request, so the process still becomes ready
+            log.warning("warmup step %s failed: %s", name, error)
+            self.errors[name] = str(error)
+
+    def run(self):
+        for name, step in self.steps:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.record(name, started, e)
+            else:
+                self.record(name, started)
+        self.done.set()
+
+    async def run_async(self):
+        for name, step in self.steps:
+            started = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(step):
+                    await step()
+                else:
+                    await asyncio.to_thread(step)
+            except Exception as e:
+                self.record(name, started, e)
+            else:
+                self.record(name, started)
+        self.done.set()
+
+    def start(self):
+        """Run the steps in the background of the running event loop"""
+        self.task = asyncio.get_running_loop().create_task(self.run_async())
+        return self.task
+
+    def status(self):
+        ready = self.done.is_set()
+        body = {"status": "ready" if ready else "warming up", "ready": ready,
+                "warmup_ms": self.timings, "errors": self.errors}
+        return body, 200 if ready else 503
+
+
+def init_flask(app, steps):
+    from flask import jsonify
+
+    warmup = Warmup(steps)
+
+    @app.route("/livez")
+    def livez():
+        return jsonify({"status": "alive"})
+
+    @app.route("/readyz")
+    def readyz():
+        body, status = warmup.status()
+        return jsonify(body), status
+
+    warmup.run()
+    return warmup
+
+
+def init_fastapi(app, steps):
+    from fastapi.responses import JSONResponse
+
+    warmup = Warmup(steps)
+
+    @app.get("/livez", include_in_schema=False)
+    async def livez():
+        return {"status": "alive"}
+
+    @app.get("/readyz", include_in_schema=False)
+    async def readyz():
+        body, status = warmup.status()
+        return JSONResponse(body, status_code=status)
+
+    return warmup
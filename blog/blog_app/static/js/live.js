@@ -0,0 +1,58 @@
+// Live updates over Server-Sent Events (see events.py); post events need the admin stream
+function liveEvents(handlers, url = '/events') {
+    const source = new EventSource(url);
+    Object.entries(handlers).forEach(([event, handle]) => {
+        source.addEventListener(event, e => handle(JSON.parse(e.data)));
+    });
+    // This page fell behind and missed changes; start over from what the server has now
+    source.addEventListener('resync', () => location.reload());
+    return source;
+}
+
+// Draws the posts-by-status doughnut, or updates it in place once it exists
+function drawChart(canvasId, stats) {
+    const values = [stats.published, stats.drafts];
+    const canvas = document.getElementById(canvasId);
+    if (window.chartInstance && window.chartInstance.canvas === canvas) {
+        window.chartInstance.data.datasets[0].data = values;
+        window.chartInstance.update();
+        return;
+    }
+    if (window.chartInstance) {
+        window.chartInstance.destroy();
+    }
+    window.chartInstance = new Chart(canvas.getContext('2d'), {
+        type: 'doughnut',
+        data: {
+            labels: ['Published', 'Drafts'],
+            datasets: [{
+                data: values,
+                backgroundColor: [
+                    'rgba(75, 192, 192, 0.8)',
+                    'rgba(255, 206, 86, 0.8)'
+                ],
+                borderColor: [
+                    'rgba(75, 192, 192, 1)',
+                    'rgba(255, 206, 86, 1)'
+                ],
+                borderWidth: 1
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            plugins: {
+                legend: {
+                    position: 'bottom'
+                },
+                title: {
+                    display: true,
+                    text: 'Blog Posts Status',
+                    font: {
+                        size: 16
+                    }
+                }
+            }
+        }
+    });
+}
@@ -33,7 +33,45 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    document.querySelector('form').onsubmit = function() {
+    // Autosave: debounced here, then buffered and written behind by the server
+    var form = document.querySelector('form');
+    var draftId = sessionStorage.getItem('draft_id');
+    if (!draftId) {
+        draftId = Date.now().toString(36) + Math.random().toString(36).slice(2);
+        sessionStorage.setItem('draft_id', draftId);
+    }
+    var autosaveTimer = null;
+
+    function draftFields(data) {
+        var title = form.querySelector('[name=title]');
+        data.set('title', title ? title.value : '');
+        data.set('content', quill.root.innerHTML);
+        data.set('image_path', document.getElementById('image_path').value);
+        // Milliseconds keep increasing across reloads, so the server can drop stale saves
+        data.set('revision', Date.now());
+        return data;
+    }
+
+    function scheduleAutosave() {
+        clearTimeout(autosaveTimer);
+        autosaveTimer = setTimeout(function() {
+            fetch('/drafts/' + draftId, { method: 'POST', body: draftFields(new FormData()) });
+        }, 2000);
+    }
+
+    quill.on('text-change', scheduleAutosave);
+    form.addEventListener('input', scheduleAutosave);
+
+    form.onsubmit = function() {
+        clearTimeout(autosaveTimer);
         document.getElementById('content').value = quill.root.innerHTML;
+        ['draft_id', 'revision'].forEach(function(name) {
+            var input = form.querySelector('[name=' + name + ']') || form.appendChild(document.createElement('input'));
+            input.type = 'hidden';
+            input.name = name;
+            input.value = name === 'draft_id' ? draftId : Date.now();
+        });
+        // The next post gets a fresh draft
+        sessionStorage.removeItem('draft_id');
     };
 });
\ No newline at end of file
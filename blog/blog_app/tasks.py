@@ -0,0 +1,85 @@
+"""Post-processing the admin routes hand to the job queue (see jobs.py).
+
+Handlers run in worker threads, possibly in a `python jobs.py worker` process,
+and may run more than once, so each one checks what is already done. With several
+replicas, STAGING_DIR and static/uploads must be on storage they all share.
+
+The routes write every change to a post themselves, so the ETag they return stays
+current; jobs only move files. When a job's result shows on the dashboards, it
+reports the post through on_change, which app.py points at its announce() for the
+workers it runs. A `python jobs.py worker` process has no dashboards to tell, so
+those pick the change up on their next event or reload.
+"""
+import logging
+import os
+import re
+import secrets
+
+from sqlmodel import Session, select
+
+import jobs
+from database import engine
+from models import IMAGE_PATH_PATTERN, BlogPost
+
+UPLOAD_DIR = os.path.join("static", "uploads")
+# Uploads are written here by the request; on the same filesystem as UPLOAD_DIR,
+# so moving one into place is a rename
+STAGING_DIR = "uploads-incoming"
+
+logger = logging.getLogger("tasks")
+
+# Called as on_change(action, post_id) from the worker thread
+on_change = None
+
+
+def changed(action, post_id):
+    if on_change is not None:
+        on_change(action, post_id)
+
+
+def upload_name(filename):
+    """A client's file name, made safe to use directly in UPLOAD_DIR"""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or "")).lstrip(".")
+    return name or secrets.token_hex(8)
+
+
+def static_file(image_path):
+    """/static/uploads/x.png -> static/uploads/x.png; only the file name is kept"""
+    return os.path.join(UPLOAD_DIR, os.path.basename(image_path))
+
+
+def in_upload_dir(path):
+    """Whether path, symlinks resolved, is a file directly in UPLOAD_DIR"""
+    return os.path.dirname(os.path.realpath(path)) == os.path.realpath(UPLOAD_DIR)
+
+
+@jobs.task("attach_image")
+def attach_image(post_id, staged, image_path, old_image_path=None):
+    """Move a staged upload into place and remove the image it replaces"""
+    target = static_file(image_path)
+    if os.path.exists(staged):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        os.replace(staged, target)
+    elif not os.path.exists(target):
+        raise FileNotFoundError(staged)
+    with Session(engine) as session:
+        current = session.exec(select(BlogPost.image_path).where(BlogPost.id == post_id)).first()
+    if current != image_path:
+        # The post was deleted, or given another image, before this one was in place
+        delete_file(target)
+    else:
+        changed("updated", post_id)
+    if old_image_path and old_image_path != image_path:
+        delete_file(static_file(old_image_path))
+
+
+@jobs.task("delete_file")
+def delete_file(path):
+    if not in_upload_dir(path):
+        # Never retried: the path won't get any safer
+        logger.warning("not deleting %s: it is outside %s", path, UPLOAD_DIR)
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,31 @@
+"""Run from blog/blog_app/: python -m pytest tests
+after pip install -r requirements-test.txt (pytest, httpx for TestClient, and
+fakeredis for the memory:// Redis the tests use).
+
+The app's modules import each other by bare name, so put blog_app/ on the path.
+Databases point at a scratch directory so the checked-in blog.db is never touched.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCRATCH = tempfile.mkdtemp(prefix="blog-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{SCRATCH}/blog.db"
+os.environ["JOBS_URL"] = f"sqlite:///{SCRATCH}/jobs.db"
+os.environ.pop("REPLICA_DATABASE_URL", None)
+os.environ.pop("REDIS_URL", None)
+
+import pytest  # noqa: E402
+
+ADMIN = ("admin", "password")
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import app
+    with TestClient(app.app) as client:
+        yield client
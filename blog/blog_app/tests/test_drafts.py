@@ -0,0 +1,66 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+import drafts
+from models import BlogPost, Draft
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/drafts.db")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def stored(engine, draft_id):
+    with Session(engine) as session:
+        draft = session.get(Draft, draft_id)
+        post = session.get(BlogPost, draft.post_id)
+        return draft.revision, post.content
+
+
+def test_saves_coalesce_into_one_write(engine):
+    buffer = drafts.DraftBuffer(engine)
+    assert buffer.save("d1", "T", "one", revision=1)[0] == "buffered"
+    assert buffer.save("d1", "T", "two", revision=2)[0] == "coalesced"
+    assert buffer.save("d1", "T", "two", revision=3)[0] == "unchanged"
+    post_ids, stale = buffer.flush()
+    assert stale == set()
+    assert stored(engine, "d1") == (2, "two")
+    with Session(engine) as session:
+        assert session.get(BlogPost, post_ids["d1"]).excerpt == "two"
+
+
+def test_saves_without_a_revision_use_milliseconds(engine):
+    buffer = drafts.DraftBuffer(engine)
+    buffer.save_now("d1", "T", "server stamped")
+    revision, _ = stored(engine, "d1")
+    # Same unit as the editor's Date.now(), so its next save still wins
+    editor_revision = revision + 1500
+    assert buffer.save_now("d1", "T", "from the editor", revision=editor_revision) is not None
+    assert stored(engine, "d1") == (editor_revision, "from the editor")
+
+
+def test_stale_saves_are_refused(engine):
+    buffer = drafts.DraftBuffer(engine)
+    buffer.save_now("d1", "T", "newer", revision=200)
+    assert buffer.save("d1", "T", "older", revision=100)[0] == "stale"
+    with pytest.raises(drafts.StaleRevision):
+        buffer.save_now("d1", "T", "older", revision=100)
+    assert stored(engine, "d1") == (200, "newer")
+
+
+def test_a_save_older_than_another_workers_is_reported_at_flush(engine):
+    this_worker, other_worker = drafts.DraftBuffer(engine), drafts.DraftBuffer(engine)
+    this_worker.save_now("d1", "T", "first", revision=100)
+    other_worker.save_now("d1", "T", "newest", revision=300)
+    assert this_worker.save("d1", "T", "late", revision=200)[0] == "buffered"
+    assert this_worker.flush() == ({"d1": stored_post_id(engine, "d1")}, {"d1"})
+    with pytest.raises(drafts.StaleRevision):
+        this_worker.save_now("d1", "T", "late again", revision=250)
+    assert stored(engine, "d1") == (300, "newest")
+
+
+def stored_post_id(engine, draft_id):
+    with Session(engine) as session:
+        return session.get(Draft, draft_id).post_id
@@ -0,0 +1,42 @@
+import asyncio
+
+import events
+from conftest import ADMIN
+
+
+def test_streams_get_only_the_events_they_subscribed_to():
+    async def run():
+        broadcaster = events.Broadcaster(heartbeat=0.05)
+        public = broadcaster.stream({"stats"})
+        admin = broadcaster.stream({"stats", "post"})
+        # Past the retry line, which registers each stream
+        assert (await public.__anext__()).startswith(b"retry:")
+        assert (await admin.__anext__()).startswith(b"retry:")
+        await broadcaster.publish("post", {"id": 1, "row": "<tr>draft</tr>"})
+        await broadcaster.publish("stats", {"published": 1, "drafts": 1})
+        assert await public.__anext__() == events.encode("stats", {"published": 1, "drafts": 1})
+        assert await admin.__anext__() == events.encode("post", {"id": 1, "row": "<tr>draft</tr>"})
+        assert await admin.__anext__() == events.encode("stats", {"published": 1, "drafts": 1})
+        await broadcaster.stop()
+        for stream in (public, admin):
+            await stream.aclose()
+        assert broadcaster.clients == {}
+
+    asyncio.run(run())
+
+
+def test_a_slow_client_gets_one_resync():
+    async def run():
+        broadcaster = events.Broadcaster(queue_size=2)
+        stream = broadcaster.stream({"stats"})
+        await stream.__anext__()
+        for n in range(3):
+            await broadcaster.publish("stats", {"published": n, "drafts": 0})
+        assert await stream.__anext__() == events.RESYNC
+        await stream.aclose()
+
+    asyncio.run(run())
+
+
+def test_the_admin_stream_needs_an_admin(client):
+    assert client.get("/admin/events").status_code == 401
@@ -0,0 +1,74 @@
+import time
+
+import fakeredis
+import pytest
+
+import jobs
+
+
+@jobs.task("test_job")
+def job_handler(fail):
+    if fail:
+        raise RuntimeError("boom")
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def queue(request, tmp_path):
+    if request.param == "sqlite":
+        return jobs.SQLiteQueue(str(tmp_path / "jobs.db"))
+    return jobs.RedisQueue(fakeredis.FakeRedis())
+
+
+@pytest.fixture
+def later(monkeypatch):
+    """Claim as if `seconds` had passed"""
+    def claim(queue, seconds):
+        now = time.time() + seconds
+        monkeypatch.setattr(jobs.time, "time", lambda: now)
+        try:
+            return queue.claim(lease=60)
+        finally:
+            monkeypatch.undo()
+    return claim
+
+
+def test_idempotency_key_enqueues_once(queue):
+    first = queue.enqueue("test_job", {"fail": False}, key="once")
+    assert queue.enqueue("test_job", {"fail": False}, key="once") == first
+    assert queue.claim().id == first
+    assert queue.claim() is None
+
+
+def test_failed_jobs_retry_after_a_backoff_then_fail(queue, later):
+    job_id = queue.enqueue("test_job", {"fail": True}, max_attempts=2)
+    pool = jobs.WorkerPool(queue, size=0)
+    pool.execute(queue.claim())
+    assert queue.claim() is None
+    job = later(queue, jobs.BACKOFF_MAX + 1)
+    assert (job.id, job.attempts) == (job_id, 2)
+    pool.execute(job)
+    assert later(queue, 10 * jobs.BACKOFF_MAX) is None
+    assert queue.stats()["failed"] == 1
+
+
+def test_an_expired_lease_is_claimed_again(queue, later):
+    job_id = queue.enqueue("test_job", {"fail": False})
+    assert queue.claim(lease=60).id == job_id
+    assert queue.claim() is None
+    job = later(queue, 61)
+    assert (job.id, job.attempts) == (job_id, 2)
+
+
+def test_a_job_whose_worker_died_on_its_last_attempt_fails(queue, later):
+    queue.enqueue("test_job", {"fail": False}, max_attempts=1)
+    assert queue.claim(lease=60) is not None
+    assert later(queue, 61) is None
+    assert later(queue, 120) is None
+    assert queue.stats()["failed"] == 1
+
+
+def test_release_hands_a_job_back_without_an_attempt(queue):
+    job_id = queue.enqueue("test_job", {"fail": False})
+    queue.release(queue.claim())
+    job = queue.claim()
+    assert (job.id, job.attempts) == (job_id, 1)
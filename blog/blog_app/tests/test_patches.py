@@ -0,0 +1,125 @@
+import os
+
+import pytest
+from sqlalchemy import literal, select
+from sqlmodel import Session, create_engine
+
+import app
+import patches
+import rendering
+import tasks
+from conftest import ADMIN
+from database import engine
+from models import BlogPost
+
+
+@pytest.fixture(scope="module")
+def connection():
+    with create_engine("sqlite://").connect() as connection:
+        yield connection
+
+
+def apply(connection, content, ops):
+    expression, spans = patches.delta_expression(literal(content), ops)
+    return connection.execute(select(expression)).scalar(), spans
+
+
+def test_delta_applies_retain_delete_insert(connection):
+    ops = [{"retain": 6}, {"delete": 5}, {"insert": "<b>there</b>"}]
+    assert apply(connection, "Hello world!", ops) == ("Hello <b>there</b>!", 11)
+
+
+def test_delta_counts_code_points(connection):
+    assert apply(connection, "héllo wörld", [{"retain": 7}, {"delete": 1}, {"insert": "o"}])[0] == "héllo world"
+
+
+@pytest.mark.parametrize("ops", [
+    [],
+    [{"retain": 0}],
+    [{"retain": True}],
+    [{"retain": 1, "delete": 1}],
+    [{"insert": {"image": "x.png"}}],
+    [{"retain": 1}] * (patches.MAX_DELTA_OPS + 1),
+])
+def test_bad_deltas_are_rejected(ops):
+    with pytest.raises(patches.DeltaError):
+        patches.delta_expression(literal(""), ops)
+
+
+@pytest.mark.parametrize("header, versions", [
+    ('"3"', {3}),
+    ('W/"3", "4"', {3, 4}),
+    ('"3", *', None),
+    ('"abc"', set()),
+])
+def test_if_match_versions(header, versions):
+    assert patches.if_match_versions(header) == versions
+
+
+def new_post():
+    with Session(engine) as session:
+        post = rendering.apply(BlogPost(title="T", content="<p>one</p>", is_published=False))
+        session.add(post)
+        session.commit()
+        return post.id
+
+
+@pytest.mark.parametrize("method", ["put", "patch"])
+def test_a_write_with_an_old_etag_gets_412(client, method):
+    post_id = new_post()
+    etag = client.get(f"/admin/posts/{post_id}", auth=ADMIN).headers["ETag"]
+
+    def save(content):
+        if method == "put":
+            return client.put(f"/admin/posts/{post_id}", data={"title": "T", "content": content},
+                              headers={"If-Match": etag}, auth=ADMIN)
+        return client.patch(f"/admin/posts/{post_id}", json={"content": content},
+                            headers={"If-Match": etag}, auth=ADMIN)
+
+    first = save("<p>first</p>")
+    assert first.status_code == 200
+    second = save("<p>second</p>")
+    assert second.status_code == 412
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert client.get(f"/admin/posts/{post_id}", auth=ADMIN).json()["content"] == "<p>first</p>"
+
+
+def test_put_to_a_missing_post_gets_404(client):
+    response = client.put("/admin/posts/999999", data={"title": "T", "content": "C"}, auth=ADMIN)
+    assert response.status_code == 404
+
+
+@pytest.fixture
+def queue_down(tmp_path, monkeypatch):
+    monkeypatch.setattr(tasks, "STAGING_DIR", str(tmp_path / "incoming"))
+    monkeypatch.setattr(tasks, "UPLOAD_DIR", str(tmp_path / "uploads"))
+
+    def enqueue(*args, **kwargs):
+        raise ConnectionError("queue unavailable")
+
+    monkeypatch.setattr(app.job_queue, "enqueue", enqueue)
+
+
+def put_image(client, post_id):
+    return client.put(f"/admin/posts/{post_id}", data={"title": "T", "content": "C"},
+                      files={"image": ("a.png", b"png")}, auth=ADMIN)
+
+
+def test_a_put_image_is_attached_when_the_queue_is_down(client, queue_down):
+    post_id = new_post()
+    assert put_image(client, post_id).status_code == 200
+    image_path = client.get(f"/admin/posts/{post_id}", auth=ADMIN).json()["image_path"]
+    assert os.listdir(tasks.UPLOAD_DIR) == [os.path.basename(image_path)]
+    assert os.listdir(tasks.STAGING_DIR) == []
+
+
+def test_a_committed_image_is_kept_when_attaching_it_fails(client, queue_down, monkeypatch):
+    def attach_image(**args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(tasks, "attach_image", attach_image)
+    post_id = new_post()
+    assert put_image(client, post_id).status_code == 500
+    image_path = client.get(f"/admin/posts/{post_id}", auth=ADMIN).json()["image_path"]
+    # The post points at it, so it stays staged for the job to be run again
+    assert os.listdir(tasks.STAGING_DIR) == [os.path.basename(image_path)]
@@ -0,0 +1,54 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+import rendering
+from models import BlogPost
+
+
+def sanitize(content):
+    return rendering.prerender(content)["content_html"]
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("<p>Hi <b>there</b></p>", "<p>Hi <b>there</b></p>"),
+    ("<p>a<script>alert(1)</script>b</p>", "<p>ab</p>"),
+    ('<img src="x.png" onerror="alert(1)">', '<img src="x.png">'),
+    ('<a href="javascript:alert(1)">x</a>', "<a>x</a>"),
+    ('<a href="java\tscript:alert(1)">x</a>', "<a>x</a>"),
+    ('<a href="/posts/1" target="_blank">x</a>', '<a href="/posts/1" target="_blank" rel="noopener noreferrer">x</a>'),
+    ('<img src="data:image/png;base64,AAAA">', '<img src="data:image/png;base64,AAAA">'),
+    ('<a href="data:text/html;base64,AAAA">x</a>', "<a>x</a>"),
+    ("<p><b>unclosed</p>", "<p><b>unclosed</b></p>"),
+    ("<p>open", "<p>open</p>"),
+    ("<marquee>kept text</marquee>", "kept text"),
+    ("1 &lt; 2", "1 &lt; 2"),
+    ('<p title="&quot;><script>">x</p>', '<p title="&quot;&gt;&lt;script&gt;">x</p>'),
+])
+def test_sanitizer(content, expected):
+    assert sanitize(content) == expected
+
+
+def test_text_columns():
+    content = "<h1>Title</h1><p>" + "word " * 400 + "</p><script>not counted</script>"
+    derived = rendering.prerender(content)
+    assert derived["word_count"] == 401
+    assert derived["reading_minutes"] == 3
+    assert derived["excerpt"].startswith("Title word word")
+    assert derived["excerpt"].endswith("…")
+    assert len(derived["excerpt"]) <= rendering.EXCERPT_LENGTH + 1
+    assert rendering.prerender("")["reading_minutes"] == 0
+
+
+def test_backfill_renders_stale_rows_only(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/render.db")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(BlogPost(title="old", content="<p>old <i>post</i></p>"))
+        session.add(rendering.apply(BlogPost(title="new", content="<p>new</p>")))
+        session.commit()
+    assert rendering.backfill(engine, batch_size=1) == 1
+    with Session(engine) as session:
+        old = session.get(BlogPost, 1)
+        assert (old.content_html, old.excerpt, old.render_version) == \
+            ("<p>old <i>post</i></p>", "old post", rendering.RENDER_VERSION)
+    assert rendering.backfill(engine) == 0
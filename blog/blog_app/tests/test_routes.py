@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from conftest import ADMIN
+
+
+@pytest.mark.parametrize("path", ["/drafts/abc", "/save"])
+def test_saving_drafts_needs_an_admin(client, path):
+    response = client.post(path, data={"title": "T", "content": "C", "draft_id": "abc"})
+    assert response.status_code == 401
+
+
+def test_stale_draft_saves_get_409(client):
+    assert client.post("/save", data={"title": "T", "content": "new", "draft_id": "r1", "revision": 200},
+                       auth=ADMIN).status_code == 200
+    assert client.post("/drafts/r1", data={"title": "T", "content": "old", "revision": 100},
+                       auth=ADMIN).status_code == 409
+    assert client.post("/save", data={"title": "T", "content": "old", "draft_id": "r1", "revision": 100},
+                       auth=ADMIN).status_code == 409
+
+
+@pytest.mark.parametrize("image_path", ["/static/../../app.py", "/static/uploads/../x.png", "/static/uploads/.."])
+def test_image_paths_outside_the_uploads_get_422(client, image_path):
+    assert client.post("/save", data={"title": "T", "content": "C", "image_path": image_path},
+                       auth=ADMIN).status_code == 422
+    assert client.post("/drafts/p1", data={"title": "T", "content": "C", "image_path": image_path},
+                       auth=ADMIN).status_code == 422
+    assert client.patch("/admin/posts/1", json={"image_path": image_path}, headers={"If-Match": '"1"'},
+                        auth=ADMIN).status_code == 422
+
+
+def test_uploads_are_named_inside_the_upload_dir(client):
+    response = client.post("/upload", files={"file": ("../../evil one.png", b"png")})
+    assert response.json() == {"url": "/static/uploads/evil_one.png"}
+    os.remove(os.path.join("static", "uploads", "evil_one.png"))
+
+
+def test_the_admin_dashboard_renders_rows_after_the_session_closes(client):
+    assert client.post("/save", data={"title": "Dashboard row", "content": "<p>text</p>"}, auth=ADMIN).status_code == 200
+    response = client.get("/admin/dashboard", auth=ADMIN)
+    assert response.status_code == 200
+    assert "Dashboard row" in response.text
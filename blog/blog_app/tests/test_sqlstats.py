@@ -0,0 +1,66 @@
+import itertools
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import sqlstats
+import timing
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    sqlstats.instrument_engine(engine)
+    return engine
+
+
+def test_failed_statements_leave_no_start_time_behind(engine, monkeypatch):
+    clock = itertools.count(0, 10)
+    monkeypatch.setattr(sqlstats.time, "perf_counter", lambda: next(clock))
+    with engine.connect() as conn, sqlstats.capture_queries() as tracker:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 1"))
+        assert not [key for key in conn.info if "started" in key]
+    # Only the statement that completed is recorded, timed from its own start
+    assert tracker.count == 1
+    assert tracker.seconds == 10
+
+
+def test_request_timer_gets_the_time_of_completed_statements_only(monkeypatch):
+    engine = create_engine("sqlite://")
+    timing.instrument_engine(engine)
+    clock = itertools.count(0, 10)
+    monkeypatch.setattr(timing.time, "perf_counter", lambda: next(clock))
+    timer = timing.RequestTimer()
+    token = timing.current_timer.set(timer)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+            conn.execute(text("SELECT 1"))
+    finally:
+        timing.current_timer.reset(token)
+    assert timer.counts == {"db": 1}
+    assert timer.phases == {"db": 10}
+
+
+def test_repeated_statements_are_flagged():
+    tracker = sqlstats.QueryTracker()
+    for _ in range(sqlstats.N_PLUS_ONE_THRESHOLD):
+        tracker.record("SELECT * FROM comment WHERE post_id = ?", 0.001)
+    tracker.record("SELECT * FROM post", 0.001)
+    assert tracker.repeated() == {"SELECT * FROM comment WHERE post_id = ?": sqlstats.N_PLUS_ONE_THRESHOLD}
+
+
+def test_assert_max_queries(engine):
+    with engine.connect() as conn:
+        with sqlstats.assert_max_queries(2):
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        with pytest.raises(AssertionError, match="expected at most 1 queries, ran 2"):
+            with sqlstats.assert_max_queries(1):
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+from sqlmodel import Session
+
+import tasks
+from database import engine
+from models import BlogPost, create_db_and_tables
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    """A scratch working directory with one staged upload"""
+    create_db_and_tables()
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(tasks.STAGING_DIR)
+    staged = os.path.join(tasks.STAGING_DIR, "new.png")
+    with open(staged, "wb") as f:
+        f.write(b"png")
+    announced = []
+    monkeypatch.setattr(tasks, "on_change", lambda action, post_id: announced.append((action, post_id)))
+    return staged, announced
+
+
+def new_post(image_path):
+    with Session(engine) as session:
+        post = BlogPost(title="T", content="C", image_path=image_path)
+        session.add(post)
+        session.commit()
+        return post.id, post.version
+
+
+def test_attach_image_moves_the_file_without_a_new_version(uploads):
+    staged, announced = uploads
+    os.makedirs(tasks.UPLOAD_DIR)
+    with open(os.path.join(tasks.UPLOAD_DIR, "old.png"), "wb") as f:
+        f.write(b"old")
+    post_id, version = new_post("/static/uploads/new.png")
+    for _ in range(2):
+        # Handlers may run twice
+        tasks.attach_image(post_id, staged, "/static/uploads/new.png", "/static/uploads/old.png")
+    assert os.listdir(tasks.UPLOAD_DIR) == ["new.png"]
+    assert not os.path.exists(staged)
+    with Session(engine) as session:
+        assert session.get(BlogPost, post_id).version == version
+    assert announced == [("updated", post_id)] * 2
+
+
+def test_an_image_replaced_before_it_landed_is_removed(uploads):
+    staged, announced = uploads
+    post_id, _ = new_post("/static/uploads/newer.png")
+    tasks.attach_image(post_id, staged, "/static/uploads/new.png")
+    assert os.listdir(tasks.UPLOAD_DIR) == []
+    assert announced == []
+
+
+@pytest.mark.parametrize("image_path, name", [
+    ("/static/uploads/a.png", "a.png"),
+    ("/static/../../app.py", "app.py"),
+    ("/static/uploads/..", ".."),
+])
+def test_static_file_keeps_only_the_file_name(image_path, name):
+    assert tasks.static_file(image_path) == os.path.join(tasks.UPLOAD_DIR, name)
+
+
+def test_delete_file_only_removes_files_in_the_upload_dir(uploads):
+    os.makedirs(tasks.UPLOAD_DIR)
+    os.symlink(os.path.abspath("app.py"), os.path.join(tasks.UPLOAD_DIR, "link.png"))
+    for path in ["app.py", os.path.join(tasks.UPLOAD_DIR, "..", "..", "app.py"), os.path.join(tasks.UPLOAD_DIR, "link.png")]:
+        with open("app.py", "w") as f:
+            f.write("app")
+        tasks.delete_file(path)
+        assert os.path.exists("app.py")
+    tasks.delete_file(tasks.static_file("/static/uploads/link.png"))
+    assert os.path.exists("app.py")
+
+
+@pytest.mark.parametrize("filename, name", [
+    ("photo 1.png", "photo_1.png"),
+    ("../../app.py", "app.py"),
+    ("..", None),
+])
+def test_upload_name_is_safe_in_the_upload_dir(filename, name):
+    safe = tasks.upload_name(filename)
+    assert safe == name if name else len(safe) == 16
@@ -1,6 +1,9 @@
-from flask import Flask, request, jsonify, render_template_string
-import os
+from flask import Flask, request, jsonify
+from jinja2 import DictLoader, FileSystemBytecodeCache
+import hashlib
+import registrations
 app = Flask(__name__)
+app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache()}
 
 # Main form HTML template
 form_html = r"""
@@ -92,41 +95,99 @@ form_html = r"""
 </html>
 """
 
+# Success page template
+success_html = """
+<!doctype html>
+<html>
+<head>
+    <title>Registration Success</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
+</head>
+<body class="bg-light">
+    <div class="container mt-5">
+    <div class="card shadow-sm">
+        <div class="card-header bg-success text-white">
+        <h2 class="mb-0">Success!</h2>
+        </div>
+        <div class="card-body text-center">
+        <h3 class="text-success mb-4">{{ message }}</h3>
+        <a href="/" class="btn btn-primary">Back to Registration</a>
+        </div>
+    </div>
+    </div>
+</body>
+</html>
+"""
+
+# Shown when the server-side checks reject a submission
+error_html = """
+<!doctype html>
+<html>
+<head>
+    <title>Registration Failed</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
+</head>
+<body class="bg-light">
+    <div class="container mt-5">
+    <div class="card shadow-sm">
+        <div class="card-header bg-danger text-white">
+        <h2 class="mb-0">Registration failed</h2>
+        </div>
+        <div class="card-body text-center">
+        {% for message in errors.values() %}
+        <p class="text-danger">{{ message }}</p>
+        {% endfor %}
+        <a href="/" class="btn btn-primary">Back to Registration</a>
+        </div>
+    </div>
+    </div>
+</body>
+</html>
+"""
+
+# Compile the templates once at startup; Jinja reuses the bytecode cache across restarts
+app.jinja_loader = DictLoader({"form.html": form_html, "success.html": success_html, "error.html": error_html})
+success_template = app.jinja_env.get_template("success.html")
+error_template = app.jinja_env.get_template("error.html")
+
+# The form page never changes, so render it once and serve it from memory
+form_page = app.jinja_env.get_template("form.html").render()
+form_etag = hashlib.md5(form_page.encode()).hexdigest()
+
 @app.route("/", methods=["GET"])
 def home():
-    return render_template_string(form_html)
+    response = app.response_class(form_page, mimetype="text/html")
+    response.set_etag(form_etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def wants_json():
+    return request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html
+
+def rejected(errors, status, headers=None):
+    if wants_json():
+        return jsonify({"errors": errors}), status, headers or {}
+    return error_template.render(errors=errors), status, headers or {}
 
 @app.route("/submit", methods=["POST"])
 def submit():
-    username = request.form.get("username", "")
+    # The form checks these in the browser; a client that skips it gets the same answer here
+    registration, errors = registrations.validate(request.form)
+    if errors:
+        return rejected(errors, 400)
+    username = registration[0]
+    try:
+        # Queued for the batch writer, unless REGISTRATION_DURABILITY=sync
+        registrations.store.add(*registration)
+    except registrations.Duplicate:
+        return rejected({"email": "This email address is already registered"}, 409)
+    except registrations.Busy:
+        return rejected({"form": "We're busy right now, please try again in a moment"}, 503, {"Retry-After": "1"})
     response_data = {"message": f"welcome, {username}! you are looking good today!"}
-    if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+    if wants_json():
         return jsonify(response_data)
-    
-    success_html = """
-    <!doctype html>
-    <html>
-    <head>
-        <title>Registration Success</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body class="bg-light">
-        <div class="container mt-5">
-        <div class="card shadow-sm">
-            <div class="card-header bg-success text-white">
-            <h2 class="mb-0">Success!</h2>
-            </div>
-            <div class="card-body text-center">
-            <h3 class="text-success mb-4">{{ message }}</h3>
-            <a href="/" class="btn btn-primary">Back to Registration</a>
-            </div>
-        </div>
-        </div>
-    </body>
-    </html>
-    """
-    return render_template_string(success_html, message=response_data["message"])
+    return success_template.render(message=response_data["message"])
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8000))
-    app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
+    from serve import serve
+    serve("app:app", port=8000)
\ No newline at end of file
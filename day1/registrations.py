@@ -0,0 +1,253 @@
+"""Registration storage with batched write-behind.
+
+submit() validates a registration with the same rules as the form's JavaScript,
+then hands it to a bounded in-memory queue and returns. A writer thread per
+process drains the queue and inserts up to REGISTRATION_BATCH_SIZE rows per
+transaction. It writes once a batch is full, or REGISTRATION_FLUSH_INTERVAL
+seconds after the first queued row, whichever comes first. Once the queue is full,
+submit() waits briefly and then reports the store as busy, instead of letting
+memory grow.
+
+Email addresses are stored lower-cased under a unique index. A submit whose email
+is already stored, or waiting in this process's queue, is rejected as a duplicate.
+Two processes racing on the same new address both accept it; the index keeps
+one row and the writer skips the other.
+
+    REGISTRATIONS_DATABASE_URL    sqlite:///data/registrations.db (default; data/ is the
+                                  container's volume) or postgresql://...
+    REGISTRATION_DURABILITY       async (default) or sync: write each registration in
+                                  its own transaction before responding
+    REGISTRATION_BATCH_SIZE       rows per transaction (default 500)
+    REGISTRATION_FLUSH_INTERVAL   seconds a queued row waits for a batch to fill (default 0.2)
+    REGISTRATION_QUEUE_SIZE       registrations waiting per process (default 10000)
+    REGISTRATION_ENQUEUE_TIMEOUT  seconds submit() waits for room in a full queue (default 1)
+"""
+import atexit
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+DATABASE_URL = os.environ.get("REGISTRATIONS_DATABASE_URL", "sqlite:///data/registrations.db")
+DURABILITY = os.environ.get("REGISTRATION_DURABILITY", "async")
+BATCH_SIZE = int(os.environ.get("REGISTRATION_BATCH_SIZE", 500))
+FLUSH_INTERVAL = float(os.environ.get("REGISTRATION_FLUSH_INTERVAL", 0.2))
+QUEUE_SIZE = int(os.environ.get("REGISTRATION_QUEUE_SIZE", 10000))
+ENQUEUE_TIMEOUT = float(os.environ.get("REGISTRATION_ENQUEUE_TIMEOUT", 1))
+
+# The form's own checks and messages
+EMAIL_PATTERN = re.compile(r"^[^\s@]+@[^\s@]+\.[^\s@]+$")
+MESSAGES = {
+    "username": "Please enter your full name",
+    "email": "Please enter a valid email address",
+    "age": "Please enter a valid age (1-150)",
+}
+
+log = logging.getLogger("registrations")
+
+
+class Busy(Exception):
+    """The write queue stayed full"""
+
+
+class Duplicate(Exception):
+    """The email address is already registered"""
+
+
+def validate(form):
+    """(registration, errors): the cleaned fields, or {field: message} for the ones that fail"""
+    errors = {}
+    username = form.get("username", "").strip()
+    if not username:
+        errors["username"] = MESSAGES["username"]
+    email = form.get("email", "").strip().lower()
+    if not EMAIL_PATTERN.match(email):
+        errors["email"] = MESSAGES["email"]
+    age = form.get("age", "").strip()
+    # int() would also take "2_5", "+25" and non-ASCII digits
+    age = int(age) if age.isascii() and age.isdigit() else None
+    if age is None or not 1 <= age <= 150:
+        errors["age"] = MESSAGES["age"]
+    if errors:
+        return None, errors
+    return (username, email, age), {}
+
+
+class Database:
+    """The few statements the store needs, for SQLite (stdlib) or Postgres (psycopg2)"""
+
+    def __init__(self, url):
+        self.url = url
+        self.postgres = url.startswith(("postgres://", "postgresql://"))
+        self.param = "%s" if self.postgres else "?"
+        self.local = threading.local()
+        id_column = "BIGSERIAL PRIMARY KEY" if self.postgres else "INTEGER PRIMARY KEY"
+        created = "DOUBLE PRECISION" if self.postgres else "REAL"
+        with self.transaction() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS registrations (
+                    id {id_column},
+                    username TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    age INTEGER NOT NULL,
+                    created_at {created} NOT NULL
+                )""")
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS registrations_email ON registrations (email)")
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        # A connection opened before a fork (gunicorn --preload) belongs to the parent
+        if conn is None or self.local.pid != os.getpid():
+            if self.postgres:
+                import psycopg2
+                conn = psycopg2.connect(self.url)
+            else:
+                path = self.url[len("sqlite:///"):]
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                conn = sqlite3.connect(path, timeout=30)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def transaction(self):
+        return Transaction(self.connection())
+
+    def exists(self, email):
+        with self.transaction() as cursor:
+            cursor.execute(f"SELECT 1 FROM registrations WHERE email = {self.param}", (email,))
+            return cursor.fetchone() is not None
+
+    def insert(self, rows):
+        """Insert (username, email, age, created_at) rows in one transaction; returns how many were new"""
+        sql = "INSERT INTO registrations (username, email, age, created_at) VALUES {values} ON CONFLICT (email) DO NOTHING"
+        with self.transaction() as cursor:
+            if self.postgres:
+                from psycopg2.extras import execute_values
+                # One multi-row statement per batch rather than a round trip per row
+                execute_values(cursor, sql.format(values="%s"), rows, page_size=len(rows))
+            else:
+                cursor.executemany(sql.format(values="(?, ?, ?, ?)"), rows)
+            return cursor.rowcount
+
+
+class Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.cursor = self.conn.cursor()
+        return self.cursor
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.commit()
+        else:
+            self.conn.rollback()
+        self.cursor.close()
+
+
+class RegistrationStore:
+    def __init__(self, url=DATABASE_URL, durability=DURABILITY, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, queue_size=QUEUE_SIZE):
+        self.db = Database(url)
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(queue_size)
+        # Emails queued here but not written yet, for the duplicate check
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.writer = None
+        self.writer_pid = None
+        self.stopping = threading.Event()
+
+    def add(self, username, email, age):
+        """Store a validated registration; raises Duplicate, or Busy when the queue stays full"""
+        row = (username, email, age, time.time())
+        if self.durability == "sync":
+            if not self.db.insert([row]):
+                raise Duplicate(email)
+            return
+        # Pending first: the writer only drops an email from it once the row is
+        # committed, so an email that just left it is already visible to exists()
+        with self.lock:
+            if email in self.pending:
+                raise Duplicate(email)
+            self.pending.add(email)
+        try:
+            if self.db.exists(email):
+                raise Duplicate(email)
+        except BaseException:
+            with self.lock:
+                self.pending.discard(email)
+            raise
+        self.start()
+        try:
+            self.queue.put(row, timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            with self.lock:
+                self.pending.discard(email)
+            raise Busy()
+
+    def start(self):
+        # Threads don't survive a fork, so each gunicorn worker starts its own on first use
+        if self.writer_pid == os.getpid():
+            return
+        with self.lock:
+            if self.writer_pid != os.getpid():
+                self.writer = threading.Thread(target=self.run, name="registration-writer", daemon=True)
+                self.writer.start()
+                self.writer_pid = os.getpid()
+
+    def next_batch(self):
+        """Wait for a row, then collect more until the batch is full or the flush interval is up"""
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.stopping.is_set():
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while not (self.stopping.is_set() and self.queue.empty()):
+            batch = self.next_batch()
+            if batch:
+                self.write(batch)
+
+    def write(self, batch):
+        delay = 0.1
+        while True:
+            try:
+                inserted = self.db.insert(batch)
+                break
+            except Exception:
+                # Keep the batch; the bounded queue pushes back on submit() meanwhile
+                log.exception("writing %d registrations failed, retrying in %.1fs", len(batch), delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+        if inserted < len(batch):
+            log.warning("%d duplicate registration(s) skipped", len(batch) - inserted)
+        with self.lock:
+            self.pending.difference_update(row[1] for row in batch)
+
+    def close(self, timeout=10):
+        """Write what's queued before the process exits"""
+        if self.writer is not None and self.writer_pid == os.getpid():
+            self.stopping.set()
+            self.writer.join(timeout)
+
+
+store = RegistrationStore()
+atexit.register(store.close)
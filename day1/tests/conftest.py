@@ -0,0 +1,13 @@
+"""Run from day1/: python -m pytest tests
+
+Registrations go to a scratch directory, not day1/data/.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCRATCH = tempfile.mkdtemp(prefix="day1-tests-")
+os.environ["REGISTRATIONS_DATABASE_URL"] = f"sqlite:///{SCRATCH}/registrations.db"
+os.environ["REGISTRATION_DURABILITY"] = "async"
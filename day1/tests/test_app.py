@@ -0,0 +1,39 @@
+import pytest
+
+import app as day1
+import registrations
+
+JSON = {"Accept": "application/json"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    store = registrations.RegistrationStore(url=f"sqlite:///{tmp_path}/registrations.db", durability="sync")
+    monkeypatch.setattr(registrations, "store", store)
+    return day1.app.test_client()
+
+
+def test_submit_stores_a_registration(client):
+    response = client.post("/submit", data={"username": "Ada", "email": "ada@example.com", "age": "36"},
+                           headers=JSON)
+    assert response.status_code == 200
+    assert response.get_json() == {"message": "welcome, Ada! you are looking good today!"}
+
+
+def test_submit_rejects_invalid_fields(client):
+    response = client.post("/submit", data={"username": "Ada", "email": "ada", "age": "2_5"}, headers=JSON)
+    assert response.status_code == 400
+    assert set(response.get_json()["errors"]) == {"email", "age"}
+
+
+def test_submit_rejects_a_registered_email(client):
+    data = {"username": "Ada", "email": "ada@example.com", "age": "36"}
+    assert client.post("/submit", data=data, headers=JSON).status_code == 200
+    response = client.post("/submit", data={**data, "email": "ADA@example.com"})
+    assert response.status_code == 409
+    assert b"already registered" in response.data
+
+
+def test_the_form_is_served_with_an_etag(client):
+    etag = client.get("/").headers["ETag"]
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,124 @@
+import queue
+
+import pytest
+
+import registrations
+
+VALID = {"username": " Ada Lovelace ", "email": "Ada@Example.com", "age": "36"}
+
+
+def test_validate_cleans_the_fields():
+    assert registrations.validate(VALID) == (("Ada Lovelace", "ada@example.com", 36), {})
+
+
+@pytest.mark.parametrize("field, value", [
+    ("username", "  "),
+    ("email", "ada@example"),
+    ("email", "ada lovelace@example.com"),
+    ("age", ""),
+    ("age", "0"),
+    ("age", "151"),
+    ("age", "2_5"),
+    ("age", "+25"),
+    ("age", "25.0"),
+    ("age", "٣٦"),
+])
+def test_validate_rejects(field, value):
+    registration, errors = registrations.validate({**VALID, field: value})
+    assert registration is None
+    assert errors == {field: registrations.MESSAGES[field]}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A store whose writer runs only when the test calls drain()"""
+    store = registrations.RegistrationStore(url=f"sqlite:///{tmp_path}/registrations.db", batch_size=3,
+                                            queue_size=10)
+    monkeypatch.setattr(store, "start", lambda: None)
+    return store
+
+
+def drain(store):
+    batches = []
+    while not store.queue.empty():
+        batch = []
+        while len(batch) < store.batch_size and not store.queue.empty():
+            batch.append(store.queue.get_nowait())
+        store.write(batch)
+        batches.append(len(batch))
+    return batches
+
+
+def count(store):
+    with store.db.transaction() as cursor:
+        cursor.execute("SELECT count(*) FROM registrations")
+        return cursor.fetchone()[0]
+
+
+def test_rows_are_written_in_batches(store, monkeypatch):
+    inserts = []
+    insert = store.db.insert
+    monkeypatch.setattr(store.db, "insert", lambda rows: inserts.append(len(rows)) or insert(rows))
+    for i in range(7):
+        store.add("Ada", f"ada{i}@example.com", 36)
+    assert count(store) == 0
+    drain(store)
+    assert inserts == [3, 3, 1]
+    assert count(store) == 7
+    assert store.pending == set()
+
+
+def test_duplicates_are_refused_while_queued_and_once_stored(store):
+    store.add("Ada", "ada@example.com", 36)
+    with pytest.raises(registrations.Duplicate):
+        store.add("Ada", "ada@example.com", 36)
+    drain(store)
+    with pytest.raises(registrations.Duplicate):
+        store.add("Ada", "ada@example.com", 36)
+    assert count(store) == 1
+
+
+def test_a_duplicate_is_refused_while_the_writer_flushes(store, monkeypatch):
+    store.add("Ada", "ada@example.com", 36)
+    exists = store.db.exists
+
+    def flush_during_check(email):
+        # The writer commits the first registration in the middle of the second one's check
+        found = exists(email)
+        drain(store)
+        return found
+
+    monkeypatch.setattr(store.db, "exists", flush_during_check)
+    with pytest.raises(registrations.Duplicate):
+        store.add("Ada", "ada@example.com", 36)
+    drain(store)
+    assert count(store) == 1
+
+
+def test_a_full_queue_reports_busy(tmp_path, monkeypatch):
+    store = registrations.RegistrationStore(url=f"sqlite:///{tmp_path}/registrations.db", queue_size=1)
+    monkeypatch.setattr(store, "start", lambda: None)
+    monkeypatch.setattr(registrations, "ENQUEUE_TIMEOUT", 0.01)
+    store.add("Ada", "ada@example.com", 36)
+    with pytest.raises(registrations.Busy):
+        store.add("Grace", "grace@example.com", 85)
+    # The refused email can be submitted again later
+    assert store.pending == {"ada@example.com"}
+
+
+def test_sync_durability_writes_before_returning(tmp_path):
+    store = registrations.RegistrationStore(url=f"sqlite:///{tmp_path}/registrations.db", durability="sync")
+    store.add("Ada", "ada@example.com", 36)
+    assert count(store) == 1
+    with pytest.raises(registrations.Duplicate):
+        store.add("Ada", "ada@example.com", 36)
+
+
+def test_the_writer_thread_drains_the_queue_on_close(tmp_path):
+    store = registrations.RegistrationStore(url=f"sqlite:///{tmp_path}/registrations.db", flush_interval=0.01)
+    for i in range(5):
+        store.add("Ada", f"ada{i}@example.com", 36)
+    store.close()
+    assert count(store) == 5
+    with pytest.raises(queue.Empty):
+        store.queue.get_nowait()
@@ -1,6 +1,9 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify
+from jinja2 import DictLoader, FileSystemBytecodeCache
+import hashlib
 
 app = Flask(__name__)
+app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache()}
 
 # Main form HTML template
 form_html = r"""
@@ -92,9 +95,44 @@ form_html = r"""
 </html>
 """
 
+# Success page template
+success_html = """
+<!doctype html>
+<html>
+<head>
+    <title>Registration Success</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
+</head>
+<body class="bg-light">
+    <div class="container mt-5">
+    <div class="card shadow-sm">
+        <div class="card-header bg-success text-white">
+        <h2 class="mb-0">Success!</h2>
+        </div>
+        <div class="card-body text-center">
+        <h3 class="text-success mb-4">{{ message }}</h3>
+        <a href="/" class="btn btn-primary">Back to Registration</a>
+        </div>
+    </div>
+    </div>
+</body>
+</html>
+"""
+
+# Compile both templates once at startup; Jinja reuses the bytecode cache across restarts
+app.jinja_loader = DictLoader({"form.html": form_html, "success.html": success_html})
+success_template = app.jinja_env.get_template("success.html")
+
+# The form page never changes, so render it once and serve it from memory
+form_page = app.jinja_env.get_template("form.html").render()
+form_etag = hashlib.md5(form_page.encode()).hexdigest()
+
 @app.route("/", methods=["GET"])
 def home():
-    return render_template_string(form_html)
+    response = app.response_class(form_page, mimetype="text/html")
+    response.set_etag(form_etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route("/submit", methods=["POST"])
 def submit():
@@ -102,30 +140,8 @@ def submit():
     response_data = {"message": f"Hello, {username}!"}
     if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
         return jsonify(response_data)
-    
-    success_html = """
-    <!doctype html>
-    <html>
-    <head>
-        <title>Registration Success</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body class="bg-light">
-        <div class="container mt-5">
-        <div class="card shadow-sm">
-            <div class="card-header bg-success text-white">
-            <h2 class="mb-0">Success!</h2>
-            </div>
-            <div class="card-body text-center">
-            <h3 class="text-success mb-4">{{ message }}</h3>
-            <a href="/" class="btn btn-primary">Back to Registration</a>
-            </div>
-        </div>
-        </div>
-    </body>
-    </html>
-    """
-    return render_template_string(success_html, message=response_data["message"])
+    return success_template.render(message=response_data["message"])
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001, debug=True)
\ No newline at end of file
+    from serve import serve
+    serve("app:app", port=5001)
\ No newline at end of file
@@ -0,0 +1,118 @@
+# Copied into every app that uses it; after editing, run: python bench/sync_shared.py --from <this app>
+"""Production server launcher.
+
+Flask apps run under gunicorn's gthread worker, FastAPI apps under multi-worker
+uvicorn. Worker counts follow the container CPU quota (cgroup v2 or v1) unless
+WEB_CONCURRENCY / WEB_THREADS are set. Set DEV_SERVER=1 to get the framework
+dev server with auto-reload instead.
+
+    python serve.py app:app          # WSGI (Flask)
+    python serve.py app:app asgi     # ASGI (FastAPI)
+"""
+import math
+import os
+import sys
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def cpu_limit():
+    """CPUs available to this container, honouring the cgroup CPU quota"""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    # cgroup v1: quota is -1 when unlimited
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    if hasattr(os, "sched_getaffinity"):
+        return float(len(os.sched_getaffinity(0)))
+    return float(os.cpu_count() or 1)
+
+
+def worker_count(kind):
+    if "WEB_CONCURRENCY" in os.environ:
+        return env_int("WEB_CONCURRENCY", 1)
+    cpus = cpu_limit()
+    if kind == "asgi":
+        # One event loop per whole core; extra processes only fight over the quota
+        return max(1, math.floor(cpus))
+    # Sync workers block on I/O, so keep a spare process even on a fractional CPU
+    return max(2, int(cpus * 2) + 1)
+
+
+def gunicorn_args(target, port):
+    return [
+        "gunicorn",
+        "--bind", f"0.0.0.0:{port}",
+        "--worker-class", "gthread",
+        "--workers", str(worker_count("wsgi")),
+        "--threads", str(env_int("WEB_THREADS", 4)),
+        "--preload",
+        "--max-requests", str(env_int("MAX_REQUESTS", 1000)),
+        "--max-requests-jitter", str(env_int("MAX_REQUESTS_JITTER", 100)),
+        "--graceful-timeout", str(env_int("GRACEFUL_TIMEOUT", 30)),
+        "--timeout", str(env_int("WORKER_TIMEOUT", 30)),
+        "--keep-alive", str(env_int("KEEP_ALIVE", 5)),
+        "--access-logfile", "-",
+        target,
+    ]
+
+
+def uvicorn_args(target, port):
+    workers = worker_count("asgi")
+    args = [
+        "uvicorn", target,
+        "--host", "0.0.0.0",
+        "--port", str(port),
+        "--workers", str(workers),
+        "--timeout-graceful-shutdown", str(env_int("GRACEFUL_TIMEOUT", 30)),
+        "--timeout-keep-alive", str(env_int("KEEP_ALIVE", 5)),
+        "--proxy-headers",
+    ]
+    if workers > 1:
+        # Only the multi-worker supervisor restarts recycled workers; a single
+        # uvicorn process would simply exit once it hit the limit
+        args += ["--limit-max-requests", str(env_int("MAX_REQUESTS", 1000))]
+    return args
+
+
+def dev_args(target, kind, port):
+    if kind == "asgi":
+        return ["uvicorn", target, "--host", "0.0.0.0", "--port", str(port), "--reload"]
+    module, _, app_name = target.partition(":")
+    return ["flask", "--app", f"{module}:{app_name or 'app'}", "run",
+            "--host", "0.0.0.0", "--port", str(port), "--debug"]
+
+
+def serve(target="app:app", kind="wsgi", port=8000):
+    """Replace the current process with the server so it receives signals directly"""
+    port = env_int("PORT", port)
+    if os.environ.get("DEV_SERVER") == "1":
+        args = dev_args(target, kind, port)
+    elif kind == "asgi":
+        args = uvicorn_args(target, port)
+    else:
+        args = gunicorn_args(target, port)
+    sys.stdout.flush()
+    os.execvp(args[0], args)
+
+
+if __name__ == "__main__":
+    serve(
+        target=sys.argv[1] if len(sys.argv) > 1 else "app:app",
+        kind=sys.argv[2] if len(sys.argv) > 2 else "wsgi",
+    )
@@ -1,24 +1,150 @@
+import os
+import threading
+import time
+from datetime import datetime
+from contextlib import contextmanager
 import psycopg2
-from flask import Flask
+from psycopg2 import pool
+from flask import Flask, jsonify
 
 app = Flask(__name__)
 
+# Database settings come from the environment (see docker-compose.yml)
+DB_SETTINGS = {
+    "dbname": os.environ.get("DB_NAME", "mydb"),
+    "user": os.environ.get("DB_USER", "user"),
+    "password": os.environ.get("DB_PASSWORD", ""),
+    "host": os.environ.get("DB_HOST", "db"),
+    "port": int(os.environ.get("DB_PORT", 5432)),
+    "connect_timeout": int(os.environ.get("DB_CONNECT_TIMEOUT", 3)),
+}
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+
+# Readiness probe settings: probe every PROBE_INTERVAL seconds while healthy,
+# back off exponentially up to PROBE_MAX_BACKOFF while the DB is down
+PROBE_INTERVAL = float(os.environ.get("PROBE_INTERVAL", 5))
+PROBE_MAX_BACKOFF = float(os.environ.get("PROBE_MAX_BACKOFF", 60))
+PROBE_STALE_AFTER = float(os.environ.get("PROBE_STALE_AFTER", 3 * PROBE_MAX_BACKOFF))
+
+db_pool = None
+pool_lock = threading.Lock()
+
+def get_pool():
+    # Created lazily so the app can start before Postgres is up
+    global db_pool
+    if db_pool is None:
+        with pool_lock:
+            if db_pool is None:
+                db_pool = pool.ThreadedConnectionPool(POOL_MIN, POOL_MAX, **DB_SETTINGS)
+    return db_pool
+
+def is_alive(conn):
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
 def connect_db():
-    return psycopg2.connect(
-        dbname="mydb",
-        user="user", 
-        password="password",
-        host="db"
-    )
+    """Borrow a validated connection from the pool and hand it back afterwards"""
+    db = get_pool()
+    conn = db.getconn()
+    if not is_alive(conn):
+        # Stale connection (e.g. Postgres restarted): drop it and take a fresh one
+        db.putconn(conn, close=True)
+        conn = db.getconn()
+    try:
+        yield conn
+    finally:
+        db.putconn(conn, close=bool(conn.closed))
+
+def pool_stats():
+    if db_pool is None:
+        return {"min": POOL_MIN, "max": POOL_MAX, "in_use": 0, "idle": 0}
+    # getconn/putconn mutate these under the pool's own lock; reading them without it
+    # can race a checkout ("dictionary changed size during iteration")
+    with db_pool._lock:
+        in_use, idle = len(db_pool._used), len(db_pool._pool)
+    return {"min": db_pool.minconn, "max": db_pool.maxconn, "in_use": in_use, "idle": idle}
+
+# Last probe result, shared by all request threads
+db_status = {"ready": False, "checked_at": None, "latency_ms": None, "error": None}
+status_lock = threading.Lock()
+probe_thread = None
+
+def probe_db():
+    started = time.perf_counter()
+    try:
+        with connect_db():
+            pass
+        ready, error = True, None
+    except psycopg2.Error as e:
+        ready, error = False, str(e).strip()
+    with status_lock:
+        db_status.update(
+            ready=ready,
+            checked_at=time.time(),
+            latency_ms=round((time.perf_counter() - started) * 1000, 2),
+            error=error,
+        )
+    return ready
+
+def probe_loop():
+    delay = PROBE_INTERVAL
+    while True:
+        if probe_db():
+            delay = PROBE_INTERVAL
+        else:
+            app.logger.warning("DB probe failed: %s", db_status["error"])
+            delay = min(delay * 2, PROBE_MAX_BACKOFF)
+        time.sleep(delay)
+
+def start_probe():
+    # One probe thread per worker process, started on first use so it survives forking servers
+    global probe_thread
+    if probe_thread is None or not probe_thread.is_alive():
+        with status_lock:
+            if probe_thread is None or not probe_thread.is_alive():
+                probe_thread = threading.Thread(target=probe_loop, name="db-probe", daemon=True)
+                probe_thread.start()
+
+def readiness():
+    start_probe()
+    with status_lock:
+        status = dict(db_status)
+    checked_at = status["checked_at"]
+    age = None if checked_at is None else time.time() - checked_at
+    ready = status["ready"] and age is not None and age <= PROBE_STALE_AFTER
+    body = {
+        "status": "Connected to DB successfully!" if ready else "DB connection failed!",
+        "ready": ready,
+        "checked_at": datetime.fromtimestamp(checked_at).isoformat() if checked_at else None,
+        "age_seconds": round(age, 2) if age is not None else None,
+        "latency_ms": status["latency_ms"],
+        "error": status["error"],
+        "pool": pool_stats(),
+    }
+    return jsonify(body), 200 if ready else 503
+
+@app.route("/livez")
+def livez():
+    # Liveness only says the process can serve requests; it never touches the DB
+    return jsonify({"status": "alive"})
+
+@app.route("/readyz")
+def readyz():
+    return readiness()
 
 @app.route("/")
 def home():
-    try:
-        conn = connect_db()
-        conn.close()
-        return "Connected to DB successfully!"
-    except:
-        return "DB connection failed!"
+    return readiness()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001)
\ No newline at end of file
+    from serve import serve
+    serve("app:app", port=5001)
@@ -1,11 +1,18 @@
-from flask import Flask, request, jsonify, render_template_string
+import os
+from flask import Flask, Response, request, jsonify
 from flask_restx import Api, Resource, fields
 from flask_cors import CORS
-from faker import Faker
 from prometheus_client import Counter, generate_latest
-import prometheus_client
-import random
-from datetime import datetime, timedelta
+import cache
+import catalog
+import formats
+import profiling
+import ratelimit
+import records
+import snapshot
+import startup
+import timing
+from datetime import datetime
 
 # Initialize Flask and extensions
 app = Flask(__name__)
@@ -24,7 +31,16 @@ CORS(app, resources={
         "max_age": 600
     }
 })
-fake = Faker()
+profiling.init_flask(app)
+# Products and reviews are a pure function of this seed and the product ID
+CATALOG_SEED = int(os.environ.get('CATALOG_SEED', 42))
+# With CATALOG_SNAPSHOT set, products come from a memory-mapped file shared by all workers
+product_snapshot = snapshot.open_from_env(CATALOG_SEED)
+# Shared across replicas through Redis when REDIS_URL is set
+api_cache = cache.cache_from_env(f'day5:{CATALOG_SEED}')
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+# Bigger listings are generated on demand rather than stored
+CACHE_MAX_LIST = int(os.environ.get('CACHE_MAX_LIST', 1000))
 
 # Initialize Flask-RESTX
 api = Api(
@@ -34,6 +50,9 @@ api = Api(
     description='A fake e-commerce API with sample data',
     doc='/swagger/'  # Note the trailing slash
 )
+timing.init_flask(app, api)
+# Per-client limits (override with RATE_LIMITS) plus adaptive load shedding
+ratelimit.init_flask(app, {'/products/': '20/s:40'})
 
 @app.route('/metrics')
 def metrics():
@@ -65,90 +84,125 @@ review_model = api.model('Review', {
     'created_at': fields.DateTime(required=True, description='Review date')
 })
 
+category_model = api.model('Category', {
+    'id': fields.String(required=True, description='Category unique identifier'),
+    'name': fields.String(required=True, description='Category name'),
+    'description': fields.String(required=True, description='Category description'),
+    'product_count': fields.Integer(required=True, description='Products in the category')
+})
 
-# Helper functions
-def generate_product():
-    categories = ['Electronics', 'Clothing', 'Books', 'Home & Kitchen', 'Sports', 'Beauty']
-    return {
-        "id": fake.uuid4(),
-        "name": fake.catch_phrase(),
-        "description": fake.text(max_nb_chars=200),
-        "price": round(random.uniform(9.99, 999.99), 2),
-        "category": random.choice(categories),
-        "image_url": f"https://picsum.photos/seed/{random.randint(1, 1000)}/400/300",
-        "rating": round(random.uniform(3.5, 5.0), 1),
-        "stock": random.randint(0, 100),
-        "created_at": (datetime.now() - timedelta(days=random.randint(1, 365))).isoformat()
-    }
+address_model = api.model('Address', {
+    'street': fields.String(required=True),
+    'city': fields.String(required=True),
+    'state': fields.String(required=True),
+    'zip_code': fields.String(required=True)
+})
 
-def generate_review():
-    return {
-        "id": fake.uuid4(),
-        "user_name": fake.name(),
-        "rating": random.randint(1, 5),
-        "comment": fake.paragraph(),
-        "created_at": fake.date_time_this_year().isoformat()
-    }
+order_model = api.model('Order', {
+    'id': fields.String(required=True, description='Order unique identifier'),
+    'date': fields.String(required=True, description='Order date (ISO 8601)'),
+    'total': fields.Float(required=True, description='Order total'),
+    'status': fields.String(required=True, description='pending, shipped or delivered')
+})
+
+user_model = api.model('User', {
+    'id': fields.String(required=True, description='User unique identifier'),
+    'name': fields.String(required=True, description='Full name'),
+    'email': fields.String(required=True, description='Email address'),
+    'avatar': fields.String(required=True, description='Avatar URL'),
+    'address': fields.Nested(address_model, required=True),
+    'orders': fields.List(fields.Nested(order_model), required=True)
+})
+
+
+# Cached values are shared between requests; treat them as read-only
+@api_cache.cached('products:{0}:{1}', ttl=CACHE_TTL, decode=records.Product.from_dicts)
+def load_products(count, offset):
+    with timing.phase('generate'):
+        if product_snapshot is not None:
+            return product_snapshot.products(count, offset, records.Product)
+        return catalog.generate_products(count, CATALOG_SEED, offset, records.Product)
+
+@api_cache.cached('product-lists:{0}:{1}:{2}', ttl=CACHE_TTL)
+def load_product_lists(count, offset, fields):
+    fields = fields.split(',')
+    with timing.phase('generate'):
+        if product_snapshot is not None:
+            return product_snapshot.product_lists(count, offset, fields)
+        return catalog.generate_product_lists(count, CATALOG_SEED, offset, fields)
+
+@api_cache.cached('product:{0}', ttl=CACHE_TTL)
+def load_product(product_id):
+    with timing.phase('generate'):
+        if product_snapshot is not None:
+            return product_snapshot.product_detail(product_id)
+        return catalog.product_detail(product_id, CATALOG_SEED)
+
+@api_cache.cached('categories', ttl=CACHE_TTL, decode=records.Category.from_dicts)
+def load_categories():
+    return records.Category.from_dicts(catalog.sample_categories(catalog.faker()))
 
 # API Routes
 @ns_products.route('/')
 class ProductList(Resource):
-    @api.doc(params={'count': 'Number of products to return'})
-    @api.marshal_list_with(product_model)
+    @api.doc(params={
+        'count': 'Number of products to return',
+        'offset': 'Position in the catalog to start from',
+        'fields': 'Comma-separated fields to return, e.g. id,name,price,image_url',
+        'layout': 'rows (default) or columns: one array per field',
+    })
+    @api.response(200, 'Success', [product_model])
     def get(self):
-        """Get a list of products"""
-        count = int(request.args.get('count', 10))
-        return [generate_product() for _ in range(count)]
+        """Get a list of products (JSON, or MessagePack with Accept: application/msgpack)"""
+        try:
+            count, offset = formats.parse_page(request.args.get('count'), request.args.get('offset'))
+            fields = formats.parse_fields(request.args.get('fields'))
+            layout = formats.parse_layout(request.args.get('layout'))
+        except formats.FormatError as e:
+            api.abort(400, str(e))
+        media_type = formats.negotiate(request.headers.get('Accept'))
+        if fields is None and layout == 'rows' and media_type == formats.JSON:
+            return self.marshalled(count, offset)
+        fields = ','.join(fields or catalog.PRODUCT_FIELDS)
+        if count > CACHE_MAX_LIST:
+            lists = load_product_lists.uncached(count, offset, fields)
+        else:
+            lists = load_product_lists(count, offset, fields)
+        with timing.phase('marshal'):
+            body = formats.encode(lists, layout, media_type)
+        return Response(body, mimetype=media_type, headers={'Vary': 'Accept'})
+
+    @timing.timed('marshal')
+    @api.marshal_list_with(product_model)
+    def marshalled(self, count, offset):
+        if count > CACHE_MAX_LIST:
+            return load_products.uncached(count, offset), 200, {'Vary': 'Accept'}
+        return load_products(count, offset), 200, {'Vary': 'Accept'}
 
 @ns_products.route('/<product_id>')
 class Product(Resource):
+    @timing.timed('marshal')
     @api.marshal_with(product_model)
     def get(self, product_id):
         """Get a specific product by ID"""
-        product = generate_product()
-        product["id"] = product_id
-        product["reviews"] = [generate_review() for _ in range(random.randint(3, 10))]
+        product = load_product(product_id)
+        if product is None:
+            api.abort(404, 'Product not found')
         return product
 
 @ns_categories.route('/')
 class Categories(Resource):
+    @api.marshal_list_with(category_model)
     def get(self):
         """Get all product categories"""
-        categories = [
-            {
-                "id": fake.uuid4(),
-                "name": category,
-                "description": fake.text(max_nb_chars=100),
-                "product_count": random.randint(10, 100)
-            }
-            for category in ['Electronics', 'Clothing', 'Books', 'Home & Kitchen', 'Sports', 'Beauty']
-        ]
-        return categories
+        return load_categories()
 
 @ns_users.route('/current')
 class CurrentUser(Resource):
+    @api.marshal_with(user_model)
     def get(self):
         """Get current user profile"""
-        return {
-            "id": fake.uuid4(),
-            "name": fake.name(),
-            "email": fake.email(),
-            "avatar": f"https://i.pravatar.cc/150?u={fake.uuid4()}",
-            "address": {
-                "street": fake.street_address(),
-                "city": fake.city(),
-                "state": fake.state(),
-                "zip_code": fake.zipcode()
-            },
-            "orders": [
-                {
-                    "id": fake.uuid4(),
-                    "date": fake.date_time_this_year().isoformat(),
-                    "total": round(random.uniform(20, 500), 2),
-                    "status": random.choice(["pending", "shipped", "delivered"])
-                } for _ in range(random.randint(2, 5))
-            ]
-        }
+        return records.User.from_dict(catalog.sample_user(catalog.faker()))
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -158,5 +212,24 @@ def health_check():
         "swagger_url": "/swagger/"
     })
 
+def build_swagger():
+    # flask-restx builds the spec on the first /swagger.json request and keeps it
+    with app.test_request_context():
+        api.__schema__
+
+# /readyz reports ready once the first requests no longer pay for these
+warmup = startup.init_flask(app, [
+    ('text-pools', lambda: catalog.text_pools(CATALOG_SEED)),
+    ('faker', catalog.faker),
+    ('products', lambda: load_products(10, 0)),
+    ('categories', load_categories),
+    ('swagger', build_swagger),
+])
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8001, debug=True)
\ No newline at end of file
+    from serve import serve
+    # API_STACK=asgi serves the async FastAPI variant in asgi.py instead. The
+    # container skips this module and starts serve.py directly (see Dockerfile).
+    if os.environ.get('API_STACK') == 'asgi':
+        serve("asgi:app", "asgi", port=8001)
+    serve("app:app", port=8001)
@@ -0,0 +1,246 @@
+"""The day5 API on FastAPI/ASGI: same routes, models and response data as app.py.
+
+Product routes return the same JSON documents as the Flask stack (same values
+and key order), but not the same bytes: FastAPI encodes compactly, without the
+spaces and trailing newline of flask-restx, and errors come back as FastAPI's
+{"detail": ...} rather than {"message": ...}. Compare responses as parsed JSON.
+
+Handlers are async and the cache talks to Redis through redis.asyncio, so a
+worker keeps serving other requests while one waits on I/O. CPU-bound catalog
+generation runs in the thread pool so it doesn't stall the event loop.
+
+Pick the stack at deploy time with API_STACK=asgi (see app.py), or run directly:
+
+    python serve.py asgi:app asgi
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from functools import partial
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, ConfigDict, Field
+
+import cache
+import catalog
+import formats
+import profiling
+import ratelimit
+import records
+import snapshot
+import startup
+import timing
+
+CATALOG_SEED = int(os.environ.get('CATALOG_SEED', 42))
+product_snapshot = snapshot.open_from_env(CATALOG_SEED)
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+CACHE_MAX_LIST = int(os.environ.get('CACHE_MAX_LIST', 1000))
+# Same cache name as app.py, so both stacks can share one Redis
+api_cache = cache.async_cache_from_env(f'day5:{CATALOG_SEED}')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # /livez answers right away; /readyz flips once the warmup steps below have run
+    warmup.start()
+    yield
+    await api_cache.close()
+
+
+app = FastAPI(
+    title='E-Commerce API',
+    version='1.0',
+    description='A fake e-commerce API with sample data',
+    docs_url='/swagger/',
+    lifespan=lifespan,
+)
+ratelimit.init_fastapi(app, {'/products/': '20/s:40'})
+timing.init_fastapi(app)
+profiling.init_fastapi(app)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[
+        "https://friendly-space-zebra-r4pr7j4pq5jqhxj47-3000.app.github.dev",
+        "https://friendly-space-zebra-r4pr7j4pq5jqhxj47-8001.app.github.dev"
+    ],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "Accept"],
+    allow_credentials=False,
+    expose_headers=["Content-Type", "Authorization"],
+    max_age=600,
+)
+
+
+# Mirrors product_model / review_model in app.py
+class Product(BaseModel):
+    # Listings are records.Product objects rather than dicts
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str = Field(description='Product unique identifier')
+    name: str = Field(description='Product name')
+    description: str = Field(description='Product description')
+    price: float = Field(description='Product price')
+    category: str = Field(description='Product category')
+    image_url: str = Field(description='Product image URL')
+    rating: float = Field(description='Product rating')
+    stock: int = Field(description='Product stock quantity')
+    created_at: datetime = Field(description='Creation date')
+
+
+class Review(BaseModel):
+    id: str = Field(description='Review unique identifier')
+    user_name: str = Field(description='Reviewer name')
+    rating: int = Field(description='Review rating')
+    comment: str = Field(description='Review comment')
+    created_at: datetime = Field(description='Review date')
+
+
+class Category(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str = Field(description='Category unique identifier')
+    name: str = Field(description='Category name')
+    description: str = Field(description='Category description')
+    product_count: int = Field(description='Products in the category')
+
+
+class Address(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    street: str
+    city: str
+    state: str
+    zip_code: str
+
+
+class Order(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str = Field(description='Order unique identifier')
+    date: str = Field(description='Order date (ISO 8601)')
+    total: float = Field(description='Order total')
+    status: str = Field(description='pending, shipped or delivered')
+
+
+class User(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str = Field(description='User unique identifier')
+    name: str = Field(description='Full name')
+    email: str = Field(description='Email address')
+    avatar: str = Field(description='Avatar URL')
+    address: Address
+    orders: List[Order]
+
+
+async def generate(func, *args):
+    with timing.phase('generate'):
+        return await asyncio.to_thread(func, *args)
+
+
+@api_cache.cached('products:{0}:{1}', ttl=CACHE_TTL, decode=records.Product.from_dicts)
+async def load_products(count, offset):
+    if product_snapshot is not None:
+        return await generate(product_snapshot.products, count, offset, records.Product)
+    return await generate(catalog.generate_products, count, CATALOG_SEED, offset, records.Product)
+
+
+@api_cache.cached('product-lists:{0}:{1}:{2}', ttl=CACHE_TTL)
+async def load_product_lists(count, offset, fields):
+    fields = fields.split(',')
+    if product_snapshot is not None:
+        return await generate(product_snapshot.product_lists, count, offset, fields)
+    return await generate(catalog.generate_product_lists, count, CATALOG_SEED, offset, fields)
+
+
+@api_cache.cached('product:{0}', ttl=CACHE_TTL)
+async def load_product(product_id):
+    if product_snapshot is not None:
+        return await generate(product_snapshot.product_detail, product_id)
+    return await generate(catalog.product_detail, product_id, CATALOG_SEED)
+
+
+@api_cache.cached('categories', ttl=CACHE_TTL, decode=records.Category.from_dicts)
+async def load_categories():
+    return records.Category.from_dicts(catalog.sample_categories(catalog.faker()))
+
+
+@app.get('/metrics')
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get('/products/', response_model=List[Product], tags=['products'])
+async def list_products(
+    response: Response,
+    count: Optional[str] = Query(None, description='Number of products to return (default 10)'),
+    offset: Optional[str] = Query(None, description='Position in the catalog to start from'),
+    fields: Optional[str] = Query(None, description='Comma-separated fields to return, e.g. id,name,price,image_url'),
+    layout: Optional[str] = Query(None, description='rows (default) or columns: one array per field'),
+    accept: Optional[str] = Header(None),
+):
+    """Get a list of products (JSON, or MessagePack with Accept: application/msgpack)"""
+    try:
+        count, offset = formats.parse_page(count, offset)
+        fields = formats.parse_fields(fields)
+        layout = formats.parse_layout(layout)
+    except formats.FormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type = formats.negotiate(accept)
+    response.headers['Vary'] = 'Accept'
+    if fields is None and layout == 'rows' and media_type == formats.JSON:
+        if count > CACHE_MAX_LIST:
+            return await load_products.uncached(count, offset)
+        return await load_products(count, offset)
+    fields = ','.join(fields or catalog.PRODUCT_FIELDS)
+    if count > CACHE_MAX_LIST:
+        lists = await load_product_lists.uncached(count, offset, fields)
+    else:
+        lists = await load_product_lists(count, offset, fields)
+    with timing.phase('serialize'):
+        body = formats.encode(lists, layout, media_type)
+    return Response(body, media_type=media_type, headers={'Vary': 'Accept'})
+
+
+@app.get('/products/{product_id}', response_model=Product, tags=['products'])
+async def get_product(product_id: str):
+    """Get a specific product by ID"""
+    product = await load_product(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail='Product not found')
+    return product
+
+
+@app.get('/categories/', response_model=List[Category], tags=['categories'])
+async def list_categories():
+    """Get all product categories"""
+    return await load_categories()
+
+
+@app.get('/users/current', response_model=User, tags=['users'])
+async def current_user():
+    """Get current user profile"""
+    return records.User.from_dict(catalog.sample_user(catalog.faker()))
+
+
+@app.get('/health')
+async def health_check():
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "swagger_url": "/swagger/"
+    }
+
+
+warmup = startup.init_fastapi(app, [
+    ('text-pools', lambda: catalog.text_pools(CATALOG_SEED)),
+    ('faker', catalog.faker),
+    ('products', partial(load_products, 10, 0)),
+    ('categories', load_categories),
+    ('openapi', app.openapi),
+])
@@ -0,0 +1,325 @@
+"""Two-level cache shared by the API replicas.
+
+L1 is a small in-process LRU with a short TTL; L2 is Redis (REDIS_URL), shared by
+every replica. A miss is computed once per key: concurrent callers in a process
+wait on the first one (single-flight), and across replicas a short Redis lock
+makes the others wait for the value to land in L2 instead of recomputing it.
+
+Values go to L2 as JSON; objects with a to_dict() method (the records.py types)
+are stored as that dict. Pass decode= to cached() to turn an L2 hit back into
+the type the function returns, so callers get the same type from either level.
+
+Replicas keep their L1 copies in step through a Redis pub/sub channel per cache.
+Whenever a replica writes a key to L2 (a computed miss) or invalidate()s it, it
+publishes the key, and every other replica drops its L1 copy, so none of them
+keeps serving an older value for up to CACHE_L1_TTL. Generated products are a
+pure function of the seed and never change, but Faker categories differ on
+every computation, and invalidate() is there for data that does change.
+
+    REDIS_URL       redis://host/0, or memory:// for fakeredis; unset = L1 only
+    CACHE_L1_SIZE   entries kept per process (default 1024)
+    CACHE_L1_TTL    upper bound on L1 staleness in seconds (default 30)
+
+Any redis-py compatible client can be passed to Cache(), e.g. fakeredis in tests;
+AsyncCache is the asyncio twin used by the ASGI app.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from prometheus_client import Counter
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger("cache")
+
+cache_requests_total = Counter("cache_requests_total", "Cache lookups", ["cache", "result"])
+
+L1_SIZE = int(os.environ.get("CACHE_L1_SIZE", 1024))
+L1_TTL = float(os.environ.get("CACHE_L1_TTL", 30))
+LOCK_TIMEOUT = 5.0
+MISSING = object()
+
+
+class LRU:
+    """Thread-safe LRU with per-entry expiry"""
+
+    def __init__(self, maxsize=L1_SIZE):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.data[key]
+                return MISSING
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+
+def to_dict(value):
+    """json.dumps default= hook for values with a to_dict() method"""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def redis_from_url(url):
+    if url.startswith("memory://"):
+        import fakeredis
+        return fakeredis.FakeRedis()
+    import redis
+    return redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+class Cache:
+    def __init__(self, name, redis=None, l1_size=L1_SIZE, l1_ttl=L1_TTL):
+        self.name = name
+        self.redis = redis
+        self.l1 = LRU(l1_size)
+        self.l1_ttl = l1_ttl
+        self.flight = SingleFlight(f"cache:{name}", timeout=LOCK_TIMEOUT)
+        self.channel = f"cache:{name}:invalidate"
+        self.instance = uuid.uuid4().hex
+        self.listener = None
+        self.listener_pid = None
+        self.listener_lock = threading.Lock()
+
+    def full_key(self, key):
+        return f"{self.name}:{key}"
+
+    def origin(self):
+        # Workers forked from one process share the instance ID but not the pid
+        return f"{self.instance}:{os.getpid()}"
+
+    def message(self, keys):
+        return json.dumps({"origin": self.origin(), "keys": keys})
+
+    def evict(self, raw):
+        """Handle a message from the channel: drop another replica's written keys from L1"""
+        data = json.loads(raw)
+        if data.get("origin") != self.origin():
+            self.l1.delete(*data.get("keys", []))
+
+    def l2_call(self, method, *args, **kwargs):
+        # Redis trouble degrades to L1-only rather than failing the request
+        try:
+            return getattr(self.redis, method)(*args, **kwargs)
+        except Exception as e:
+            logger.warning("cache backend %s failed: %s", method, e)
+            return None
+
+    def get_or_set(self, key, compute, ttl, decode=None):
+        key = self.full_key(key)
+        value = self.l1.get(key)
+        if value is not MISSING:
+            cache_requests_total.labels(self.name, "l1_hit").inc()
+            return value
+        if self.redis is not None:
+            self.start_listener()
+        return self.flight.do(key, lambda: self.load(key, compute, ttl, decode))
+
+    def load(self, key, compute, ttl, decode=None):
+        l1_ttl = min(ttl, self.l1_ttl)
+        if self.redis is None:
+            cache_requests_total.labels(self.name, "miss").inc()
+            value = compute()
+            self.l1.set(key, value, l1_ttl)
+            return value
+        raw = self.l2_call("get", key)
+        if raw is None and not self.l2_call("set", f"{key}:lock", 1, nx=True, px=int(LOCK_TIMEOUT * 1000)):
+            # Another replica is computing this key; wait for it to publish the value
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while raw is None and time.monotonic() < deadline and self.l2_call("exists", f"{key}:lock"):
+                time.sleep(0.02)
+                raw = self.l2_call("get", key)
+            if raw is None:
+                raw = self.l2_call("get", key)
+        if raw is not None:
+            cache_requests_total.labels(self.name, "l2_hit").inc()
+            value = json.loads(raw)
+            if decode is not None:
+                value = decode(value)
+        else:
+            cache_requests_total.labels(self.name, "miss").inc()
+            value = compute()
+            self.l2_call("set", key, json.dumps(value, default=to_dict), ex=max(1, int(ttl)))
+            self.l2_call("delete", f"{key}:lock")
+            self.l2_call("publish", self.channel, self.message([key]))
+        self.l1.set(key, value, l1_ttl)
+        return value
+
+    def cached(self, key_template, ttl, decode=None):
+        """Cache a function's JSON-serializable result under key_template.format(*args)"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = key_template.format(*args, **kwargs)
+                return self.get_or_set(key, lambda: func(*args, **kwargs), ttl, decode)
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def invalidate(self, *keys):
+        """Drop keys here, in Redis and from every replica's L1"""
+        keys = [self.full_key(key) for key in keys]
+        self.l1.delete(*keys)
+        if self.redis is None:
+            return
+        self.l2_call("delete", *keys)
+        self.l2_call("publish", self.channel, self.message(keys))
+
+    def start_listener(self):
+        # Threads don't survive a fork, so each gunicorn worker starts its own subscriber
+        if self.listener_pid == os.getpid() and self.listener.is_alive():
+            return
+        with self.listener_lock:
+            if self.listener_pid != os.getpid() or not self.listener.is_alive():
+                self.listener = threading.Thread(target=self.listen, name=f"cache-{self.name}", daemon=True)
+                self.listener.start()
+                self.listener_pid = os.getpid()
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.evict(message["data"])
+            except Exception as e:
+                logger.warning("cache invalidation listener failed, retrying: %s", e)
+                time.sleep(1)
+
+
+def async_redis_from_url(url):
+    if url.startswith("memory://"):
+        import fakeredis
+        return fakeredis.FakeAsyncRedis()
+    import redis.asyncio
+    return redis.asyncio.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+class AsyncCache(Cache):
+    """The same cache for asyncio apps, on a redis.asyncio client; compute functions are async"""
+
+    async def l2_call(self, method, *args, **kwargs):
+        try:
+            return await getattr(self.redis, method)(*args, **kwargs)
+        except Exception as e:
+            logger.warning("cache backend %s failed: %s", method, e)
+            return None
+
+    async def get_or_set(self, key, compute, ttl, decode=None):
+        key = self.full_key(key)
+        value = self.l1.get(key)
+        if value is not MISSING:
+            cache_requests_total.labels(self.name, "l1_hit").inc()
+            return value
+        if self.redis is not None:
+            self.start_listener()
+        return await self.flight.do_async(key, lambda: self.load(key, compute, ttl, decode))
+
+    async def load(self, key, compute, ttl, decode=None):
+        l1_ttl = min(ttl, self.l1_ttl)
+        if self.redis is None:
+            cache_requests_total.labels(self.name, "miss").inc()
+            value = await compute()
+            self.l1.set(key, value, l1_ttl)
+            return value
+        raw = await self.l2_call("get", key)
+        if raw is None and not await self.l2_call("set", f"{key}:lock", 1, nx=True, px=int(LOCK_TIMEOUT * 1000)):
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while raw is None and time.monotonic() < deadline and await self.l2_call("exists", f"{key}:lock"):
+                await asyncio.sleep(0.02)
+                raw = await self.l2_call("get", key)
+            if raw is None:
+                raw = await self.l2_call("get", key)
+        if raw is not None:
+            cache_requests_total.labels(self.name, "l2_hit").inc()
+            value = json.loads(raw)
+            if decode is not None:
+                value = decode(value)
+        else:
+            cache_requests_total.labels(self.name, "miss").inc()
+            value = await compute()
+            await self.l2_call("set", key, json.dumps(value, default=to_dict), ex=max(1, int(ttl)))
+            await self.l2_call("delete", f"{key}:lock")
+            await self.l2_call("publish", self.channel, self.message([key]))
+        self.l1.set(key, value, l1_ttl)
+        return value
+
+    def cached(self, key_template, ttl, decode=None):
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = key_template.format(*args, **kwargs)
+                return await self.get_or_set(key, lambda: func(*args, **kwargs), ttl, decode)
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    async def invalidate(self, *keys):
+        keys = [self.full_key(key) for key in keys]
+        self.l1.delete(*keys)
+        if self.redis is None:
+            return
+        await self.l2_call("delete", *keys)
+        await self.l2_call("publish", self.channel, self.message(keys))
+
+    async def close(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+
+    def start_listener(self):
+        # One subscriber task on the running loop, restarted if it ended
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+
+    async def listen(self):
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            self.evict(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("cache invalidation listener failed, retrying: %s", e)
+                await asyncio.sleep(1)
+
+
+def cache_from_env(name):
+    url = os.environ.get("REDIS_URL")
+    return Cache(name, redis_from_url(url) if url else None)
+
+
+def async_cache_from_env(name):
+    url = os.environ.get("REDIS_URL")
+    return AsyncCache(name, async_redis_from_url(url) if url else None)
@@ -0,0 +1,326 @@
+"""Deterministic, vectorized fake catalog.
+
+Every product is a pure function of (seed, key): numeric columns come from a
+counter-based hash of the key, text comes from Faker pools pre-sampled once per
+seed. Product IDs encode their key, so /products/<id> returns the same product
+that appeared in a listing.
+
+    python catalog.py --count 1000000 --seed 42 --format jsonl -o products.jsonl
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import uuid
+from functools import lru_cache
+
+import numpy as np
+
+CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Home & Kitchen', 'Sports', 'Beauty']
+PRODUCT_FIELDS = ['id', 'name', 'description', 'price', 'category',
+                  'image_url', 'rating', 'stock', 'created_at']
+POOL_SIZE = 4096
+# Fixed anchor for created_at so output doesn't drift from day to day
+EPOCH = np.datetime64('2025-01-01T00:00:00', 's')
+
+# Keys live in the low 62 bits of the UUID, passed through a reversible
+# 62-bit permutation so consecutive keys don't produce sequential IDs
+KEY_BITS = 62
+KEY_MASK = (1 << KEY_BITS) - 1
+KEY_OFFSET = 0x1F83D9ABFB41BD6B & KEY_MASK
+KEY_MULT = (0x2545F4914F6CDD1D, 0x14057B7EF767814F)
+KEY_MULT_INV = tuple(pow(m, -1, 1 << KEY_BITS) for m in KEY_MULT)
+KEY_SHIFT = 29
+
+# Per-field salts keep the columns independent of each other
+SALT = {name: i * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF for i, name in enumerate([
+    'id', 'name', 'description', 'price', 'category', 'image', 'rating', 'stock',
+    'created', 'reviews', 'review_id', 'user', 'comment', 'review_rating',
+], start=1)}
+
+
+def mix(x):
+    """splitmix64 finalizer over a uint64 array"""
+    z = np.asarray(x, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def field_hash(keys, seed, field):
+    return mix(keys ^ np.uint64((seed * 0xD1B54A32D192ED03 ^ SALT[field]) & 0xFFFFFFFFFFFFFFFF))
+
+
+def uniform(keys, seed, field):
+    return (field_hash(keys, seed, field) >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def bounded(keys, seed, field, n):
+    return (field_hash(keys, seed, field) % np.uint64(n)).astype(np.int64)
+
+
+@lru_cache(maxsize=None)
+def faker():
+    """A shared Faker for the random sample data"""
+    # Importing faker and loading its providers costs ~100 ms; only pay it when used
+    from faker import Faker
+    return Faker()
+
+
+@lru_cache(maxsize=8)
+def text_pools(seed):
+    """Faker output sampled once per seed; rows pick from these by hash"""
+    from faker import Faker
+    fake = Faker()
+    fake.seed_instance(seed)
+    return {
+        'name': np.array([fake.catch_phrase() for _ in range(POOL_SIZE)], dtype=object),
+        'description': np.array([fake.text(max_nb_chars=200) for _ in range(POOL_SIZE)], dtype=object),
+        'user': np.array([fake.name() for _ in range(POOL_SIZE)], dtype=object),
+        'comment': np.array([fake.paragraph() for _ in range(POOL_SIZE)], dtype=object),
+        'category': np.array(CATEGORIES, dtype=object),
+    }
+
+
+def csv_cell(value):
+    if any(c in value for c in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+# Fixture row layouts; text fields arrive pre-encoded from encoded_pools()
+ROW_FORMATS = {
+    'json': ('{"id": "%s", "name": %s, "description": %s, "price": %r, "category": %s, '
+             '"image_url": "%s", "rating": %r, "stock": %d, "created_at": "%s"}', json.dumps),
+    'csv': ('%s,%s,%s,%r,%s,%s,%r,%d,%s', csv_cell),
+}
+
+
+@lru_cache(maxsize=8)
+def encoded_pools(seed, fmt):
+    """The text pools encoded once for a fixture format, so rows are built by formatting"""
+    encode = ROW_FORMATS[fmt][1]
+    return {name: np.array([encode(v) for v in pool], dtype=object)
+            for name, pool in text_pools(seed).items()}
+
+
+def id_prefix(seed):
+    """High 64 bits shared by every product ID of a seed (UUID version 4 nibble set)"""
+    hi = int(mix([seed ^ SALT['id']])[0])
+    return (hi & ~0xF000) | 0x4000
+
+
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+# Positions of the 32 hex digits inside the 36-char canonical UUID string
+UUID_DIGIT_POS = np.array([i for i in range(36) if i not in (8, 13, 18, 23)])
+
+
+def format_uuids(hi, lo):
+    """Canonical UUID strings for 128-bit values split into hi/lo uint64 arrays"""
+    words = np.empty((len(hi), 2), dtype='>u8')
+    words[:, 0] = hi
+    words[:, 1] = lo
+    raw = words.view(np.uint8).reshape(-1, 16)
+    nibbles = np.stack([raw >> 4, raw & 15], axis=2).reshape(-1, 32)
+    chars = np.full((len(raw), 36), ord('-'), dtype=np.uint8)
+    chars[:, UUID_DIGIT_POS] = HEX_DIGITS[nibbles]
+    return chars.view('S36').ravel().astype('U36').tolist()
+
+
+def scramble(keys):
+    mask = np.uint64(KEY_MASK)
+    x = (keys + np.uint64(KEY_OFFSET)) & mask
+    for mult in KEY_MULT:
+        x = (x * np.uint64(mult)) & mask
+        x ^= x >> np.uint64(KEY_SHIFT)
+    return x
+
+
+def unscramble(value):
+    x = value
+    for inv in reversed(KEY_MULT_INV):
+        # Undo x ^= x >> KEY_SHIFT by re-applying it until every bit is restored
+        y = x
+        for _ in range(KEY_BITS // KEY_SHIFT):
+            y = x ^ (y >> KEY_SHIFT)
+        x = y * inv & KEY_MASK
+    return (x - KEY_OFFSET) & KEY_MASK
+
+
+def product_ids(keys, seed):
+    lo = scramble(keys) | np.uint64(2 << KEY_BITS)
+    hi = np.full(len(keys), id_prefix(seed), dtype=np.uint64)
+    return format_uuids(hi, lo)
+
+
+def key_for_id(product_id, seed):
+    """Recover the key of a generated ID; unknown IDs hash to a stable key"""
+    try:
+        value = uuid.UUID(product_id).int
+    except (ValueError, AttributeError, TypeError):
+        value = None
+    if value is not None and value >> 64 == id_prefix(seed):
+        return unscramble(value & KEY_MASK)
+    digest = hashlib.blake2b(str(product_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & KEY_MASK
+
+
+def timestamps(keys, seed, field, days):
+    offsets = bounded(keys, seed, field, days * 86400) + 86400
+    return np.datetime_as_string(EPOCH - offsets.astype('timedelta64[s]'), unit='s')
+
+
+def product_columns(keys, seed=42, pools=None, fields=PRODUCT_FIELDS):
+    """Column arrays for the products with the given keys; only the given fields are built"""
+    keys = np.asarray(keys, dtype=np.uint64)
+    pools = pools or text_pools(seed)
+    builders = {
+        'id': lambda: product_ids(keys, seed),
+        'name': lambda: pools['name'][bounded(keys, seed, 'name', POOL_SIZE)],
+        'description': lambda: pools['description'][bounded(keys, seed, 'description', POOL_SIZE)],
+        'price': lambda: np.round(9.99 + uniform(keys, seed, 'price') * (999.99 - 9.99), 2),
+        'category': lambda: pools['category'][bounded(keys, seed, 'category', len(CATEGORIES))],
+        'image_url': lambda: np.char.add(np.char.add('https://picsum.photos/seed/',
+                                                     (bounded(keys, seed, 'image', 1000) + 1).astype(str)),
+                                         '/400/300'),
+        'rating': lambda: np.round(3.5 + uniform(keys, seed, 'rating') * 1.5, 1),
+        'stock': lambda: bounded(keys, seed, 'stock', 101),
+        'created_at': lambda: timestamps(keys, seed, 'created', 365),
+    }
+    return {field: builders[field]() for field in fields}
+
+
+def column_lists(columns, fields):
+    # Plain Python lists are much faster to zip/format than numpy scalars
+    return [columns[f].tolist() if hasattr(columns[f], 'tolist') else columns[f] for f in fields]
+
+
+def columns_to_rows(columns, fields, record=None):
+    """Rows as dicts, or as record(*values) for a record type from records.py"""
+    if record is not None:
+        return [record(*row) for row in zip(*column_lists(columns, fields))]
+    return [dict(zip(fields, row)) for row in zip(*column_lists(columns, fields))]
+
+
+def key_range(count, offset):
+    if count < 0 or offset < 0 or offset + count > 1 << KEY_BITS:
+        raise ValueError(f'Keys {offset}..{offset + count - 1} are outside 0..2**{KEY_BITS}-1')
+    return np.arange(offset, offset + count, dtype=np.uint64)
+
+
+def generate_products(count, seed=42, offset=0, record=None):
+    """Products for keys offset..offset+count-1 as a list of dicts (or records)"""
+    keys = key_range(count, offset)
+    return columns_to_rows(product_columns(keys, seed), PRODUCT_FIELDS, record)
+
+
+def generate_product_lists(count, seed=42, offset=0, fields=PRODUCT_FIELDS):
+    """The same products as {field: list}, building only the given fields"""
+    keys = key_range(count, offset)
+    return dict(zip(fields, column_lists(product_columns(keys, seed, fields=fields), fields)))
+
+
+def product_for_id(product_id, seed=42):
+    product = generate_products(1, seed, key_for_id(product_id, seed))[0]
+    product['id'] = product_id
+    return product
+
+
+def generate_reviews(product_key, seed=42):
+    """3-10 reviews that always belong to the same product"""
+    count = 3 + int(bounded(np.array([product_key], dtype=np.uint64), seed, 'reviews', 8)[0])
+    # Review keys are derived from the product key, so they never collide across products
+    keys = mix(np.full(count, product_key, dtype=np.uint64)) ^ np.arange(count, dtype=np.uint64)
+    pools = text_pools(seed)
+    ids = field_hash(keys, seed, 'review_id')
+    columns = {
+        'id': format_uuids((ids & ~np.uint64(0xF000)) | np.uint64(0x4000),
+                           (mix(ids) & np.uint64(KEY_MASK)) | np.uint64(2 << KEY_BITS)),
+        'user_name': pools['user'][bounded(keys, seed, 'user', POOL_SIZE)],
+        'rating': bounded(keys, seed, 'review_rating', 5) + 1,
+        'comment': pools['comment'][bounded(keys, seed, 'comment', POOL_SIZE)],
+        'created_at': timestamps(keys, seed, 'created', 365),
+    }
+    return columns_to_rows(columns, ['id', 'user_name', 'rating', 'comment', 'created_at'])
+
+
+def product_detail(product_id, seed=42):
+    """A product with its reviews, as served by /products/<id>"""
+    product = product_for_id(product_id, seed)
+    product['reviews'] = generate_reviews(key_for_id(product_id, seed), seed)
+    return product
+
+
+def sample_categories(fake):
+    # Unlike products, categories and users are plain random Faker data
+    return [
+        {
+            "id": fake.uuid4(),
+            "name": category,
+            "description": fake.text(max_nb_chars=100),
+            "product_count": random.randint(10, 100)
+        }
+        for category in CATEGORIES
+    ]
+
+
+def sample_user(fake):
+    return {
+        "id": fake.uuid4(),
+        "name": fake.name(),
+        "email": fake.email(),
+        "avatar": f"https://i.pravatar.cc/150?u={fake.uuid4()}",
+        "address": {
+            "street": fake.street_address(),
+            "city": fake.city(),
+            "state": fake.state(),
+            "zip_code": fake.zipcode()
+        },
+        "orders": [
+            {
+                "id": fake.uuid4(),
+                "date": fake.date_time_this_year().isoformat(),
+                "total": round(random.uniform(20, 500), 2),
+                "status": random.choice(["pending", "shipped", "delivered"])
+            } for _ in range(random.randint(2, 5))
+        ]
+    }
+
+
+def write_fixture(out, count, seed, fmt, chunk=100_000):
+    kind = 'csv' if fmt == 'csv' else 'json'
+    row_format = ROW_FORMATS[kind][0]
+    pools = encoded_pools(seed, kind)
+    if fmt == 'csv':
+        out.write(','.join(PRODUCT_FIELDS) + '\n')
+    elif fmt == 'json':
+        out.write('[')
+    for offset in range(0, count, chunk):
+        keys = np.arange(offset, min(offset + chunk, count), dtype=np.uint64)
+        values = column_lists(product_columns(keys, seed, pools), PRODUCT_FIELDS)
+        lines = [row_format % row for row in zip(*values)]
+        if fmt == 'json':
+            out.write((',' if offset else '') + ','.join(lines))
+        else:
+            out.write('\n'.join(lines) + '\n')
+    if fmt == 'json':
+        out.write(']\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a deterministic product fixture file')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=['jsonl', 'json', 'csv'], default='jsonl')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args(argv)
+    if args.output:
+        with open(args.output, 'w', newline='') as out:
+            write_fixture(out, args.count, args.seed, args.format)
+    else:
+        write_fixture(sys.stdout, args.count, args.seed, args.format)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Compact response formats for product listings.
+
+    ?fields=id,name,price,image_url   only these fields are built and sent
+    ?layout=columns                   {"id": [...], "name": [...]} instead of a list of objects
+    Accept: application/msgpack       MessagePack instead of JSON
+
+Any of these switches /products/ from the marshalled list to this module's encoders;
+a plain request gets exactly the documented product_model list as before.
+
+    python formats.py --count 1000    # payload size and client decode time per format
+"""
+import argparse
+import json
+import time
+
+import catalog
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+# Aliases clients send for MessagePack
+MEDIA_TYPES = {JSON: JSON, MSGPACK: MSGPACK, 'application/x-msgpack': MSGPACK}
+LAYOUTS = ('rows', 'columns')
+# Largest ?count= one request may build
+MAX_COUNT = 100_000
+
+
+class FormatError(ValueError):
+    pass
+
+
+def parse_fields(value, allowed=catalog.PRODUCT_FIELDS):
+    """?fields= as a list in the order given, or None for all fields"""
+    if not value:
+        return None
+    fields = list(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        raise FormatError(f"Unknown field(s): {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    return fields
+
+
+def parse_int(name, value, default, maximum):
+    if value is None or value == '':
+        return default
+    if not (value.isascii() and value.isdigit()) or int(value) > maximum:
+        raise FormatError(f'{name} must be a whole number from 0 to {maximum}')
+    return int(value)
+
+
+def parse_page(count, offset):
+    """?count= and ?offset= as ints, checked against the catalog's key space"""
+    keys = 1 << catalog.KEY_BITS
+    count = parse_int('count', count, 10, MAX_COUNT)
+    offset = parse_int('offset', offset, 0, keys - count)
+    return count, offset
+
+
+def parse_layout(value):
+    layout = value or 'rows'
+    if layout not in LAYOUTS:
+        raise FormatError(f"Unknown layout {layout!r}; choose from {', '.join(LAYOUTS)}")
+    return layout
+
+
+def accept_ranges(accept):
+    for part in accept.split(','):
+        media, *params = [p.strip() for p in part.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media:
+            yield media.lower(), q
+
+
+def negotiate(accept):
+    """MessagePack if the Accept header prefers it, otherwise JSON (as flask-restx falls back to)"""
+    if not accept:
+        return JSON
+    best, best_q = JSON, 0.0
+    for offered in (JSON, MSGPACK):
+        # The most specific matching range decides the quality
+        matches = {}
+        for media, q in accept_ranges(accept):
+            if MEDIA_TYPES.get(media) == offered:
+                matches[2] = max(q, matches.get(2, 0.0))
+            elif media == 'application/*':
+                matches[1] = max(q, matches.get(1, 0.0))
+            elif media == '*/*':
+                matches[0] = max(q, matches.get(0, 0.0))
+        q = matches[max(matches)] if matches else 0.0
+        if q > best_q:
+            best, best_q = offered, q
+    return best
+
+
+def encode(lists, layout='rows', media_type=JSON):
+    """Encode {field: list} columns as rows or columns, in JSON or MessagePack"""
+    if layout == 'columns':
+        body = lists
+    else:
+        body = [dict(zip(lists, row)) for row in zip(*lists.values())]
+    if media_type == MSGPACK:
+        # Imported on first use; most clients never ask for MessagePack
+        import msgpack
+        return msgpack.packb(body)
+    return json.dumps(body, separators=(',', ':')).encode()
+
+
+def decode(payload, media_type=JSON):
+    if media_type == MSGPACK:
+        import msgpack
+        return msgpack.unpackb(payload)
+    return json.loads(payload)
+
+
+def timed(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare listing payloads across formats')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fields', default='id,name,price,image_url')
+    args = parser.parse_args(argv)
+
+    full = catalog.generate_product_lists(args.count, args.seed)
+    sparse = parse_fields(args.fields)
+    projected = catalog.generate_product_lists(args.count, args.seed, fields=sparse)
+    # What the marshalled endpoint sends today
+    baseline = (json.dumps(catalog.generate_products(args.count, args.seed)) + '\n').encode()
+
+    print(f'{args.count} products, sparse fields: {",".join(sparse)}')
+    print(f"{'format':<34} {'bytes':>10} {'size':>6} {'decode ms':>10} {'speedup':>8}")
+    baseline_ms = timed(lambda: json.loads(baseline))
+    print(f"{'json rows (current)':<34} {len(baseline):>10,} {'1.00x':>6} {baseline_ms:>10.2f} {'1.00x':>8}")
+    for lists, label in [(full, 'all'), (projected, 'sparse')]:
+        for media_type in (JSON, MSGPACK):
+            for layout in LAYOUTS:
+                payload = encode(lists, layout, media_type)
+                ms = timed(lambda: decode(payload, media_type))
+                name = f"{media_type.split('/')[1]} {layout}, {label} fields"
+                print(f'{name:<34} {len(payload):>10,} {len(payload) / len(baseline):>5.2f}x '
+                      f'{ms:>10.2f} {baseline_ms / ms:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# Copied into every app that uses it; after editing, run: python bench/sync_shared.py --from <this app>
+"""Opt-in per-request profiling for the Flask and FastAPI apps.
+
+Nothing is registered unless profiling is configured, so a disabled app pays no
+per-request cost at all. Configure with environment variables:
+
+    PROFILE_SAMPLE_RATE  fraction of requests to profile (default 0)
+    PROFILE_TOKEN        requests sending "X-Profile: <token>" are always profiled;
+                         the same token unlocks the Flask listing endpoint
+    PROFILE_MODE         "sample" (stack sampling, default) or "cprofile"
+    PROFILE_INTERVAL_MS  sampling interval (default 1)
+    PROFILE_DIR          where profiles are written (default /tmp/profiles)
+    PROFILE_KEEP         how many profiles to keep (default 200)
+
+Sampling mode writes a collapsed-stack file (flamegraph.pl / speedscope) and a
+speedscope JSON file; cprofile mode writes a .pstats file. Profiles are listed at
+/_profiles/ and downloaded from /_profiles/<name> (FastAPI apps can guard these
+with their own admin dependency instead of the token). Under asyncio the sampler
+watches the event loop thread, so stacks of concurrent requests can show up too.
+"""
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+TOKEN = os.environ.get("PROFILE_TOKEN", "")
+MODE = os.environ.get("PROFILE_MODE", "sample")
+INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", 1)) / 1000
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/profiles")
+KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+
+EXTENSIONS = (".collapsed", ".speedscope.json", ".pstats")
+
+
+def enabled():
+    return SAMPLE_RATE > 0 or bool(TOKEN)
+
+
+def should_profile(header_value):
+    if TOKEN and header_value == TOKEN:
+        return True
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer thread"""
+
+    def __init__(self, thread_id, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def write(self, base):
+        with open(base + ".collapsed", "w") as f:
+            for stack, count in self.counts.items():
+                f.write(";".join(f"{name} ({os.path.basename(path)}:{line})"
+                                 for name, path, line in stack) + f" {count}\n")
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, count in self.counts.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            samples.append(ids)
+            weights.append(count * self.interval * 1000)
+        speedscope = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": os.path.basename(base),
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "exporter": "profiling.py",
+        }
+        with open(base + ".speedscope.json", "w") as f:
+            json.dump(speedscope, f)
+
+
+class CProfiler:
+    def __init__(self, thread_id=None):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.elapsed = time.perf_counter() - self.started
+
+    def write(self, base):
+        self.profile.dump_stats(base + ".pstats")
+
+
+def start_profiler():
+    profiler = (CProfiler if MODE == "cprofile" else StackSampler)(threading.get_ident())
+    profiler.start()
+    return profiler
+
+
+def finish_profiler(profiler, method, path):
+    """Stop the profiler, write its files and return the profile name"""
+    profiler.stop()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")[:60] or "root"
+    name = f"{datetime.now():%Y%m%dT%H%M%S%f}-{method}-{slug}-{profiler.elapsed * 1000:.0f}ms"
+    profiler.write(os.path.join(PROFILE_DIR, name))
+    prune()
+    return name
+
+
+def prune():
+    names = sorted(list_profiles(), reverse=True)
+    for name in names[KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def list_profiles():
+    try:
+        return sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(EXTENSIONS))
+    except FileNotFoundError:
+        return []
+
+
+def profile_path(name):
+    # Only names we list are downloadable; rules out path traversal
+    return os.path.join(PROFILE_DIR, name) if name in list_profiles() else None
+
+
+def init_flask(app):
+    if not enabled():
+        return
+    from flask import abort, g, jsonify, request, send_file
+
+    @app.before_request
+    def start_request_profile():
+        if should_profile(request.headers.get("X-Profile")):
+            g.profiler = start_profiler()
+
+    @app.after_request
+    def finish_request_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            response.headers["X-Profile-Id"] = finish_profiler(profiler, request.method, request.path)
+        return response
+
+    @app.teardown_request
+    def stop_request_profile(exc):
+        # Requests that raised never reach after_request
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            finish_profiler(profiler, request.method, request.path)
+
+    def check_token():
+        if not TOKEN or request.headers.get("X-Profile-Token", request.args.get("token")) != TOKEN:
+            abort(404)
+
+    @app.route("/_profiles/")
+    def profiles_index():
+        check_token()
+        return jsonify(list_profiles())
+
+    @app.route("/_profiles/<name>")
+    def profiles_download(name):
+        check_token()
+        path = profile_path(name)
+        if path is None:
+            abort(404)
+        return send_file(path, as_attachment=True)
+
+
+def init_fastapi(app, admin_dependency=None):
+    """Profile FastAPI requests; the listing routes are guarded by admin_dependency"""
+    if not enabled():
+        return
+    import asyncio
+    from fastapi import Depends, Header, HTTPException
+    from fastapi.responses import FileResponse
+
+    @app.middleware("http")
+    async def profile_request(request, call_next):
+        if not should_profile(request.headers.get("X-Profile")):
+            return await call_next(request)
+        profiler = start_profiler()
+        try:
+            response = await call_next(request)
+        finally:
+            # File writes happen off the event loop
+            name = await asyncio.to_thread(finish_profiler, profiler, request.method, request.url.path)
+        response.headers["X-Profile-Id"] = name
+        return response
+
+    def check_token(x_profile_token: str = Header(default="")):
+        if not TOKEN or x_profile_token != TOKEN:
+            raise HTTPException(status_code=404)
+
+    dependencies = [Depends(admin_dependency or check_token)]
+
+    @app.get("/_profiles/", dependencies=dependencies)
+    async def profiles_index():
+        return list_profiles()
+
+    @app.get("/_profiles/{name}", dependencies=dependencies)
+    async def profiles_download(name: str):
+        path = profile_path(name)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return FileResponse(path, filename=name)
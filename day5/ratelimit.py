@@ -0,0 +1,312 @@
+# Copied into every app that uses it; after editing, run: python bench/sync_shared.py --from <this app>
+"""Per-client rate limits and adaptive load shedding.
+
+Rate limits apply per client IP and route prefix. In-process they are token
+buckets; with REDIS_URL set they become a sliding-window counter shared by every
+replica. A request over its limit gets 429 with Retry-After.
+
+Separately, an adaptive concurrency limiter caps the requests a process works on
+at once. The cap grows by one per window of healthy responses and shrinks by 10%,
+at most once per window, when requests fail or a route's recent latency climbs
+well above its long-run average. Comparing averages rather than single requests
+keeps a route with mixed costs (?count=1 next to ?count=1000) from reading every
+expensive request as congestion, and the long-run average decays, so the limiter
+follows lasting changes in a route's cost. Excess requests are shed immediately
+with 503 + Retry-After instead of queueing behind the ones already running.
+
+    RATE_LIMITS            overrides the app's rules, "prefix=count/unit[:burst];..."
+                           e.g. "/products/=20/s:40;/upload=10/m"; empty disables
+    TRUST_FORWARDED_FOR    1 = key clients by the last X-Forwarded-For hop (behind nginx)
+    CONCURRENCY_LIMIT      starting limit (default 20, 0 disables shedding)
+    CONCURRENCY_MIN / CONCURRENCY_MAX
+                           bounds for the adaptive limit (default 2 / 200)
+    WEB_THREADS            threads per gunicorn worker (default 4, as in serve.py).
+                           A Flask worker can't run more requests than that, so
+                           its limit stays one below: at or above, nothing would
+                           be shed and the excess would queue in gunicorn instead
+    CONCURRENCY_TOLERANCE  recent latency this many times the route's long-run
+                           average counts as congestion (default 2)
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger("ratelimit")
+
+requests_shed_total = Counter("requests_shed_total", "Requests rejected before running", ["reason", "route"])
+concurrency_limit_gauge = Gauge("concurrency_limit", "Current adaptive concurrency limit")
+requests_in_flight = Gauge("requests_in_flight", "Requests currently being handled")
+
+TRUST_FORWARDED_FOR = os.environ.get("TRUST_FORWARDED_FOR") == "1"
+CONCURRENCY_LIMIT = int(os.environ.get("CONCURRENCY_LIMIT", 20))
+CONCURRENCY_MIN = int(os.environ.get("CONCURRENCY_MIN", 2))
+CONCURRENCY_MAX = int(os.environ.get("CONCURRENCY_MAX", 200))
+CONCURRENCY_TOLERANCE = float(os.environ.get("CONCURRENCY_TOLERANCE", 2))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 4))
+# Health checks and scrapes must keep working while the app sheds load
+EXEMPT_PATHS = ("/health", "/livez", "/readyz", "/metrics")
+# EWMA weights of a route's recent (about 10 requests) and long-run (about 100) latency
+RECENT_WEIGHT = 0.1
+LONG_RUN_WEIGHT = 0.01
+UNITS = {"s": 1, "m": 60, "h": 3600}
+MAX_BUCKETS = 10000
+
+
+class Rule:
+    def __init__(self, prefix, count, period, burst=None):
+        self.prefix = prefix
+        self.count = count
+        self.period = period
+        self.rate = count / period
+        self.burst = burst or count
+
+    def __repr__(self):
+        return f"Rule({self.prefix!r}, {self.count}/{self.period}s, burst={self.burst})"
+
+
+def parse_rules(spec):
+    """Parse "prefix=count/unit[:burst];..." into rules, longest prefix first"""
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        prefix, limit = item.rsplit("=", 1)
+        limit, _, burst = limit.partition(":")
+        count, _, unit = limit.partition("/")
+        rules.append(Rule(prefix.strip(), int(count), UNITS[unit.strip() or "s"], int(burst) if burst else None))
+    return sorted(rules, key=lambda rule: len(rule.prefix), reverse=True)
+
+
+def rules_from_env(defaults):
+    spec = os.environ.get("RATE_LIMITS")
+    if spec is None:
+        return parse_rules(";".join(f"{prefix}={limit}" for prefix, limit in defaults.items()))
+    return parse_rules(spec)
+
+
+def match(rules, path):
+    for rule in rules:
+        if path.startswith(rule.prefix):
+            return rule
+    return None
+
+
+def client_key(remote_addr, forwarded_for):
+    if TRUST_FORWARDED_FOR and forwarded_for:
+        # Our proxy appends the address it saw; earlier entries are client-supplied
+        return forwarded_for.split(",")[-1].strip()
+    return remote_addr or "unknown"
+
+
+class TokenBuckets:
+    """In-process token buckets; hit() returns 0 when allowed, else seconds to wait.
+
+    At most max_buckets are kept, least recently used first out, so many distinct
+    clients cost bounded memory and constant time per hit.
+    """
+
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self.buckets = OrderedDict()
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+
+    def hit(self, key, rule):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (rule.burst, now))
+            tokens = min(rule.burst, tokens + (now - updated) * rule.rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self.buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rule.rate
+            self.buckets.move_to_end(key)
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class RedisWindows:
+    """Sliding-window counters in Redis, shared by every replica"""
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def hit(self, key, rule):
+        now = time.time()
+        window, position = divmod(now, rule.period)
+        current = f"ratelimit:{key}:{int(window)}"
+        try:
+            pipe = self.redis.pipeline()
+            pipe.incr(current)
+            pipe.expire(current, int(rule.period * 2) + 1)
+            pipe.get(f"ratelimit:{key}:{int(window) - 1}")
+            count, _, previous = pipe.execute()
+        except Exception as e:
+            # Fail open: an unreachable Redis must not take the API down with it
+            logger.warning("rate limit backend failed: %s", e)
+            return 0
+        # Weight the previous window by how much of it still overlaps the sliding window
+        estimate = int(previous or 0) * (1 - position / rule.period) + count
+        return 0 if estimate <= rule.count else rule.period - position
+
+
+def limiter_from_env():
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        return TokenBuckets()
+    if url.startswith("memory://"):
+        import fakeredis
+        return RedisWindows(fakeredis.FakeRedis())
+    import redis
+    return RedisWindows(redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5))
+
+
+class ConcurrencyLimiter:
+    """AIMD concurrency limit driven by each route's latency gradient"""
+
+    def __init__(self, limit=CONCURRENCY_LIMIT, min_limit=CONCURRENCY_MIN, max_limit=CONCURRENCY_MAX,
+                 tolerance=CONCURRENCY_TOLERANCE):
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.in_flight = 0
+        # route -> (recent, long-run) latency averages
+        self.latency = {}
+        self.since_decrease = 0
+        self.lock = threading.Lock()
+        concurrency_limit_gauge.set(self.limit)
+
+    def acquire(self):
+        with self.lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+        requests_in_flight.inc()
+        return True
+
+    def release(self, route, seconds, ok):
+        with self.lock:
+            self.in_flight -= 1
+            recent, long_run = self.latency.get(route, (seconds, seconds))
+            recent += (seconds - recent) * RECENT_WEIGHT
+            long_run += (seconds - long_run) * LONG_RUN_WEIGHT
+            self.latency[route] = (recent, long_run)
+            self.since_decrease += 1
+            if not ok or recent > long_run * self.tolerance:
+                # Once per window, like TCP: the requests already in flight started
+                # under the old limit and would otherwise cut it again and again
+                if self.since_decrease >= self.limit:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                    self.since_decrease = 0
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            limit = self.limit
+        requests_in_flight.dec()
+        concurrency_limit_gauge.set(limit)
+
+
+def retry_after(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+def init_flask(app, defaults):
+    """Rate-limit the prefixes in defaults ({prefix: "count/unit[:burst]"}) and shed load"""
+    from flask import g, jsonify, request
+
+    rules = rules_from_env(defaults)
+    limiter = limiter_from_env() if rules else None
+    concurrency = None
+    if CONCURRENCY_LIMIT > 0:
+        # One thread stays free to answer what's shed, health checks included
+        ceiling = max(1, WEB_THREADS - 1)
+        concurrency = ConcurrencyLimiter(limit=min(CONCURRENCY_LIMIT, ceiling),
+                                         min_limit=min(CONCURRENCY_MIN, ceiling),
+                                         max_limit=min(CONCURRENCY_MAX, ceiling))
+    if not rules and concurrency is None:
+        return
+
+    def reject(status, reason, seconds, route):
+        requests_shed_total.labels(reason, route).inc()
+        response = jsonify({"message": "Too many requests" if status == 429 else "Server busy, retry later"})
+        response.status_code = status
+        response.headers["Retry-After"] = retry_after(seconds)
+        return response
+
+    @app.before_request
+    def limit_request():
+        if request.path.startswith(EXEMPT_PATHS):
+            return None
+        rule = match(rules, request.path)
+        if rule is not None:
+            key = client_key(request.remote_addr, request.headers.get("X-Forwarded-For"))
+            wait = limiter.hit(f"{rule.prefix}:{key}", rule)
+            if wait:
+                return reject(429, "rate_limit", wait, rule.prefix)
+        if concurrency is not None:
+            if not concurrency.acquire():
+                return reject(503, "concurrency", 1, "*")
+            g.concurrency_started = time.perf_counter()
+        return None
+
+    @app.after_request
+    def record_status(response):
+        g.concurrency_ok = response.status_code < 500
+        return response
+
+    @app.teardown_request
+    def release_slot(exc):
+        started = g.pop("concurrency_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            ok = exc is None and g.pop("concurrency_ok", False)
+            concurrency.release(route, time.perf_counter() - started, ok)
+
+
+def init_fastapi(app, defaults):
+    import asyncio
+    from fastapi.responses import JSONResponse
+
+    rules = rules_from_env(defaults)
+    limiter = limiter_from_env() if rules else None
+    concurrency = ConcurrencyLimiter() if CONCURRENCY_LIMIT > 0 else None
+    if not rules and concurrency is None:
+        return
+
+    def reject(status, reason, seconds, route):
+        requests_shed_total.labels(reason, route).inc()
+        detail = "Too many requests" if status == 429 else "Server busy, retry later"
+        return JSONResponse({"detail": detail}, status_code=status, headers={"Retry-After": retry_after(seconds)})
+
+    @app.middleware("http")
+    async def limit_request(request, call_next):
+        path = request.url.path
+        if path.startswith(EXEMPT_PATHS):
+            return await call_next(request)
+        rule = match(rules, path)
+        if rule is not None:
+            key = client_key(request.client.host if request.client else None, request.headers.get("x-forwarded-for"))
+            if isinstance(limiter, RedisWindows):
+                wait = await asyncio.to_thread(limiter.hit, f"{rule.prefix}:{key}", rule)
+            else:
+                wait = limiter.hit(f"{rule.prefix}:{key}", rule)
+            if wait:
+                return reject(429, "rate_limit", wait, rule.prefix)
+        if concurrency is None:
+            return await call_next(request)
+        if not concurrency.acquire():
+            return reject(503, "concurrency", 1, "*")
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = await call_next(request)
+            ok = response.status_code < 500
+            return response
+        finally:
+            route = request.scope.get("route")
+            concurrency.release(getattr(route, "path", "unmatched"), time.perf_counter() - started, ok)
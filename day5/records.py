@@ -0,0 +1,233 @@
+"""Compact record types for products, reviews, categories and users.
+
+A dict spends most of its memory on its hash table; a class with __slots__ keeps
+the same fields in a fixed array, roughly a third of the size. Every type serializes
+to exactly the JSON shape product_model / review_model document, and flask-restx
+marshals them as-is since it reads fields with getattr. The API's product
+listings are built as records via catalog.generate_products(..., record=Product);
+categories and the current user are converted from their Faker dicts.
+
+    python records.py --count 100000    # bytes per record and serialization speed, vs dicts
+"""
+import argparse
+import json
+import time
+
+import catalog
+
+
+class Record:
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    @classmethod
+    def from_dicts(cls, rows):
+        return [cls.from_dict(row) for row in rows]
+
+
+class Review(Record):
+    __slots__ = ('id', 'user_name', 'rating', 'comment', 'created_at')
+
+    def __init__(self, id, user_name, rating, comment, created_at):
+        self.id = id
+        self.user_name = user_name
+        self.rating = rating
+        self.comment = comment
+        self.created_at = created_at
+
+    def to_dict(self):
+        return {'id': self.id, 'user_name': self.user_name, 'rating': self.rating,
+                'comment': self.comment, 'created_at': self.created_at}
+
+
+class Product(Record):
+    __slots__ = ('id', 'name', 'description', 'price', 'category', 'image_url', 'rating', 'stock',
+                 'created_at', 'reviews')
+
+    def __init__(self, id, name, description, price, category, image_url, rating, stock, created_at,
+                 reviews=None):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.price = price
+        self.category = category
+        self.image_url = image_url
+        self.rating = rating
+        self.stock = stock
+        self.created_at = created_at
+        self.reviews = reviews
+
+    def to_dict(self):
+        data = {'id': self.id, 'name': self.name, 'description': self.description, 'price': self.price,
+                'category': self.category, 'image_url': self.image_url, 'rating': self.rating,
+                'stock': self.stock, 'created_at': self.created_at}
+        if self.reviews is not None:
+            data['reviews'] = [review.to_dict() for review in self.reviews]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        reviews = data.get('reviews')
+        return cls(**{**data, 'reviews': None if reviews is None else [Review.from_dict(r) for r in reviews]})
+
+
+class Category(Record):
+    __slots__ = ('id', 'name', 'description', 'product_count')
+
+    def __init__(self, id, name, description, product_count):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.product_count = product_count
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'description': self.description,
+                'product_count': self.product_count}
+
+
+class Address(Record):
+    __slots__ = ('street', 'city', 'state', 'zip_code')
+
+    def __init__(self, street, city, state, zip_code):
+        self.street = street
+        self.city = city
+        self.state = state
+        self.zip_code = zip_code
+
+    def to_dict(self):
+        return {'street': self.street, 'city': self.city, 'state': self.state, 'zip_code': self.zip_code}
+
+
+class Order(Record):
+    __slots__ = ('id', 'date', 'total', 'status')
+
+    def __init__(self, id, date, total, status):
+        self.id = id
+        self.date = date
+        self.total = total
+        self.status = status
+
+    def to_dict(self):
+        return {'id': self.id, 'date': self.date, 'total': self.total, 'status': self.status}
+
+
+class User(Record):
+    __slots__ = ('id', 'name', 'email', 'avatar', 'address', 'orders')
+
+    def __init__(self, id, name, email, avatar, address, orders):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.avatar = avatar
+        self.address = address
+        self.orders = orders
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'email': self.email, 'avatar': self.avatar,
+                'address': self.address.to_dict(), 'orders': [order.to_dict() for order in self.orders]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{**data, 'address': Address.from_dict(data['address']),
+                      'orders': [Order.from_dict(o) for o in data['orders']]})
+
+
+def to_json(value):
+    """json.dumps default= hook: records serialize as their dict shape"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def copy_containers(value):
+    """New dicts and lists around the same leaf values"""
+    if isinstance(value, dict):
+        return {key: copy_containers(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_containers(item) for item in value]
+    return value
+
+
+def bytes_per_record(build, count):
+    """Memory allocated by build() and still held by its result, per record"""
+    # Benchmark only; importing tracemalloc costs more than the rest of this module
+    import tracemalloc
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del held
+    return size / count
+
+
+def throughput(serialize, count, repeat=3):
+    best = min(timed(serialize) for _ in range(repeat))
+    return count / best
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare record representations against dicts')
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--faker-count', type=int, default=2000, help='categories and users to sample')
+    args = parser.parse_args(argv)
+
+    columns = catalog.product_columns(catalog.np.arange(args.count, dtype=catalog.np.uint64), args.seed)
+    fields = catalog.PRODUCT_FIELDS
+    builds = {
+        'dict': lambda: catalog.columns_to_rows(columns, fields),
+        '__slots__': lambda: catalog.columns_to_rows(columns, fields, Product),
+    }
+    held = {name: build() for name, build in builds.items()}
+    serializers = {
+        'dict': lambda: json.dumps(held['dict']),
+        '__slots__': lambda: json.dumps(held['__slots__'], default=to_json),
+    }
+    expected = json.loads(serializers['dict']())
+    assert all(json.loads(serialize()) == expected for serialize in serializers.values())
+
+    # Bytes include the number objects each representation creates; strings come from shared pools
+    print(f'{args.count} products')
+    print(f"{'representation':<16} {'bytes/record':>12} {'json rows/s':>14}")
+    for name, build in builds.items():
+        print(f'{name:<16} {bytes_per_record(build, args.count):>12.1f} '
+              f'{throughput(serializers[name], args.count):>14,.0f}')
+
+    # Faker is slow, so these sample fewer rows. Both sides share the sampled strings
+    # and numbers, so only the containers are counted
+    fake = catalog.faker()
+    samples = {
+        'categories': (Category, [row for _ in range(-(-args.faker_count // len(catalog.CATEGORIES)))
+                                  for row in catalog.sample_categories(fake)][:args.faker_count]),
+        'users': (User, [catalog.sample_user(fake) for _ in range(args.faker_count)]),
+    }
+    for kind, (record, rows) in samples.items():
+        held = record.from_dicts(rows)
+        print(f'\n{len(rows)} {kind}')
+        print(f"{'representation':<16} {'bytes/record':>12} {'json rows/s':>14}")
+        for name, build, value, default in [
+            ('dict', lambda: copy_containers(rows), rows, None),
+            ('__slots__', lambda: record.from_dicts(rows), held, to_json),
+        ]:
+            print(f'{name:<16} {bytes_per_record(build, len(rows)):>12.1f} '
+                  f'{throughput(lambda: json.dumps(value, default=default), len(rows)):>14,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Copied into every app that uses it; after editing, run: python bench/sync_shared.py --from <this app>
+"""Request coalescing: concurrent calls for the same key share one computation.
+
+The first caller for a key (the leader) runs the function; callers arriving while
+it is in flight wait for its result, or get its exception. A waiter that gives up
+after `timeout` seconds stops waiting on the leader and computes on its own, so a
+stuck leader slows requests down instead of failing them.
+
+    flight = SingleFlight("product")
+    product = flight.do(product_id, lambda: load(product_id))                # threads
+    counts = await flight.do_async(key, lambda: asyncio.to_thread(count))     # asyncio
+
+Nothing is cached: once the leader finishes, the next call computes again.
+"""
+import asyncio
+import threading
+import weakref
+
+from prometheus_client import Counter
+
+singleflight_calls_total = Counter(
+    "singleflight_calls_total", "Coalesced calls by outcome", ["name", "result"],
+)
+
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self.calls = {}
+        self.lock = threading.Lock()
+        # asyncio futures belong to one event loop
+        self.futures = weakref.WeakKeyDictionary()
+
+    def count(self, result):
+        singleflight_calls_total.labels(self.name, result).inc()
+
+    def do(self, key, fn):
+        """Run fn() once for all threads asking for key at the same time"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+        if not leader:
+            if not call.done.wait(self.timeout):
+                self.count("timeout")
+                return fn()
+            self.count("merged")
+            if call.error is not None:
+                raise call.error
+            return call.value
+        self.count("leader")
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    async def do_async(self, key, fn):
+        """Await fn() once for all tasks on this event loop asking for key"""
+        loop = asyncio.get_running_loop()
+        futures = self.futures.setdefault(loop, {})
+        while key in futures:
+            future = futures[key]
+            try:
+                value = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                self.count("timeout")
+                return await fn()
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # The leader's request went away; let one of the waiters take over
+                    continue
+                raise
+            self.count("merged")
+            return value
+        self.count("leader")
+        future = futures[key] = loop.create_future()
+        try:
+            value = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody may be waiting; mark the exception as retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del futures[key]
@@ -0,0 +1,335 @@
+"""Read-only, memory-mapped catalog snapshot.
+
+A snapshot is one file that every worker maps instead of building its own copy of
+the catalog: pages live once in the OS page cache and are shared by all
+processes mapping the file, and opening it costs a header parse rather than
+generation. Layout (sections 8-byte aligned, offsets counted from the first one):
+
+    b"CATSNAP1" | u32 header length | JSON header | sections...
+
+    id            (count, 2) big-endian u64: the 128-bit UUID
+    price/rating  f64, stock i32, created_at i64 (Unix seconds)
+    text columns  u32 code per row -> u64 offsets into a UTF-8 heap of distinct values
+    index         open-addressing hash table of u32 (row + 1, 0 = empty) on the ID
+
+    python snapshot.py build --count 1000000 -o catalog.snap
+    python snapshot.py build --from products.jsonl --seed 42 -o catalog.snap
+    python snapshot.py rss catalog.snap --workers 4    # per-worker memory, dicts vs mmap
+
+Set CATALOG_SNAPSHOT=catalog.snap to serve the API from a snapshot. The header
+records the catalog seed (for a JSONL fixture, the --seed it was generated with),
+which reviews are generated from, so it must match CATALOG_SEED.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import uuid
+
+import numpy as np
+
+import catalog
+
+MAGIC = b"CATSNAP1"
+TEXT_FIELDS = ['name', 'description', 'category', 'image_url']
+NUMERIC_FIELDS = {'price': '<f8', 'rating': '<f8', 'stock': '<i4', 'created_at': '<i8'}
+U64 = (1 << 64) - 1
+
+
+def id_hash(hi, lo):
+    return catalog.mix(np.asarray(hi, dtype=np.uint64) ^ np.asarray(lo, dtype=np.uint64))
+
+
+def build_index(ids):
+    """Linear-probing table, filled a round at a time instead of row by row"""
+    slots = 1 << max(4, int(2 * len(ids) - 1).bit_length())
+    mask = np.uint64(slots - 1)
+    table = np.zeros(slots, dtype='<u4')
+    rows = np.arange(len(ids), dtype=np.int64)
+    pos = (id_hash(ids[:, 0], ids[:, 1]) & mask).astype(np.int64)
+    while rows.size:
+        free = np.flatnonzero(table[pos] == 0)
+        # The first row claiming each free slot takes it; everyone else moves on
+        slots_taken, first = np.unique(pos[free], return_index=True)
+        table[slots_taken] = rows[free[first]] + 1
+        placed = np.zeros(rows.size, dtype=bool)
+        placed[free[first]] = True
+        rows, pos = rows[~placed], (pos[~placed] + 1) & int(mask)
+    return table
+
+
+def encode_text(values):
+    """(distinct values, codes) from an object array, or pass an encoded pair through"""
+    if isinstance(values, tuple):
+        return values
+    distinct, codes = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+    return distinct, codes
+
+
+def data_start(header_length):
+    # Section offsets in the header count from here
+    end = len(MAGIC) + 4 + header_length
+    return end + (-end % 8)
+
+
+def write_snapshot(path, ids, columns, seed):
+    """Write ids ((n, 2) u64 hi/lo), PRODUCT_FIELDS columns and the catalog seed to path"""
+    sections, header = [], {'count': len(ids), 'seed': seed, 'columns': {}}
+    position = 0
+
+    def add(array):
+        nonlocal position
+        data = np.ascontiguousarray(array).tobytes()
+        sections.append(data + b'\0' * (-len(data) % 8))
+        entry = {'offset': position, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        position += len(sections[-1])
+        return entry
+
+    header['columns']['id'] = add(np.asarray(ids, dtype='>u8'))
+    for name, dtype in NUMERIC_FIELDS.items():
+        header['columns'][name] = add(np.asarray(columns[name]).astype(dtype))
+    for name in TEXT_FIELDS:
+        distinct, codes = encode_text(columns[name])
+        encoded = [value.encode() for value in distinct]
+        offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        header['columns'][name] = {
+            'codes': add(np.asarray(codes).astype('<u4')),
+            'offsets': add(offsets),
+            'heap': add(np.frombuffer(b''.join(encoded), dtype=np.uint8)),
+        }
+    header['index'] = add(build_index(np.asarray(ids, dtype=np.uint64)))
+
+    blob = json.dumps(header).encode()
+    with open(path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(blob)) + blob)
+        f.write(b'\0' * (data_start(len(blob)) - f.tell()))
+        for section in sections:
+            f.write(section)
+
+
+class Snapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot')
+        (length,) = struct.unpack_from('<I', self.mm, len(MAGIC))
+        header = json.loads(self.mm[len(MAGIC) + 4:len(MAGIC) + 4 + length])
+        self.count = header['count']
+        self.seed = header.get('seed')
+        if self.seed is None:
+            raise ValueError(f'{path} records no catalog seed; rebuild it')
+        base = data_start(length)
+
+        def view(entry):
+            return np.frombuffer(self.mm, dtype=entry['dtype'], count=int(np.prod(entry['shape'])),
+                                 offset=base + entry['offset']).reshape(entry['shape'])
+
+        columns = header['columns']
+        self.ids = view(columns['id'])
+        self.numeric = {name: view(columns[name]) for name in NUMERIC_FIELDS}
+        self.text = {name: (view(columns[name]['codes']), view(columns[name]['offsets']),
+                            base + columns[name]['heap']['offset']) for name in TEXT_FIELDS}
+        self.index = view(header['index'])
+
+    def __len__(self):
+        return self.count
+
+    def strings(self, name, rows):
+        codes, offsets, heap = self.text[name]
+        decoded = {}
+        out = []
+        for code in codes[rows].tolist():
+            value = decoded.get(code)
+            if value is None:
+                start, end = int(offsets[code]), int(offsets[code + 1])
+                value = decoded[code] = self.mm[heap + start:heap + end].decode()
+            out.append(value)
+        return out
+
+    def columns(self, rows, fields=catalog.PRODUCT_FIELDS):
+        columns = {}
+        for name in fields:
+            if name in TEXT_FIELDS:
+                columns[name] = self.strings(name, rows)
+            elif name == 'id':
+                ids = self.ids[rows]
+                columns['id'] = catalog.format_uuids(ids[:, 0].astype(np.uint64), ids[:, 1].astype(np.uint64))
+            elif name == 'created_at':
+                columns['created_at'] = np.datetime_as_string(
+                    self.numeric['created_at'][rows].astype('datetime64[s]'), unit='s')
+            else:
+                columns[name] = self.numeric[name][rows]
+        return columns
+
+    def row_slice(self, count, offset):
+        return slice(max(0, offset), max(0, min(offset + count, self.count)))
+
+    def products(self, count, offset=0, record=None):
+        """Rows offset..offset+count-1 in the same shape as catalog.generate_products"""
+        columns = self.columns(self.row_slice(count, offset))
+        return catalog.columns_to_rows(columns, catalog.PRODUCT_FIELDS, record)
+
+    def product_lists(self, count, offset=0, fields=catalog.PRODUCT_FIELDS):
+        """Rows offset..offset+count-1 as {field: list}, decoding only the given fields"""
+        columns = self.columns(self.row_slice(count, offset), fields)
+        return dict(zip(fields, catalog.column_lists(columns, fields)))
+
+    def find(self, product_id):
+        """Row number for an ID, or None"""
+        try:
+            value = uuid.UUID(str(product_id)).int
+        except ValueError:
+            return None
+        hi, lo = value >> 64, value & U64
+        mask = len(self.index) - 1
+        slot = int(id_hash([hi], [lo])[0]) & mask
+        while True:
+            entry = int(self.index[slot])
+            if entry == 0:
+                return None
+            row = entry - 1
+            if int(self.ids[row, 0]) == hi and int(self.ids[row, 1]) == lo:
+                return row
+            slot = (slot + 1) & mask
+
+    def product_detail(self, product_id):
+        """The product with its reviews, or None if the ID isn't in the snapshot"""
+        row = self.find(product_id)
+        if row is None:
+            return None
+        product = catalog.columns_to_rows(self.columns(slice(row, row + 1)), catalog.PRODUCT_FIELDS)[0]
+        # Keyed like catalog.product_detail, so both serve the same reviews for an ID
+        product['reviews'] = catalog.generate_reviews(catalog.key_for_id(product_id, self.seed), self.seed)
+        return product
+
+
+def open_from_env(seed):
+    """The CATALOG_SNAPSHOT snapshot, if set; it must have been built with seed"""
+    path = os.environ.get('CATALOG_SNAPSHOT')
+    if not path:
+        return None
+    snap = Snapshot(path)
+    if snap.seed != seed:
+        raise ValueError(f'{path} was built with seed {snap.seed}, but CATALOG_SEED is {seed}')
+    return snap
+
+
+def generated_columns(count, seed):
+    """Snapshot columns for the generated catalog, keys 0..count-1"""
+    keys = np.arange(count, dtype=np.uint64)
+    pools = catalog.text_pools(seed)
+    ids = np.empty((count, 2), dtype=np.uint64)
+    ids[:, 0] = catalog.id_prefix(seed)
+    ids[:, 1] = catalog.scramble(keys) | np.uint64(2 << catalog.KEY_BITS)
+    image_numbers = catalog.bounded(keys, seed, 'image', 1000)
+    columns = {
+        'name': (pools['name'], catalog.bounded(keys, seed, 'name', catalog.POOL_SIZE)),
+        'description': (pools['description'], catalog.bounded(keys, seed, 'description', catalog.POOL_SIZE)),
+        'category': (pools['category'], catalog.bounded(keys, seed, 'category', len(catalog.CATEGORIES))),
+        'image_url': (np.array([f'https://picsum.photos/seed/{n + 1}/400/300' for n in range(1000)], dtype=object),
+                      image_numbers),
+        'price': np.round(9.99 + catalog.uniform(keys, seed, 'price') * (999.99 - 9.99), 2),
+        'rating': np.round(3.5 + catalog.uniform(keys, seed, 'rating') * 1.5, 1),
+        'stock': catalog.bounded(keys, seed, 'stock', 101),
+        'created_at': (catalog.EPOCH - (catalog.bounded(keys, seed, 'created', 365 * 86400) + 86400)
+                       .astype('timedelta64[s]')).astype(np.int64),
+    }
+    return ids, columns
+
+
+def jsonl_columns(path):
+    """Snapshot columns from a catalog.py JSONL fixture (or any rows of that shape)"""
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    ids = np.array([divmod(uuid.UUID(row['id']).int, 1 << 64) for row in rows], dtype=np.uint64).reshape(-1, 2)
+    columns = {name: [row[name] for row in rows] for name in TEXT_FIELDS + ['price', 'rating', 'stock']}
+    columns['created_at'] = np.array([row['created_at'] for row in rows], dtype='datetime64[s]').astype(np.int64)
+    return ids, columns
+
+
+def memory_mb(pid):
+    """RSS and PSS (RSS with shared pages split between their users) in MB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1].lower()] = int(parts[1]) / 1024
+    return values
+
+
+def hold_dicts(count, seed, ready, done):
+    products = catalog.generate_products(count, seed)
+    ready.put(os.getpid())
+    done.wait()
+    return products
+
+
+def hold_snapshot(path, ready, done):
+    snap = Snapshot(path)
+    # Touch every page, as serving the whole catalog eventually would
+    for offset in range(0, len(snap), 100_000):
+        snap.products(100_000, offset)
+    ready.put(os.getpid())
+    done.wait()
+
+
+def measure(target, args, workers):
+    # CLI only; the API imports this module and doesn't need multiprocessing
+    import multiprocessing
+    context = multiprocessing.get_context('fork')
+    ready, done = context.Queue(), context.Event()
+    procs = [context.Process(target=target, args=(*args, ready, done)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    pids = [ready.get() for _ in procs]
+    usage = [memory_mb(pid) for pid in pids]
+    done.set()
+    for proc in procs:
+        proc.join()
+    return usage
+
+
+def report_rss(path, workers):
+    snap = Snapshot(path)
+    count, seed = len(snap), snap.seed
+    del snap
+    for label, target, args in [('dicts (before)', hold_dicts, (count, seed)),
+                                ('mmap snapshot (after)', hold_snapshot, (path,))]:
+        usage = measure(target, args, workers)
+        rss = sum(u['rss'] for u in usage) / workers
+        pss = sum(u['pss'] for u in usage) / workers
+        print(f'{label:<22} {count} products x {workers} workers: '
+              f'RSS {rss:.1f} MB/worker, PSS {pss:.1f} MB/worker, total PSS {pss * workers:.1f} MB')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and inspect memory-mapped catalog snapshots')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='write a snapshot')
+    build.add_argument('--count', type=int, default=100_000)
+    build.add_argument('--seed', type=int, default=42,
+                       help='catalog seed; with --from, the one the fixture was generated with')
+    build.add_argument('--from', dest='source', help='build from a JSONL fixture instead of generating')
+    build.add_argument('-o', '--output', required=True)
+    rss = sub.add_parser('rss', help='compare per-worker memory of dicts and the mapped snapshot')
+    rss.add_argument('snapshot')
+    rss.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        if args.source:
+            ids, columns = jsonl_columns(args.source)
+        else:
+            ids, columns = generated_columns(args.count, args.seed)
+        write_snapshot(args.output, ids, columns, args.seed)
+        print(f'{args.output}: {len(ids)} products, {os.path.getsize(args.output) / 2 ** 20:.1f} MB')
+    else:
+        report_rss(args.snapshot, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""Run from day5/: python -m pytest tests
+after pip install -r requirements-test.txt (pytest, httpx for TestClient, and
+fakeredis for the memory:// Redis the tests use).
+
+The app's modules import each other by bare name, as they do inside the container,
+so put day5/ on the path. Redis and a snapshot file are opt-in; tests run without them.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('REDIS_URL', None)
+os.environ.pop('CATALOG_SNAPSHOT', None)
@@ -0,0 +1,52 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as flask_app
+import asgi
+import catalog
+
+
+@pytest.fixture(scope='module')
+def flask_client():
+    return flask_app.app.test_client()
+
+
+@pytest.fixture(scope='module')
+def asgi_client():
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize('query', ['offset=-1', 'count=abc', 'count=-5', 'count=100001'])
+def test_bad_paging_is_a_400_on_both_stacks(flask_client, asgi_client, query):
+    assert flask_client.get(f'/products/?{query}').status_code == 400
+    assert asgi_client.get(f'/products/?{query}').status_code == 400
+
+
+def test_stacks_serve_the_same_products(flask_client, asgi_client):
+    flask_body = flask_client.get('/products/?count=3&offset=10').get_json()
+    asgi_body = asgi_client.get('/products/?count=3&offset=10').json()
+    # Equal documents with the same key order; the encodings differ in whitespace
+    assert flask_body == asgi_body
+    assert [list(p) for p in flask_body] == [list(p) for p in asgi_body]
+    product = flask_body[1]
+    assert flask_client.get(f"/products/{product['id']}").get_json() == product
+
+
+@pytest.mark.parametrize('path, sample', [
+    ('/categories/', lambda: catalog.sample_categories(catalog.faker())[0]),
+    ('/users/current', lambda: catalog.sample_user(catalog.faker())),
+])
+def test_stacks_serve_categories_and_users_in_the_faker_shape(flask_client, asgi_client, path, sample):
+    def shape(value):
+        if isinstance(value, list):
+            return [shape(value[0])]
+        if isinstance(value, dict):
+            return {key: shape(item) for key, item in value.items()}
+        return type(value).__name__
+
+    expected = shape(sample())
+    for body in (flask_client.get(path).get_json(), asgi_client.get(path).json()):
+        body = body[0] if isinstance(body, list) else body
+        assert shape(body) == expected
+        assert list(body) == list(expected)
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+
+import fakeredis
+import pytest
+
+import cache
+import records
+from singleflight import SingleFlight
+
+
+def products():
+    return [records.Product('id-1', 'Lamp', 'A lamp', 9.99, 'Home & Kitchen', 'https://img/1', 4.5, 3,
+                            '2025-01-01T00:00:00')]
+
+
+def make_cache(redis):
+    # L1 off (size 0) so every lookup goes to Redis, as on a fresh replica
+    return cache.Cache('test', redis, l1_size=0)
+
+
+def test_l1_and_l2_hits_return_the_same_type():
+    redis = fakeredis.FakeRedis()
+    writer = cache.Cache('test', redis)
+    reader = make_cache(redis)
+    load = writer.cached('products', ttl=60, decode=records.Product.from_dicts)(products)
+    from_l2 = reader.cached('products', ttl=60, decode=records.Product.from_dicts)(products)
+    computed = load()
+    assert load() is computed  # L1
+    assert from_l2() == computed  # L2, decoded back into records
+    assert all(type(p) is records.Product for p in from_l2())
+
+
+def test_a_miss_is_computed_once_across_replicas():
+    redis = fakeredis.FakeRedis()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'value': 1}
+
+    replicas = [make_cache(redis) for _ in range(4)]
+    results = []
+    threads = [threading.Thread(target=lambda c=c: results.append(c.get_or_set('k', compute, 60)))
+               for c in replicas]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [{'value': 1}] * 4
+    assert len(calls) == 1
+
+
+def test_redis_failure_degrades_to_computing():
+    class Broken:
+        def __getattr__(self, name):
+            def fail(*args, **kwargs):
+                raise ConnectionError('down')
+            return fail
+
+    assert make_cache(Broken()).get_or_set('k', lambda: 42, 60) == 42
+
+
+def test_async_l2_hits_are_decoded():
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        writer, reader = cache.AsyncCache('test', redis), cache.AsyncCache('test', redis, l1_size=0)
+
+        async def load():
+            return products()
+
+        await writer.get_or_set('products', load, 60, records.Product.from_dicts)
+        return await reader.get_or_set('products', load, 60, records.Product.from_dicts)
+
+    assert asyncio.run(run()) == products()
+
+
+def test_lru_evicts_least_recently_used_and_expires():
+    lru = cache.LRU(2)
+    lru.set('a', 1, 60)
+    lru.set('b', 2, 60)
+    lru.get('a')
+    lru.set('c', 3, 60)
+    assert lru.get('b') is cache.MISSING and lru.get('a') == 1
+    lru.set('d', 4, -1)
+    assert lru.get('d') is cache.MISSING
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight('test', timeout=5)
+    calls, results = [], []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 'done'
+
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do('k', slow))) for _ in range(5)]
+    for t in followers:
+        t.start()
+    for t in [leader, *followers]:
+        t.join()
+    assert results == ['done'] * 6 and len(calls) == 1
+
+
+def test_single_flight_shares_the_exception():
+    flight = SingleFlight('test', timeout=5)
+    with pytest.raises(ZeroDivisionError):
+        flight.do('k', lambda: 1 / 0)
+    # A failure isn't cached: the next call runs again
+    assert flight.do('k', lambda: 'ok') == 'ok'
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_replicas_drop_their_l1_copy_when_another_writes_or_invalidates():
+    redis = fakeredis.FakeRedis()
+    replicas = [cache.Cache('test', redis), cache.Cache('test', redis)]
+    versions = iter(range(10))
+    compute = lambda: next(versions)  # noqa: E731
+    assert [c.get_or_set('k', compute, 60) for c in replicas] == [0, 0]
+    wait_for(lambda: all(c.listener is not None for c in replicas))
+    time.sleep(0.1)  # let both subscriptions land
+
+    replicas[0].invalidate('k')
+    wait_for(lambda: replicas[1].l1.get('test:k') is cache.MISSING)
+    # The next read recomputes, and that write evicts the first replica's copy
+    replicas[0].l1.set('test:k', 'stale', 60)
+    assert replicas[1].get_or_set('k', compute, 60) == 1
+    wait_for(lambda: replicas[0].l1.get('test:k') is cache.MISSING)
+    assert replicas[0].get_or_set('k', compute, 60) == 1
+    # A replica ignores its own messages
+    assert replicas[1].l1.get('test:k') == 1
+
+
+def test_async_replicas_drop_their_l1_copy_on_invalidate():
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        replicas = [cache.AsyncCache('test', redis), cache.AsyncCache('test', redis)]
+
+        async def compute():
+            return 'v1'
+
+        for c in replicas:
+            assert await c.get_or_set('k', compute, 60) == 'v1'
+        await asyncio.sleep(0.1)
+        await replicas[0].invalidate('k')
+        for _ in range(100):
+            if replicas[1].l1.get('test:k') is cache.MISSING:
+                break
+            await asyncio.sleep(0.01)
+        assert replicas[1].l1.get('test:k') is cache.MISSING
+        assert await redis.get('test:k') is None
+        for c in replicas:
+            await c.close()
+
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import catalog
+import formats
+
+
+def splitmix64(x):
+    mask = (1 << 64) - 1
+    z = (x + 0x9E3779B97F4A7C15) & mask
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+    return z ^ (z >> 31)
+
+
+def test_mix_matches_scalar_splitmix64():
+    keys = [0, 1, 2, 12345, (1 << 64) - 1]
+    assert catalog.mix(np.array(keys, dtype=np.uint64)).tolist() == [splitmix64(k) for k in keys]
+
+
+def test_products_are_a_function_of_seed_and_key():
+    assert catalog.generate_products(5, seed=7) == catalog.generate_products(5, seed=7)
+    assert catalog.generate_products(5, seed=7) != catalog.generate_products(5, seed=8)
+    # A page is the same products whatever page size it was cut from
+    assert catalog.generate_products(3, seed=7, offset=2) == catalog.generate_products(5, seed=7)[2:]
+
+
+def test_scramble_is_reversible():
+    keys = np.array([0, 1, 2, 1000, catalog.KEY_MASK], dtype=np.uint64)
+    assert [catalog.unscramble(int(x)) for x in catalog.scramble(keys)] == keys.tolist()
+    assert len(set(catalog.scramble(np.arange(10_000, dtype=np.uint64)).tolist())) == 10_000
+
+
+def test_product_ids_lead_back_to_the_listed_product():
+    listed = catalog.generate_products(20, seed=42, offset=500)
+    for product in listed[::7]:
+        assert catalog.product_for_id(product['id'], 42) == product
+
+
+def test_unknown_ids_hash_to_a_stable_product():
+    assert catalog.product_for_id('not-a-uuid', 42) == catalog.product_for_id('not-a-uuid', 42)
+    assert catalog.product_detail('not-a-uuid', 42)['reviews'] == catalog.product_detail('not-a-uuid', 42)['reviews']
+
+
+def test_reviews_count_between_three_and_ten():
+    for key in range(50):
+        assert 3 <= len(catalog.generate_reviews(key, 42)) <= 10
+
+
+def test_lists_match_rows():
+    rows = catalog.generate_products(4, seed=3, offset=9)
+    lists = catalog.generate_product_lists(4, seed=3, offset=9, fields=['id', 'price'])
+    assert lists == {'id': [r['id'] for r in rows], 'price': [r['price'] for r in rows]}
+
+
+@pytest.mark.parametrize('count, offset', [(-1, 0), (1, -1), (2, (1 << catalog.KEY_BITS) - 1)])
+def test_keys_outside_the_key_space_are_rejected(count, offset):
+    with pytest.raises(ValueError):
+        catalog.generate_products(count, offset=offset)
+
+
+def test_parse_page():
+    assert formats.parse_page(None, None) == (10, 0)
+    assert formats.parse_page('25', '100') == (25, 100)
+    for count, offset in [('abc', None), (None, '-1'), ('²', None), ('1.5', None),
+                          (str(formats.MAX_COUNT + 1), None)]:
+        with pytest.raises(formats.FormatError):
+            formats.parse_page(count, offset)
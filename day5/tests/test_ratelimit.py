@@ -0,0 +1,130 @@
+import random
+import threading
+
+import fakeredis
+import pytest
+
+import ratelimit
+
+
+def test_parse_rules_orders_longest_prefix_first():
+    rules = ratelimit.parse_rules('/=100/m;/products/=20/s:40')
+    assert [(r.prefix, r.count, r.period, r.burst) for r in rules] == [('/products/', 20, 1, 40), ('/', 100, 60, 100)]
+    assert ratelimit.match(rules, '/products/abc').prefix == '/products/'
+    assert ratelimit.match(rules, '/health').prefix == '/'
+
+
+def test_client_key_ignores_forwarded_for_unless_trusted(monkeypatch):
+    assert ratelimit.client_key('10.0.0.1', '1.2.3.4, 5.6.7.8') == '10.0.0.1'
+    monkeypatch.setattr(ratelimit, 'TRUST_FORWARDED_FOR', True)
+    # Only the hop our proxy appended counts
+    assert ratelimit.client_key('10.0.0.1', '1.2.3.4, 5.6.7.8') == '5.6.7.8'
+
+
+def test_token_bucket_allows_the_burst_then_the_rate(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    rule = ratelimit.Rule('/p', 2, 1, burst=4)
+    buckets = ratelimit.TokenBuckets()
+    assert [buckets.hit('k', rule) for _ in range(4)] == [0, 0, 0, 0]
+    assert buckets.hit('k', rule) == pytest.approx(0.5)
+    now[0] += 0.5
+    assert buckets.hit('k', rule) == 0
+    # Other clients have their own bucket
+    assert buckets.hit('other', rule) == 0
+
+
+def test_redis_windows_are_shared_and_fail_open(monkeypatch):
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: 6000.0)
+    redis = fakeredis.FakeRedis()
+    rule = ratelimit.Rule('/p', 3, 60)
+    replicas = [ratelimit.RedisWindows(redis) for _ in range(3)]
+    assert [replica.hit('k', rule) for replica in replicas] == [0, 0, 0]
+    assert replicas[0].hit('k', rule) == 60
+
+    class Down:
+        def pipeline(self):
+            raise ConnectionError('down')
+
+    assert ratelimit.RedisWindows(Down()).hit('k', rule) == 0
+
+
+def run(limiter, requests, latency, ok=lambda i: True):
+    for i in range(requests):
+        assert limiter.acquire()
+        limiter.release('/products/', latency(i), ok(i))
+
+
+def test_mixed_cost_route_does_not_collapse_the_limit():
+    limiter = ratelimit.ConcurrencyLimiter(limit=20, min_limit=2, max_limit=200, tolerance=2)
+    rng = random.Random(1)
+    # ?count=1 and ?count=1000 on the same route template, in random order
+    run(limiter, 5000, lambda i: rng.choice((0.001, 0.05)))
+    assert limiter.limit > 20
+
+
+def test_rising_latency_shrinks_the_limit_once_per_window():
+    limiter = ratelimit.ConcurrencyLimiter(limit=50, min_limit=2, max_limit=200, tolerance=2)
+    run(limiter, 500, lambda i: 0.01)
+    before = limiter.limit
+    run(limiter, 40, lambda i: 0.1)
+    assert limiter.limit < before
+    # Not 10% per slow response: at most one cut per limit's worth of responses
+    assert limiter.limit >= before * 0.9 ** 2
+
+
+def test_failures_shrink_the_limit_down_to_the_minimum():
+    limiter = ratelimit.ConcurrencyLimiter(limit=20, min_limit=4, max_limit=200, tolerance=2)
+    run(limiter, 2000, lambda i: 0.01, ok=lambda i: False)
+    assert limiter.limit == 4
+
+
+def test_requests_over_the_limit_are_rejected():
+    limiter = ratelimit.ConcurrencyLimiter(limit=2, min_limit=1, max_limit=10)
+    assert limiter.acquire() and limiter.acquire()
+    assert not limiter.acquire()
+    limiter.release('/', 0.01, True)
+    assert limiter.acquire()
+
+
+def test_token_buckets_evict_the_least_recently_used(monkeypatch):
+    rule = ratelimit.Rule('/p', 1, 60, burst=1)
+    buckets = ratelimit.TokenBuckets(max_buckets=2)
+    assert buckets.hit('a', rule) == 0
+    assert buckets.hit('b', rule) == 0
+    assert buckets.hit('a', rule) > 0  # a is now the most recent
+    assert buckets.hit('c', rule) == 0
+    assert list(buckets.buckets) == ['a', 'c']
+    # a kept its empty bucket; b was evicted
+    assert buckets.hit('a', rule) > 0
+
+
+def test_flask_limit_stays_below_the_worker_threads(monkeypatch):
+    from flask import Flask
+
+    monkeypatch.setattr(ratelimit, 'WEB_THREADS', 4)
+    monkeypatch.setattr(ratelimit, 'CONCURRENCY_LIMIT', 20)
+    app = Flask(__name__)
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    @app.route('/slow')
+    def slow():
+        started.release()
+        release.wait(5)
+        return 'ok'
+
+    ratelimit.init_flask(app, {})
+    client = app.test_client()
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(client.get('/slow').status_code)) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for _ in threads:
+        assert started.acquire(timeout=5)
+    # Three of the four threads are busy: the fourth turns the next request away
+    assert client.get('/slow').status_code == 503
+    release.set()
+    for t in threads:
+        t.join()
+    assert statuses == [200] * 3
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+import catalog
+import records
+
+
+def test_records_serialize_to_the_dict_shape():
+    as_dicts = catalog.generate_products(5, seed=42)
+    as_records = catalog.generate_products(5, seed=42, record=records.Product)
+    assert json.loads(json.dumps(as_records, default=records.to_json)) == as_dicts
+    assert records.Product.from_dicts(as_dicts) == as_records
+
+
+def test_product_detail_round_trips_with_reviews():
+    detail = catalog.product_detail('some-id', 42)
+    product = records.Product.from_dict(detail)
+    assert all(type(review) is records.Review for review in product.reviews)
+    assert product.to_dict() == detail
+
+
+def test_records_do_not_import_the_cache_layer():
+    loaded = subprocess.run([sys.executable, '-c', 'import sys, records; print("cache" in sys.modules)'],
+                            capture_output=True, text=True, check=True, cwd=os.path.dirname(records.__file__))
+    assert loaded.stdout.strip() == 'False'
+
+
+def test_categories_and_users_round_trip():
+    fake = catalog.faker()
+    categories = catalog.sample_categories(fake)
+    assert [c.to_dict() for c in records.Category.from_dicts(categories)] == categories
+    user = catalog.sample_user(fake)
+    record = records.User.from_dict(user)
+    assert type(record.address) is records.Address
+    assert all(type(order) is records.Order for order in record.orders)
+    assert json.loads(json.dumps(record, default=records.to_json)) == user
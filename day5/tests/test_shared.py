@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'bench')
+
+
+@pytest.mark.skipif(not os.path.isdir(BENCH), reason='needs the whole repository, not just day5/')
+def test_shared_modules_are_identical_across_apps():
+    sys.path.insert(0, BENCH)
+    try:
+        import sync_shared
+    finally:
+        sys.path.remove(BENCH)
+    assert sync_shared.drifted() == {}, 'run python bench/sync_shared.py --from <the app you edited>'
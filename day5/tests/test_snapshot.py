@@ -0,0 +1,91 @@
+import json
+import uuid
+
+import numpy as np
+import pytest
+
+import catalog
+import snapshot
+
+
+@pytest.fixture(scope='module')
+def snap(tmp_path_factory):
+    path = tmp_path_factory.mktemp('snapshot') / 'catalog.snap'
+    ids, columns = snapshot.generated_columns(2000, seed=42)
+    snapshot.write_snapshot(str(path), ids, columns, seed=42)
+    return snapshot.Snapshot(str(path))
+
+
+def test_snapshot_pages_match_the_generated_catalog(snap):
+    assert len(snap) == 2000
+    assert snap.products(10, 995) == catalog.generate_products(10, seed=42, offset=995)
+    # A page running past the end is cut short rather than failing
+    assert len(snap.products(10, 1995)) == 5
+    assert snap.products(10, 5000) == []
+
+
+def test_product_lists_decode_only_the_given_fields(snap):
+    fields = ['id', 'name', 'price']
+    lists = snap.product_lists(3, 10, fields)
+    rows = catalog.generate_products(3, seed=42, offset=10)
+    assert lists == {name: [row[name] for row in rows] for name in fields}
+
+
+def test_every_id_is_found_through_the_index(snap):
+    for row, product in enumerate(snap.products(2000)):
+        assert snap.find(product['id']) == row
+
+
+@pytest.mark.parametrize('product_id', [str(uuid.UUID(int=0)), str(uuid.uuid4()), 'not-a-uuid'])
+def test_unknown_ids_are_not_found(snap, product_id):
+    assert snap.find(product_id) is None
+    assert snap.product_detail(product_id) is None
+
+
+def test_index_places_colliding_ids_in_later_slots():
+    # Equal hashes all land on one slot; linear probing must keep every row reachable
+    ids = np.array([[1, 1], [2, 2], [3, 3], [4, 4]], dtype=np.uint64)
+    table = snapshot.build_index(ids)
+    assert sorted(int(entry) for entry in table if entry) == [1, 2, 3, 4]
+    assert (table != 0).sum() == len(ids)
+
+
+def test_detail_matches_the_generated_catalog(snap):
+    product = snap.products(1, 7)[0]
+    detail = snap.product_detail(product['id'])
+    assert {key: detail[key] for key in product} == product
+    assert 3 <= len(detail['reviews']) <= 10
+    assert detail == catalog.product_detail(product['id'], seed=42)
+
+
+def test_jsonl_fixtures_round_trip(tmp_path):
+    # Rows from the middle of the catalog, so row numbers aren't the products' keys
+    rows = catalog.generate_products(50, seed=3, offset=1000)
+    source = tmp_path / 'products.jsonl'
+    source.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    ids, columns = snapshot.jsonl_columns(str(source))
+    snapshot.write_snapshot(str(tmp_path / 'fixture.snap'), ids, columns, seed=3)
+    fixture = snapshot.Snapshot(str(tmp_path / 'fixture.snap'))
+    assert fixture.products(50) == rows
+    assert fixture.product_detail(rows[9]['id']) == catalog.product_detail(rows[9]['id'], seed=3)
+
+
+def test_the_snapshot_seed_must_match_the_catalog_seed(tmp_path, monkeypatch):
+    monkeypatch.setenv('CATALOG_SNAPSHOT', str(tmp_path / 'catalog.snap'))
+    ids, columns = snapshot.generated_columns(10, seed=42)
+    snapshot.write_snapshot(str(tmp_path / 'catalog.snap'), ids, columns, seed=42)
+    assert snapshot.open_from_env(42).seed == 42
+    with pytest.raises(ValueError):
+        snapshot.open_from_env(7)
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'x' * 64)
+    with pytest.raises(ValueError):
+        snapshot.Snapshot(str(path))
+    # Snapshots written before the header recorded the seed
+    ids, columns = snapshot.generated_columns(10, seed=42)
+    snapshot.write_snapshot(str(path), ids, columns, seed=None)
+    with pytest.raises(ValueError):
+        snapshot.Snapshot(str(path))
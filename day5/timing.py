@@ -0,0 +1,192 @@
+# Copied into every app that uses it; after editing, run: python bench/sync_shared.py --from <this app>
+"""Per-request phase timing: Server-Timing headers and JSON access log lines.
+
+Code marks phases with `with timing.phase("db"):`; phases nest, and each one is
+charged only its own time (a "marshal" phase wrapping a "generate" phase reports
+marshal time without the generation inside it). Whatever isn't covered by a phase
+shows up as "app". Engines, Jinja2Templates and FastAPI JSON responses can be
+instrumented once at startup instead of at every call site.
+
+    SERVER_TIMING=0   turn instrumentation off entirely
+    TIMING_LOG=0      keep the header but skip the access log line
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import wraps
+
+ENABLED = os.environ.get("SERVER_TIMING", "1") != "0"
+LOG_ENABLED = os.environ.get("TIMING_LOG", "1") != "0"
+
+current_timer = ContextVar("current_timer", default=None)
+
+access_log = logging.getLogger("access")
+if not access_log.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    access_log.addHandler(handler)
+    access_log.setLevel(logging.INFO)
+    access_log.propagate = False
+
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counts = {}
+        self.stack = []
+
+    def enter(self):
+        self.stack.append([time.perf_counter(), 0.0])
+
+    def exit(self, name):
+        started, children = self.stack.pop()
+        elapsed = time.perf_counter() - started
+        self.add(name, elapsed - children)
+        if self.stack:
+            self.stack[-1][1] += elapsed
+
+    def add(self, name, seconds, count=1):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def breakdown(self):
+        total = self.total()
+        phases = {name: round(s * 1000, 3) for name, s in self.phases.items()}
+        phases["app"] = round(max(0.0, total - sum(self.phases.values())) * 1000, 3)
+        return phases, round(total * 1000, 3)
+
+    def header(self):
+        phases, total = self.breakdown()
+        parts = [f"{name};dur={ms}" for name, ms in phases.items()]
+        return ", ".join(parts + [f"total;dur={total}"])
+
+
+@contextmanager
+def phase(name):
+    timer = current_timer.get()
+    if timer is None:
+        yield
+        return
+    timer.enter()
+    try:
+        yield
+    finally:
+        timer.exit(name)
+
+
+def timed(name):
+    """Decorator form of phase()"""
+    def decorator(func):
+        # wraps() also carries over attributes such as flask-restx's __apidoc__
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def log_request(timer, method, path, status, client):
+    if not LOG_ENABLED:
+        return
+    phases, total = timer.breakdown()
+    access_log.info(json.dumps({
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "method": method,
+        "path": path,
+        "status": status,
+        "client": client,
+        "duration_ms": total,
+        "phases_ms": phases,
+        "counts": timer.counts,
+    }))
+
+
+def instrument_engine(engine, name="db"):
+    """Charge SQL execution time on a SQLAlchemy engine to the current request"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's own context: a statement that raises never reaches
+        # after_cursor_execute, and must not leave a start time for the next one to pick up
+        context._timing_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = context._timing_started
+        timer = current_timer.get()
+        if timer is not None:
+            elapsed = time.perf_counter() - started
+            timer.add(name, elapsed)
+            if timer.stack:
+                timer.stack[-1][1] += elapsed
+
+
+def instrument_templates(templates, name="render"):
+    """Time Jinja rendering done by a Jinja2Templates instance"""
+    render = templates.TemplateResponse
+
+    def template_response(*args, **kwargs):
+        with phase(name):
+            return render(*args, **kwargs)
+
+    templates.TemplateResponse = template_response
+
+
+def init_flask(app, api=None):
+    """Time Flask requests; pass the flask-restx Api to time JSON serialization"""
+    if not ENABLED:
+        return
+    from flask import request
+
+    if api is not None:
+        for mediatype, represent in list(api.representations.items()):
+            api.representations[mediatype] = timed("serialize")(represent)
+
+    @app.before_request
+    def start_timer():
+        current_timer.set(RequestTimer())
+
+    @app.after_request
+    def finish_timer(response):
+        timer = current_timer.get()
+        if timer is not None:
+            response.headers["Server-Timing"] = timer.header()
+            log_request(timer, request.method, request.path, response.status_code, request.remote_addr)
+            current_timer.set(None)
+        return response
+
+
+def init_fastapi(app):
+    if not ENABLED:
+        return
+    from fastapi.responses import JSONResponse
+
+    class TimedJSONResponse(JSONResponse):
+        def render(self, content):
+            with phase("serialize"):
+                return super().render(content)
+
+    app.router.default_response_class = TimedJSONResponse
+
+    @app.middleware("http")
+    async def time_request(request, call_next):
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        try:
+            response = await call_next(request)
+        finally:
+            current_timer.reset(token)
+        response.headers["Server-Timing"] = timer.header()
+        client = request.client.host if request.client else None
+        log_request(timer, request.method, request.url.path, response.status_code, client)
+        return response